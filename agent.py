@@ -1,37 +1,177 @@
-from langfuse.langchain import CallbackHandler
-import google.generativeai as genai
-from google.generativeai.types import HarmCategory, HarmBlockThreshold
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_community.vectorstores import FAISS
-from langfuse import observe
+import asyncio
+import contextvars
+import functools
+import hashlib
+import os
+import threading
+import time
+import cache
 import config
+import metrics
 import tools
 import prompts
+import router
+import utils
+from metrics import observe
 
-# Configure Gemini once
-genai.configure(api_key=config.GOOGLE_API_KEY)
+# ==========================================
+# MODEL BACKEND (Imported on first use)
+# ==========================================
+# The Gemini SDK takes about a second to import; loading it with the first model call keeps it
+# (and Langfuse, FAISS, LangChain) off the path to the first rendered page.
+_genai = None
+_genai_lock = threading.Lock()
 
-# Define Safety Settings Globaly
+
+def _gemini():
+    """The google.generativeai module, imported and configured once."""
+    global _genai
+    if _genai is None:
+        with _genai_lock:
+            if _genai is None:
+                import google.generativeai as genai
+                genai.configure(api_key=config.GOOGLE_API_KEY)
+                _genai = genai
+    return _genai
+
+
+def GenerativeModel(*args, **kwargs):
+    """A model of the configured backend: the Gemini SDK, or deterministic offline stand-ins (see stubs.py)."""
+    if config.MODEL_BACKEND == "stub":
+        import stubs
+        return stubs.StubGenerativeModel(*args, **kwargs)
+    return _gemini().GenerativeModel(*args, **kwargs)
+
+
+# Define Safety Settings Globaly (by name, so the SDK's enums need not be imported up front)
 SAFETY_SETTINGS = {
-    HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
-    HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
-    HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
-    HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
+    "HARM_CATEGORY_HATE_SPEECH": "BLOCK_NONE",
+    "HARM_CATEGORY_HARASSMENT": "BLOCK_NONE",
+    "HARM_CATEGORY_SEXUALLY_EXPLICIT": "BLOCK_NONE",
+    "HARM_CATEGORY_DANGEROUS_CONTENT": "BLOCK_NONE",
 }
 
-@observe()
-def get_coach_response(user_input, chat_history, user_profile):
+# ==========================================
+# ASYNC RUNTIME (Concurrency limit, deadlines, cancellation)
+# ==========================================
+# All async model calls run on one process-wide event loop (its own daemon thread), so the
+# concurrency limit covers every caller: Streamlit threads, the sync wrappers and other loops.
+_agent_loop = None
+_agent_semaphore = None
+_agent_loop_lock = threading.Lock()
+
+
+def _get_agent_loop():
+    """Returns the agent event loop, starting it on first use."""
+    global _agent_loop, _agent_semaphore
+    if _agent_loop is None:
+        with _agent_loop_lock:
+            if _agent_loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="agent-loop", daemon=True).start()
+                _agent_semaphore = asyncio.Semaphore(config.AGENT_MAX_CONCURRENCY)
+                _agent_loop = loop
+    return _agent_loop
+
+
+async def _limited(coro, timeout):
+    """Runs `coro` on the agent loop under the semaphore; the deadline includes time spent queueing."""
+    async def guarded():
+        async with _agent_semaphore:
+            return await coro
+
+    loop = _get_agent_loop()
+    timeout = config.AGENT_TIMEOUT_SECONDS if timeout is None else timeout
+    if asyncio.get_running_loop() is loop:
+        try:
+            return await asyncio.wait_for(guarded(), timeout)
+        except asyncio.TimeoutError:
+            metrics.increment("agent_timeouts")
+            raise
+    # Called from another loop: cancelling the caller (e.g. a client disconnect) cancels the call here too
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(_limited(coro, timeout), loop))
+
+
+def _run_sync(coro):
+    """Blocking bridge used by the sync API: runs `coro` on the agent loop and waits for the result."""
+    future = asyncio.run_coroutine_threadsafe(coro, _get_agent_loop())
+    try:
+        return future.result()
+    except BaseException:
+        # The caller went away (rerun, shutdown, ...): don't leave the model call running
+        future.cancel()
+        raise
+
+
+async def astream(chunks, timeout=None):
     """
-    Handles the Coach Logic.
-    Args:
-        user_input (str): The user's message.
-        chat_history (list): List of previous messages in Gemini format.
-        user_profile (dict): Dictionary containing age, weight, height, goal, gender.
+    Async iterator over a sync chunk generator (stream_*_response) under the same concurrency
+    limit and deadline as the async API. Closing it early (e.g. on a client disconnect) stops
+    the generator and frees its slot.
+    """
+    caller_loop = asyncio.get_running_loop()
+    received = asyncio.Queue()
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for chunk in chunks:
+                if stop.is_set():
+                    break
+                caller_loop.call_soon_threadsafe(received.put_nowait, chunk)
+        finally:
+            chunks.close()
+
+    async def pump():
+        try:
+            # The copied context keeps the generator's spans inside the caller's trace
+            await asyncio.get_running_loop().run_in_executor(None, contextvars.copy_context().run, produce)
+        finally:
+            stop.set()
+
+    done = object()
+    task = asyncio.ensure_future(_limited(pump(), timeout))
+    task.add_done_callback(lambda _: received.put_nowait(done))
+    try:
+        while True:
+            chunk = await received.get()
+            if chunk is done:
+                task.result()  # Raises the deadline (asyncio.TimeoutError) or the generator's error
+                return
+            yield chunk
+    finally:
+        task.cancel()
+
+
+@metrics.span("coach_prompt_assembly")
+def _start_coach_chat(chat_history, user_profile, automatic_function_calling=True, model_name=config.MODEL_NAME):
+    """
+    Builds the Coach model (profile injected into the prompt) and opens a chat session.
+    Returns (chat, tools) so streaming callers can execute function calls themselves.
+    model_name: the model picked by router.route (defaults to config.MODEL_NAME).
     """
     # 1. Setup Tools
     # Note: Removed YouTube tool as per your request to focus on text
     my_tools = [tools.calculate_bmr, tools.calculate_macros]
 
+    # Precomputed mode: run the deterministic tools locally and hand the model the results,
+    # so a plan takes one model call instead of extra function-calling round trips
+    precomputed_numbers = ""
+    if config.COACH_PRECOMPUTE_TOOLS:
+        numbers = tools.precompute_profile_numbers(
+            float(user_profile['weight']), float(user_profile['height']), int(user_profile['age']),
+            user_profile['gender'], user_profile['goal'], config.DEFAULT_ACTIVITY_LEVEL
+        )
+        # Unknown levels fall back to "moderate", as in tools.calculate_tdee
+        multiplier = tools.ACTIVITY_MULTIPLIERS.get(numbers["activity_level"], tools.ACTIVITY_MULTIPLIERS["moderate"])
+        precomputed_numbers = prompts.PRECOMPUTED_NUMBERS_PROMPT.format(
+            bmr=numbers["bmr"], tdee=numbers["tdee"], activity_level=numbers["activity_level"],
+            multiplier=multiplier, **numbers["macros"]
+        )
+        # Without the numbers the model calls each tool once, a round trip per call
+        metrics.increment("coach_function_call_round_trips_avoided", len(my_tools))
+        my_tools = []
+
     # 2. Inject Profile Data into Prompt
     dynamic_instruction = prompts.COACH_SYSTEM_PROMPT + f"""
     
@@ -41,51 +181,254 @@ def get_coach_response(user_input, chat_history, user_profile):
     - Height: {user_profile['height']}cm
     - Gender: {user_profile['gender']}
     - Goal: {user_profile['goal']}
-    
+    {precomputed_numbers}
     INSTRUCTION: Focus purely on writing the detailed text plan. Do not search for videos.
     """
 
     # 3. Initialize Model
-    model = genai.GenerativeModel(
-        model_name=config.MODEL_NAME, 
+    model = GenerativeModel(
+        model_name=model_name, 
         system_instruction=dynamic_instruction,
-        tools=my_tools 
+        tools=my_tools or None
     )
 
     # 4. Start Chat
-    chat = model.start_chat(history=chat_history, enable_automatic_function_calling=True)
-    
-    # 5. Send Message
-    response = chat.send_message(user_input, safety_settings=SAFETY_SETTINGS)
-    return response.text
+    chat = model.start_chat(history=chat_history, enable_automatic_function_calling=automatic_function_calling)
+    return chat, my_tools
 
 
-def get_vector_store():
-    embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-    # Allow dangerous deserialization is required for local files created by us
-    return FAISS.load_local("faiss_index", embeddings, allow_dangerous_deserialization=True)
+def _stream_reply(chat, user_input, metric_prefix, model_name, my_tools=()):
+    """
+    Sends a message with stream=True and yields text chunks as they arrive.
+    The SDK cannot combine streaming with automatic function calling, so any
+    function calls are executed here and their results streamed back to the model.
+    Records time-to-first-token as `<metric_prefix>_ttft_seconds`; each round is a
+    `<metric_prefix>_model` generation with its token usage.
+    """
+    tools_by_name = {fn.__name__: fn for fn in my_tools}
+    start = time.perf_counter()
+    first_token = True
+    content = user_input
+
+    while True:
+        function_calls = []
+        with metrics.span(f"{metric_prefix}_model", as_type="generation", model=model_name) as generation:
+            response = chat.send_message(content, safety_settings=SAFETY_SETTINGS, stream=True)
+            usage_metadata = None
+            for chunk in response:
+                # Every chunk reports the usage so far; the last one covers the whole turn
+                usage_metadata = getattr(chunk, "usage_metadata", None) or usage_metadata
+                for part in chunk.parts:
+                    if "function_call" in part:
+                        function_calls.append(part.function_call)
+                    elif part.text:
+                        if first_token:
+                            metrics.record(f"{metric_prefix}_ttft_seconds", time.perf_counter() - start)
+                            first_token = False
+                        yield part.text
+            metrics.record_usage(metric_prefix, usage_metadata, generation)
+
+        if not function_calls:
+            break
+        metrics.increment(f"{metric_prefix}_function_call_round_trips")
+
+        # Run the requested tools locally and send the results back in the next turn
+        content = []
+        for call in function_calls:
+            result = tools_by_name[call.name](**dict(call.args))
+            if not isinstance(result, dict):
+                result = {"result": result}
+            protos = _gemini().protos
+            content.append(protos.Part(
+                function_response=protos.FunctionResponse(name=call.name, response=result)
+            ))
+
+    metrics.record(f"{metric_prefix}_response_seconds", time.perf_counter() - start)
+
+
+def _count_round_trips(chat):
+    # Every model turn that asked for a function cost one extra round trip
+    round_trips = sum(
+        1 for content in chat.history
+        if content.role == "model" and any("function_call" in part for part in content.parts)
+    )
+    if round_trips:
+        metrics.increment("coach_function_call_round_trips", round_trips)
+
 
 @observe()
-def get_general_response(user_input, chat_history):
+async def aget_coach_response(user_input, chat_history, user_profile, timeout=None):
     """
-    Handles the General Fitness Chat Logic with RAG (Scientific Search).
+    Async variant of get_coach_response (same arguments).
+    timeout (float): Deadline in seconds, defaults to config.AGENT_TIMEOUT_SECONDS.
     """
-    context_text = ""
-    
-    # 1. Search the Vector Database
+    async def call(model_name):
+        chat, _ = _start_coach_chat(chat_history, user_profile, model_name=model_name)
+
+        # 5. Send Message
+        with metrics.span("coach_model", as_type="generation", model=model_name) as generation:
+            response = await chat.send_message_async(user_input, safety_settings=SAFETY_SETTINGS)
+            metrics.record_usage("coach", response.usage_metadata, generation)
+        _count_round_trips(chat)
+        return response.text
+
+    # Cheap turns go to the fast model; a slow model gets a hedged request (see router.py)
+    decision = router.route(user_input, "coach")
+    return await _limited(router.ahedged(decision, call), timeout)
+
+
+def get_coach_response(user_input, chat_history, user_profile):
+    """
+    Handles the Coach Logic.
+    Args:
+        user_input (str): The user's message.
+        chat_history (list): List of previous messages in Gemini format.
+        user_profile (dict): Dictionary containing age, weight, height, goal, gender.
+    """
+    return _run_sync(aget_coach_response(user_input, chat_history, user_profile))
+
+
+@observe()
+def stream_coach_response(user_input, chat_history, user_profile):
+    """
+    Streaming variant of get_coach_response: yields the reply in text chunks as they arrive.
+    Same arguments as get_coach_response.
+    """
+    def start(model_name):
+        chat, my_tools = _start_coach_chat(chat_history, user_profile, automatic_function_calling=False,
+                                           model_name=model_name)
+        return _stream_reply(chat, user_input, "coach", model_name, my_tools)
+
+    yield from router.hedged_stream(router.route(user_input, "coach", kind="stream"), start)
+
+
+# Process-wide vector store cache (shared by every Streamlit session in this process)
+_embeddings = None
+_vector_store = None
+_vector_store_version = None
+_retriever = None
+_vector_store_lock = threading.Lock()
+
+
+def get_index_version():
+    """
+    Returns a token identifying the FAISS index currently on disk.
+    ingest.py writes a VERSION file after every save; older indexes fall back to file mtimes.
+    Raises OSError if no index exists yet.
+    """
+    version_path = os.path.join(config.FAISS_INDEX_DIR, config.INDEX_VERSION_FILE)
+    try:
+        with open(version_path, "r") as f:
+            return f.read().strip()
+    except OSError:
+        pass
+
+    import vectorstore
+    stamps = []
+    docstore_file = (vectorstore.CHUNK_OFFSETS_FILE if vectorstore.has_chunk_store(config.FAISS_INDEX_DIR)
+                     else vectorstore.LEGACY_DOCSTORE_FILE)
+    for name in (vectorstore.INDEX_FILE, docstore_file):
+        stat = os.stat(os.path.join(config.FAISS_INDEX_DIR, name))
+        stamps.append(f"{stat.st_mtime_ns}-{stat.st_size}")
+    return ":".join(stamps)
+
+
+def get_vector_store():
+    """
+    Returns the shared FAISS store.
+    The index is loaded once per process and only reloaded when ingest.py writes a new version.
+    """
+    global _embeddings, _vector_store, _vector_store_version, _retriever
+
+    version = get_index_version()
+    if _vector_store is not None and version == _vector_store_version:
+        return _vector_store
+
+    with _vector_store_lock:
+        # Another session may have reloaded while we waited for the lock
+        if _vector_store is None or version != _vector_store_version:
+            # FAISS and LangChain load here, not when the app starts
+            import embedding_cache
+            import retrieval
+            import vectorstore
+            if _embeddings is None:
+                # Cached: repeat questions reuse their query vector instead of calling the API
+                _embeddings = embedding_cache.create_embeddings(config.EMBEDDING_MODEL)
+            with metrics.span("vector_store_load"):
+                vector_store = vectorstore.load(config.FAISS_INDEX_DIR, _embeddings, mmap_index=config.FAISS_MMAP)
+                keyword_index = retrieval.load_keyword_index(config.FAISS_INDEX_DIR, vector_store)
+            _retriever = retrieval.HybridRetriever(vector_store, keyword_index)
+            _vector_store = vector_store
+            _vector_store_version = version
+            print(f"🔄 Loaded vector store (version {version}).")
+        return _vector_store
+
+
+def get_retriever():
+    """Returns the hybrid (BM25 + FAISS) retriever over the current vector store."""
+    get_vector_store()
+    return _retriever
+
+
+_warm_up_thread = None
+_warm_up_lock = threading.Lock()
+
+
+def _warm_up():
     try:
-        vector_db = get_vector_store()
-        # Search for the 3 most relevant chunks
-        results = vector_db.similarity_search(user_input, k=3)
+        with metrics.span("warm_up"):
+            get_vector_store()
+            if config.MODEL_BACKEND != "stub":
+                _gemini()
+            import langfuse  # Loaded here, the first @observe call then finds it imported
+    except Exception as e:
+        print(f"⚠️ Warm-up skipped: {e}")
+
+
+def warm_up_in_background():
+    """
+    Loads the vector store, the Gemini SDK and Langfuse on a daemon thread (once per process),
+    so the first question does not pay for them. The app calls this after its first page is rendered.
+    """
+    global _warm_up_thread
+    with _warm_up_lock:
+        if _warm_up_thread is None:
+            _warm_up_thread = threading.Thread(target=_warm_up, name="agent-warm-up", daemon=True)
+            _warm_up_thread.start()
+    return _warm_up_thread
+
+# Near-duplicate questions with the same retrieved context reuse the previous answer
+semantic_cache = cache.SemanticCache()
+
+
+def _retrieve_context(user_input):
+    """
+    Searches the knowledge base for the question (BM25 keywords fused with FAISS vectors).
+    Returns (context_text, query_vector, context_key); query_vector is None when only keyword
+    results were available, and both are None when search failed.
+    """
+    # 1. Search the Knowledge Base
+    try:
+        # Embed once: the vector drives both the FAISS search and the semantic cache
+        results, query_vector = get_retriever().search(user_input)
         
-        # Combine them into a single string
-        context_text = "\n\n".join([doc.page_content for doc in results])
-        print(f"✅ Found {len(results)} relevant scientific chunks.") # For debugging
+        # Combine them into a single string (each passage under its source label)
+        import retrieval
+        context_text = retrieval.format_context(results)
+        context_key = hashlib.sha256(context_text.encode("utf-8")).hexdigest()
+        if not results:
+            return "No specific scientific context available.", None, None
+        return context_text, query_vector, context_key
     except Exception as e:
         print(f"⚠️ Vector Search skipped: {e}")
+        metrics.increment("retrieval_errors")
         # Use fallback if DB isn't ready
-        context_text = "No specific scientific context available."
+        return "No specific scientific context available.", None, None
+
 
+@metrics.span("general_prompt_assembly")
+def _start_rag_chat(context_text, chat_history, model_name=config.RAG_MODEL_NAME):
+    """Opens a RAG chat session (on the routed model) with the retrieved context in the system instruction."""
     # 2. Construct the RAG Prompt
     # We combine the System Instructions + The Found Context
     rag_instruction = prompts.RAG_SYSTEM_PROMPT + f"""
@@ -94,28 +437,122 @@ def get_general_response(user_input, chat_history):
     {context_text}
     """
 
-    model = genai.GenerativeModel(
-        model_name="gemini-2.5-pro",
+    model = GenerativeModel(
+        model_name=model_name,
         system_instruction=rag_instruction
     )
-    
-    # 3. Generate Answer
-    chat = model.start_chat(history=chat_history)
-    response = chat.send_message(user_input, safety_settings=SAFETY_SETTINGS)
-    return response.text
+    return model.start_chat(history=chat_history)
+
+
+# The cache is process-wide and keyed by question and context only, so it serves first turns
+# alone: a follow-up ("what about for me?") depends on that user's conversation
+def _is_first_turn(user_input, chat_history):
+    """
+    True when the history holds no earlier user turn. Model-only messages (the app's seeded
+    greeting) don't count, nor does the current prompt, which the app's history already ends with.
+    """
+    user_turns = [message for message in chat_history if message["role"] == "user"]
+    if user_turns and user_turns[-1] is chat_history[-1] and user_turns[-1]["parts"] == [user_input]:
+        user_turns.pop()
+    return not user_turns
+
+
+def _cached_answer(query_vector, context_key, user_input, chat_history):
+    if query_vector is None or not _is_first_turn(user_input, chat_history):
+        return None
+    return semantic_cache.get(query_vector, context_key, _vector_store_version)
+
+
+def _cache_answer(query_vector, context_key, user_input, chat_history, answer):
+    if query_vector is not None and answer and _is_first_turn(user_input, chat_history):
+        semantic_cache.put(query_vector, context_key, answer, _vector_store_version)
 
 
 @observe()
-def analyze_document(file_data, user_text, is_pdf=False):
+async def aget_general_response(user_input, chat_history, timeout=None):
     """
-    Handles Image and PDF analysis.
+    Async variant of get_general_response. The FAISS search runs in the default executor.
+    timeout (float): Deadline in seconds, defaults to config.AGENT_TIMEOUT_SECONDS.
+    """
+    async def call():
+        loop = asyncio.get_running_loop()
+        # The copied context keeps the retrieval spans inside this call's trace
+        retrieve = functools.partial(contextvars.copy_context().run, _retrieve_context, user_input)
+        context_text, query_vector, context_key = await loop.run_in_executor(None, retrieve)
+        cached = _cached_answer(query_vector, context_key, user_input, chat_history)
+        if cached is not None:
+            return cached
+
+        async def generate(model_name):
+            chat = _start_rag_chat(context_text, chat_history, model_name)
+
+            # 3. Generate Answer
+            with metrics.span("general_model", as_type="generation", model=model_name) as generation:
+                response = await chat.send_message_async(user_input, safety_settings=SAFETY_SETTINGS)
+                metrics.record_usage("general", response.usage_metadata, generation)
+            return response.text
+
+        answer = await router.ahedged(router.route(user_input, "general"), generate)
+        _cache_answer(query_vector, context_key, user_input, chat_history, answer)
+        return answer
+
+    return await _limited(call(), timeout)
+
+
+def get_general_response(user_input, chat_history):
+    """
+    Handles the General Fitness Chat Logic with RAG (Scientific Search).
+    """
+    return _run_sync(aget_general_response(user_input, chat_history))
+
+
+@observe()
+def stream_general_response(user_input, chat_history):
+    """
+    Streaming variant of get_general_response: yields the reply in text chunks as they arrive.
+    """
+    context_text, query_vector, context_key = _retrieve_context(user_input)
+    cached = _cached_answer(query_vector, context_key, user_input, chat_history)
+    if cached is not None:
+        yield cached
+        return
+
+    def start(model_name):
+        return _stream_reply(_start_rag_chat(context_text, chat_history, model_name), user_input, "general", model_name)
+
+    parts = []
+    for text in router.hedged_stream(router.route(user_input, "general", kind="stream"), start):
+        parts.append(text)
+        yield text
+    _cache_answer(query_vector, context_key, user_input, chat_history, "".join(parts))
+
+
+@observe()
+def summarize_history(previous_summary, messages):
+    """
+    Folds older chat turns into the running conversation summary (see history.build_history).
     Args:
-        file_data (dict): The processed file dictionary from utils.
-        user_text (str): The user's question.
-        is_pdf (bool): True if PDF, False if Image.
+        previous_summary (str): The summary so far ("" for the first call).
+        messages (list): Streamlit-style messages that just left the verbatim window.
     """
-    vision_model = genai.GenerativeModel("gemini-2.5-flash")
-    
+    transcript = "\n\n".join(f"{m['role'].upper()}: {m['content']}" for m in messages)
+    prompt = prompts.HISTORY_SUMMARY_PROMPT.format(
+        previous_summary=previous_summary or "(empty)",
+        transcript=transcript
+    )
+    model = GenerativeModel(config.SUMMARY_MODEL_NAME)
+    with metrics.span("summary_model", as_type="generation", model=config.SUMMARY_MODEL_NAME) as generation:
+        response = model.generate_content(prompt, safety_settings=SAFETY_SETTINGS)
+        metrics.record_usage("summary", response.usage_metadata, generation)
+    return response.text
+
+
+# Repeat analyses of the same file + question are served from memory
+vision_cache = cache.LRUCache(config.VISION_CACHE_MAX_ENTRIES, name="vision_cache")
+
+
+def _vision_request(file_data, user_text, is_pdf):
+    """Builds the Calorie Vision request. Returns (request_content, cache_key)."""
     request_content = []
     
     # 1. Select Prompt based on file type
@@ -129,11 +566,60 @@ def analyze_document(file_data, user_text, is_pdf=False):
         base_prompt += f"\n\nUSER QUESTION/CONTEXT: '{user_text}'"
     
     request_content.append(base_prompt)
-    
+
+    # Same file, same prompt, same question: reuse the earlier analysis
+    file_hash = hashlib.sha256(file_data["data"]).hexdigest() if file_data else ""
+    cache_key = (file_hash, base_prompt, user_text or "")
+    return request_content, cache_key
+
+
+def _attach_file(request_content, file_data, is_pdf):
     # 3. Add File Data
     if file_data:
-        request_content.append(file_data)
-        
-    # 4. Generate
-    response = vision_model.generate_content(request_content)
-    return response.text
\ No newline at end of file
+        if is_pdf:
+            # Send the locally extracted text (plus scanned pages only) instead of the whole binary
+            try:
+                request_content.extend(utils.prepare_pdf_for_vision(file_data["data"]))
+            except Exception as e:
+                print(f"⚠️ PDF pre-pass skipped: {e}")
+                request_content.append(file_data)
+        else:
+            request_content.append(file_data)
+
+
+@observe()
+async def aanalyze_document(file_data, user_text, is_pdf=False, timeout=None):
+    """
+    Async variant of analyze_document. The PDF pre-pass runs in the default executor.
+    timeout (float): Deadline in seconds, defaults to config.AGENT_TIMEOUT_SECONDS.
+    """
+    request_content, cache_key = _vision_request(file_data, user_text, is_pdf)
+    cached = vision_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    async def call():
+        loop = asyncio.get_running_loop()
+        attach = functools.partial(contextvars.copy_context().run, _attach_file, request_content, file_data, is_pdf)
+        await loop.run_in_executor(None, attach)
+
+        # 4. Generate
+        vision_model = GenerativeModel(config.VISION_MODEL_NAME)
+        with metrics.span("vision_model", as_type="generation", model=config.VISION_MODEL_NAME) as generation:
+            response = await vision_model.generate_content_async(request_content)
+            metrics.record_usage("vision", response.usage_metadata, generation)
+        vision_cache.put(cache_key, response.text)
+        return response.text
+
+    return await _limited(call(), timeout)
+
+
+def analyze_document(file_data, user_text, is_pdf=False):
+    """
+    Handles Image and PDF analysis.
+    Args:
+        file_data (dict): The processed file dictionary from utils.
+        user_text (str): The user's question.
+        is_pdf (bool): True if PDF, False if Image.
+    """
+    return _run_sync(aanalyze_document(file_data, user_text, is_pdf))
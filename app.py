@@ -1,57 +1,73 @@
+import functools
+import time
+import uuid
 import streamlit as st
 import config
 import utils
 import agent
+import history
+import metrics
+
+# Wall time of this script run (reported at the end of the script)
+rerun_start = time.perf_counter()
+
+# Prometheus endpoint for this process when METRICS_PORT is set (started once, then a no-op)
+metrics.start_exporter()
 
 # ---------------------------------------------------------
 # 1. DESIGN & CONFIGURATION
 # ---------------------------------------------------------
 st.set_page_config(
     page_title="Omny AI",
-    page_icon="Omny logo main 2.png",
+    page_icon=utils.ui_image("Omny logo main 2.png"),
     layout="wide"
 )
 
 # Force Black Theme & White Text
+# Colors and backgrounds come from the theme in .streamlit/config.toml; only what the theme
+# cannot express is injected here. Streamlit drops elements a rerun does not emit again, so this
+# small constant block is re-sent on every run.
+CUSTOM_CSS = """
+    <style>
+    /* Inputs */
+    .stTextInput input, .stNumberInput input, .stTextArea textarea, .stSelectbox, div[data-baseweb="select"] {
+        background-color: #111111 !important; 
+        color: #FFFFFF !important;
+        border: 1px solid #333333 !important;
+    }
+    [data-testid="stSidebar"] { border-right: 1px solid #333333; }
+    
+    /* ROUNDED LOGO IMPLEMENTATION */
+    [data-testid="stSidebar"] img {
+        border-radius: 50%;
+        object-fit: cover;
+    }
+    
+    /* Chat Avatar Styling */
+    .stChatMessage .stImage {
+        border-radius: 50% !important;
+    }
+    </style>
+"""
+
 def load_css():
-    st.markdown("""
-        <style>
-        /* General Text Color */
-        h1, h2, h3, h4, h5, h6, p, label, span, div { color: #FFFFFF !important; }
-        
-        /* Backgrounds */
-        .stApp { background-color: #000000 !important; }
-        [data-testid="stSidebar"] { background-color: #000000 !important; border-right: 1px solid #333333; }
-        
-        /* Inputs */
-        .stTextInput input, .stNumberInput input, .stTextArea textarea, .stSelectbox, div[data-baseweb="select"] {
-            background-color: #111111 !important; 
-            color: #FFFFFF !important;
-            border: 1px solid #333333 !important;
-        }
-        
-        /* ROUNDED LOGO IMPLEMENTATION */
-        [data-testid="stSidebar"] img {
-            border-radius: 50%;
-            object-fit: cover;
-        }
-        
-        /* Chat Avatar Styling */
-        .stChatMessage .stImage {
-            border-radius: 50% !important;
-        }
-        </style>
-    """, unsafe_allow_html=True)
+    st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
 
 load_css()
 
+# Each browser session has its own user ID (kept in the URL, so a refresh restores the same data)
+if "user_id" not in st.session_state:
+    st.session_state.user_id = st.query_params.get("user") or uuid.uuid4().hex
+    st.query_params["user"] = st.session_state.user_id
+user_id = st.session_state.user_id
+
 # ---------------------------------------------------------
 # 2. SIDEBAR & NAVIGATION (With Persistence)
 # ---------------------------------------------------------
-st.logo("Omny logo main 2.png", icon_image="Omny logo main 2.png")
+st.logo(utils.ui_image("Omny logo main 2.png"), icon_image=utils.ui_image("Omny logo main 2.png"))
 
 with st.sidebar:
-    st.image("Omny logo main.png", width=150)
+    st.image(utils.ui_image("Omny logo main.png"), width=150)
     st.markdown("---")
     
     mode = st.radio("Select Mode:", ["🧠 Coach Plan", "🥗 Calorie Vision", "🏋️ General Fitness Chat"])
@@ -59,29 +75,24 @@ with st.sidebar:
     st.markdown("---")
     st.header("Your Profile")
     
-    # 1. Load saved data from disk
-    saved_data = utils.load_profile()
-    
-    # 2. Initialize Session State (Use saved data if it exists, otherwise use defaults)
-    if "age" not in st.session_state: 
+    # 1. Load saved data from disk (once per session; afterwards the widgets own the values)
+    if "profile_loaded" not in st.session_state:
+        saved_data = utils.load_profile(user_id)
+
+        # 2. Initialize Session State (Use saved data if it exists, otherwise use defaults)
         st.session_state.age = saved_data["age"] if saved_data else 25
-        
-    if "weight" not in st.session_state: 
         st.session_state.weight = saved_data["weight"] if saved_data else 75.0
-        
-    if "height" not in st.session_state:
         st.session_state.height = saved_data["height"] if saved_data else 175
-        
-    if "gender" not in st.session_state:
+
         # Note: Selectbox needs an index (0 for Male, 1 for Female)
         saved_gender = saved_data.get("gender", "Male") if saved_data else "Male"
         st.session_state.gender_index = 0 if saved_gender == "Male" else 1
 
-    if "goal" not in st.session_state:
         # Map goal string to index
         saved_goal = saved_data.get("goal", "Lose Fat") if saved_data else "Lose Fat"
         goals = ["Lose Fat", "Build Muscle", "Maintain"]
         st.session_state.goal_index = goals.index(saved_goal) if saved_goal in goals else 0
+        st.session_state.profile_loaded = True
 
     # 3. Render Widgets (Linked to Session State)
     age = st.number_input("Age", 16, 90, key="age")
@@ -102,7 +113,7 @@ with st.sidebar:
             "goal": goal
         }
         # Call the tool
-        if utils.save_profile(profile_data):
+        if utils.save_profile(profile_data, user_id):
             st.success("✅ Profile Saved!")
         else:
             st.error("❌ Save Failed.")
@@ -111,14 +122,17 @@ with st.sidebar:
     st.markdown("---") # Visual separator
     # NEW: Reset Chat Button
     if st.button("🗑️ Reset Chat History"):
-        # 1. Delete the file
-        utils.clear_chat_history()
+        # 1. Delete the stored messages
+        utils.clear_chat_history(user_id)
         
         # 2. Clear the memory
         if "coach_messages" in st.session_state:
             del st.session_state["coach_messages"]
         if "general_messages" in st.session_state:
             del st.session_state["general_messages"]
+        for session_key in ("coach_messages", "general_messages"):
+            for suffix in ("_summary", "_shown", "_expanded"):
+                st.session_state.pop(session_key + suffix, None)
             
         # 3. Refresh the app to restart
         st.rerun()
@@ -130,19 +144,48 @@ def get_gemini_history(session_key):
     """
     Converts Streamlit session history into Gemini API format.
     Accepts 'coach_messages' or 'general_messages' as input.
+    Older turns are replaced by a rolling summary (cached per session) to stay within the token budget.
     """
-    gemini_history = []
-    if session_key in st.session_state:
-        for msg in st.session_state[session_key]:
-            role = "model" if msg["role"] == "assistant" else "user"
-            gemini_history.append({"role": role, "parts": [msg["content"]]})
-    return gemini_history
+    if session_key not in st.session_state:
+        return []
+    summary_state = st.session_state.setdefault(f"{session_key}_summary", {})
+    return history.build_history(st.session_state[session_key], summary_state, agent.summarize_history)
+
+def render_messages(session_key):
+    """
+    Renders a conversation: only the most recent page of messages, with a button to load
+    earlier pages. Long older messages (e.g. full plans) show a preview until expanded,
+    so rerun cost stays flat as the conversation grows.
+    """
+    messages = st.session_state[session_key]
+    shown = st.session_state.setdefault(f"{session_key}_shown", config.CHAT_PAGE_SIZE)
+    expanded = st.session_state.setdefault(f"{session_key}_expanded", set())
+    first = max(0, len(messages) - shown)
+
+    if first > 0 and st.button(f"⬆️ Show earlier messages ({first} hidden)", key=f"{session_key}_more"):
+        st.session_state[f"{session_key}_shown"] = shown + config.CHAT_PAGE_SIZE
+        st.rerun()
+
+    full_from = len(messages) - config.CHAT_FULL_RENDER_MESSAGES
+    for index in range(first, len(messages)):
+        message = messages[index]
+        content = message["content"]
+        with st.chat_message(message["role"]):
+            if index >= full_from or index in expanded or len(content) <= config.CHAT_PREVIEW_CHARS:
+                st.markdown(content)
+            else:
+                st.markdown(content[:config.CHAT_PREVIEW_CHARS] + "…")
+                if st.button("Show full message", key=f"{session_key}_expand_{index}"):
+                    expanded.add(index)
+                    st.rerun()
 
 # ---------------------------------------------------------
-# 4. INITIALIZE HISTORY (Load from File)
+# 4. INITIALIZE HISTORY (Load from Disk)
 # ---------------------------------------------------------
-# Load history ONCE when the script runs
-saved_chats = utils.load_chat_history()
+# Load history ONCE per session (not on every rerun)
+saved_chats = None
+if "coach_messages" not in st.session_state or "general_messages" not in st.session_state:
+    saved_chats = utils.load_chat_history(user_id)
 
 # Coach History
 if "coach_messages" not in st.session_state:
@@ -152,6 +195,7 @@ if "coach_messages" not in st.session_state:
         st.session_state.coach_messages = [
             {"role": "assistant", "content": "Hello! I am Omny AI. Ready to build your plan?"}
         ]
+        utils.append_chat_message("coach_messages", st.session_state.coach_messages[0], user_id)
 
 # General Chat History
 if "general_messages" not in st.session_state:
@@ -161,10 +205,12 @@ if "general_messages" not in st.session_state:
         st.session_state.general_messages = [
             {"role": "assistant", "content": "Ask me anything about training, diet, or sleep."}
         ]
+        utils.append_chat_message("general_messages", st.session_state.general_messages[0], user_id)
 
 # ---------------------------------------------------------
 # 5. MAIN APP LOGIC
 # ---------------------------------------------------------
+waited_on_model = False  # Set when this run called the model (excluded from rerun timing)
 
 # === MODE 1: COACH PLAN ===
 if mode == "🧠 Coach Plan":
@@ -172,55 +218,50 @@ if mode == "🧠 Coach Plan":
     st.caption("Detailed Training & Diet Planning")
 
     # Display Chat
-    for message in st.session_state.coach_messages:
-        with st.chat_message(message["role"]):
-            st.markdown(message["content"])
+    render_messages("coach_messages")
 
     # Handle Input
     if prompt := st.chat_input("Ask for a plan..."):
-        with st.chat_message("user", avatar="User.png"):
+        waited_on_model = True
+        with st.chat_message("user", avatar=utils.ui_image("User.png")):
             st.markdown(prompt)
         st.session_state.coach_messages.append({"role": "user", "content": prompt})
+        utils.append_chat_message("coach_messages", st.session_state.coach_messages[-1], user_id)
 
-        with st.chat_message("assistant", avatar="Omny logo main 2.png"):
-            with st.spinner("Analyzing..."):
-                try:
-                    # Collect Profile Data
-                    user_profile = {
-                        "age": age, "weight": weight, "height": height, 
-                        "gender": gender, "goal": goal
-                    }
-                    
-                    # Get History
-                    history = get_gemini_history("coach_messages")
-                    
-                    # CALL AGENT
-                    reply = agent.get_coach_response(prompt, history, user_profile)
-                    
-                    st.markdown(reply)
-                    st.session_state.coach_messages.append({"role": "assistant", "content": reply})
+        with st.chat_message("assistant", avatar=utils.ui_image("Omny logo main 2.png")):
+            try:
+                # Collect Profile Data
+                user_profile = {
+                    "age": age, "weight": weight, "height": height, 
+                    "gender": gender, "goal": goal
+                }
+                
+                # Get History
+                chat_history = get_gemini_history("coach_messages")
+                
+                # CALL AGENT (Streamed: text renders as it arrives)
+                reply = st.write_stream(agent.stream_coach_response(prompt, chat_history, user_profile))
+                
+                st.session_state.coach_messages.append({"role": "assistant", "content": reply})
 
-                    # === Auto-Save Chat ===
-                    utils.save_chat_history(
-                        st.session_state.coach_messages, 
-                        st.session_state.general_messages
-                    )
+                # === Auto-Save Chat (appends only the new message, in the background) ===
+                utils.append_chat_message("coach_messages", st.session_state.coach_messages[-1], user_id)
 
-                
-                    # === Download Plan Button (PDF Version) ===
-                    if "Week 1" in reply or "Month 1" in reply:
-                        # Generate PDF bytes
-                        pdf_data = utils.create_pdf(reply)
-                        
-                        st.download_button(
-                            label="📄 Download Plan as PDF",
-                            data=pdf_data,
-                            file_name="Omny_Fitness_Plan.pdf",
-                            mime="application/pdf"
-                        )
+            
+                # === Download Plan Button (PDF Version) ===
+                if "Week 1" in reply or "Month 1" in reply:
+                    # Render in the background now; the button only waits for it if clicked
+                    utils.create_pdf_async(reply)
+                    
+                    st.download_button(
+                        label="📄 Download Plan as PDF",
+                        data=functools.partial(utils.get_pdf, reply),
+                        file_name="Omny_Fitness_Plan.pdf",
+                        mime="application/pdf"
+                    )
 
-                except Exception as e:
-                    st.error(f"Error: {e}")
+            except Exception as e:
+                st.error(f"Error: {e}")
 
 # === MODE 2: CALORIE VISION ===
 elif mode == "🥗 Calorie Vision":
@@ -240,6 +281,7 @@ elif mode == "🥗 Calorie Vision":
         if not uploaded_file and not food_text:
             st.warning("Please upload a file or ask a question.")
         else:
+            waited_on_model = True
             with st.spinner("Analyzing..."):
                 try:
                     # Process file using utils
@@ -256,32 +298,44 @@ elif mode == "🥗 Calorie Vision":
 elif mode == "🏋️ General Fitness Chat":
     st.title("🏋️ General Fitness Chat")
 
-    for message in st.session_state.general_messages:
-        with st.chat_message(message["role"]):
-            st.markdown(message["content"])
+    render_messages("general_messages")
 
     if prompt := st.chat_input("Ask a question..."):
-        with st.chat_message("user", avatar="User.png"):
+        waited_on_model = True
+        with st.chat_message("user", avatar=utils.ui_image("User.png")):
             st.markdown(prompt)
         st.session_state.general_messages.append({"role": "user", "content": prompt})
+        utils.append_chat_message("general_messages", st.session_state.general_messages[-1], user_id)
 
-        with st.chat_message("assistant", avatar="Omny logo main 2.png"):
-            with st.spinner("Thinking..."):
-                try:
-                    # Get History
-                    history = get_gemini_history("general_messages")
-                    
-                    # CALL AGENT (With RAG)
-                    reply = agent.get_general_response(prompt, history)
-                    
-                    st.markdown(reply)
-                    st.session_state.general_messages.append({"role": "assistant", "content": reply})
+        with st.chat_message("assistant", avatar=utils.ui_image("Omny logo main 2.png")):
+            try:
+                # Get History
+                chat_history = get_gemini_history("general_messages")
+                
+                # CALL AGENT (With RAG, streamed)
+                reply = st.write_stream(agent.stream_general_response(prompt, chat_history))
+                
+                st.session_state.general_messages.append({"role": "assistant", "content": reply})
 
-                    # === Auto-Save Chat ===
-                    utils.save_chat_history(
-                        st.session_state.coach_messages, 
-                        st.session_state.general_messages
-                    )
+                # === Auto-Save Chat (appends only the new message, in the background) ===
+                utils.append_chat_message("general_messages", st.session_state.general_messages[-1], user_id)
 
-                except Exception as e:
-                    st.error(f"Error: {e}")
\ No newline at end of file
+            except Exception as e:
+                st.error(f"Error: {e}")
+
+# ---------------------------------------------------------
+# 6. RERUN TIMING
+# ---------------------------------------------------------
+# Excludes runs that waited on the model, so the number reflects the script's own overhead
+rerun_seconds = time.perf_counter() - rerun_start
+if not waited_on_model:
+    metrics.record("app_rerun_seconds", rerun_seconds)
+if st.query_params.get("debug"):
+    st.sidebar.caption(f"⏱️ Rerun: {rerun_seconds * 1000:.0f} ms")
+
+# ---------------------------------------------------------
+# 7. BACKGROUND WARM-UP
+# ---------------------------------------------------------
+# The page is rendered: load the vector store and the model SDKs now (once per process),
+# so neither the first paint nor the first question waits for them
+agent.warm_up_in_background()
@@ -0,0 +1 @@
+"""Performance benchmarks. Run each module from the project root, e.g. `python -m benchmarks.bench_tools`."""
@@ -0,0 +1,80 @@
+"""
+Benchmark: Streamlit rerun wall time of app.py as the conversation grows.
+
+    python -m benchmarks.bench_app_rerun --messages 10 100 400 --runs 5
+
+Runs the real script headlessly (streamlit.testing AppTest) against a temporary SQLite store,
+with the offline model backend. "Paged" is the app as configured; "render all" disables
+pagination and previews, the way every message used to be rendered on every rerun.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+os.environ.setdefault("MODEL_BACKEND", "stub")
+
+from streamlit.testing.v1 import AppTest
+import agent
+import config
+import storage
+from benchmarks.bench_pdf import make_plan
+
+USER_ID = "bench"
+
+
+def seed(store, count):
+    """Stores `count` coach messages; every assistant turn is a full plan."""
+    store.clear_messages(USER_ID)
+    plan = make_plan(12)
+    for index in range(count):
+        role = "user" if index % 2 == 0 else "assistant"
+        content = "Build me a muscle building plan." if role == "user" else plan
+        store.append_message(USER_ID, "coach_messages", {"role": role, "content": content})
+    store.flush()
+
+
+def time_reruns(runs):
+    """Returns (first run seconds, mean seconds of the following reruns)."""
+    at = AppTest.from_file(os.path.abspath("app.py"), default_timeout=60)
+    at.query_params["user"] = USER_ID
+    start = time.perf_counter()
+    at.run()
+    first = time.perf_counter() - start
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+    # The first run started the background warm-up (same process): reruns measure the steady state
+    agent.warm_up_in_background().join()
+
+    start = time.perf_counter()
+    for _ in range(runs):
+        at.run()
+    return first, (time.perf_counter() - start) / runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, nargs="+", default=[10, 100, 400],
+                        help="Conversation lengths to measure.")
+    parser.add_argument("--runs", type=int, default=5, help="Timed reruns per length.")
+    args = parser.parse_args()
+
+    storage._store = storage.Store(path=os.path.join(tempfile.mkdtemp(), "bench.db"))
+    paged = (config.CHAT_PAGE_SIZE, config.CHAT_FULL_RENDER_MESSAGES)
+
+    print(f"{'messages':>8} | {'paged: first / rerun':>22} | {'render all: first / rerun':>26}")
+    for count in args.messages:
+        seed(storage._store, count)
+        results = []
+        for page_size, full_render in (paged, (10 ** 9, 10 ** 9)):
+            config.CHAT_PAGE_SIZE, config.CHAT_FULL_RENDER_MESSAGES = page_size, full_render
+            results.append(time_reruns(args.runs))
+        config.CHAT_PAGE_SIZE, config.CHAT_FULL_RENDER_MESSAGES = paged
+
+        (p_first, p_rerun), (a_first, a_rerun) = results
+        print(f"{count:>8} | {p_first * 1000:9.0f} / {p_rerun * 1000:6.0f} ms | "
+              f"{a_first * 1000:11.0f} / {a_rerun * 1000:6.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""
+Benchmark: end-to-end latency of every app mode, offline, with a JSON report and regression checks.
+
+    python -m benchmarks.bench_e2e --runs 5 --history 0 20 100
+    python -m benchmarks.bench_e2e --ttft 0.8 --tokens-per-second 80 --reply-words 1500 --embed-seconds 0.2
+    python -m benchmarks.bench_e2e --check benchmarks/e2e_thresholds.json --baseline old_report.json
+
+Models and embeddings are the stubs (MODEL_BACKEND=stub) with the simulated API latency given
+on the command line; by default it is 0, so the numbers are our own overhead. Everything runs in
+a scratch directory with the knowledge base linked in, so the local index, chat database and
+caches are untouched. Stages: ingest (cold, then with a warm embedding cache), vector store load,
+Coach / General Chat replies (blocking and streamed time-to-first-token) per history length,
+Calorie Vision (photo, PDF), plan PDF rendering and chat persistence.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+from datetime import datetime
+
+os.environ["MODEL_BACKEND"] = "stub"
+
+import numpy as np
+from PIL import Image
+import agent
+import config
+import embedding_cache
+import history
+import ingest
+import metrics
+import retrieval
+import storage
+import utils
+import vectorstore
+from benchmarks.bench_pdf import make_plan
+
+PROFILE = {"age": 30, "weight": 80, "height": 180, "gender": "Male", "goal": "Build Muscle"}
+COACH_QUESTION = "Build me a muscle building plan."
+GENERAL_QUESTION = "How much protein should I eat per day to build muscle?"
+VISION_QUESTION = "How many calories are in this?"
+PERSIST_MESSAGES = 50  # Messages appended per persistence run
+MIN_REGRESSION_MS = 5.0  # Baseline comparisons ignore p95 differences below this (timer noise)
+REPORTS_DIR = os.path.join("benchmarks", "reports")
+
+
+def make_workspace(kb_dir, with_index):
+    """Scratch directory the benchmark runs in (config paths are relative to the working directory)."""
+    workspace = tempfile.mkdtemp(prefix="omny-bench-")
+    os.symlink(os.path.abspath(kb_dir), os.path.join(workspace, config.KNOWLEDGE_BASE_DIR))
+    os.symlink(os.path.abspath(utils.LOGO_FILE), os.path.join(workspace, utils.LOGO_FILE))
+    if with_index:
+        shutil.copytree(config.FAISS_INDEX_DIR, os.path.join(workspace, config.FAISS_INDEX_DIR))
+    return workspace
+
+
+def make_conversation(length):
+    """`length` stored messages alternating questions and full plans."""
+    plan = make_plan(4)
+    return [{"role": "user", "content": f"{COACH_QUESTION} (turn {i})"} if i % 2 == 0
+            else {"role": "assistant", "content": plan} for i in range(length)]
+
+
+def make_photo(width=3000, height=2000):
+    """A phone-sized JPEG (noise compresses badly, like a real photo)."""
+    output = io.BytesIO()
+    Image.effect_noise((width, height), 48).convert("RGB").save(output, "JPEG", quality=90)
+    return output.getvalue()
+
+
+def summarize(samples):
+    seconds = np.asarray(samples)
+    return {
+        "runs": len(samples),
+        "mean_ms": float(seconds.mean()) * 1000,
+        "p50_ms": float(np.percentile(seconds, 50)) * 1000,
+        "p95_ms": float(np.percentile(seconds, 95)) * 1000,
+        "max_ms": float(seconds.max()) * 1000,
+    }
+
+
+class Stages:
+    """Times callables and collects the per-stage summaries of the report."""
+    def __init__(self):
+        self.results = {}
+
+    def time(self, name, fn, runs):
+        """Times `runs` calls of fn(run)."""
+        def timed(run):
+            start = time.perf_counter()
+            fn(run)
+            return time.perf_counter() - start
+        self.measure(name, timed, runs)
+
+    def measure(self, name, fn, runs):
+        """Calls fn(run) `runs` times; fn returns the seconds to record (e.g. a time-to-first-token)."""
+        samples = [fn(run) for run in range(runs)]
+        self.results[name] = summarize(samples)
+        result = self.results[name]
+        print(f"{name:<24} | {result['p50_ms']:9.1f} | {result['p95_ms']:9.1f} | {result['mean_ms']:9.1f}")
+
+
+def first_chunk_seconds(stream):
+    """Consumes a reply stream; returns the time until its first chunk."""
+    start = time.perf_counter()
+    ttft = None
+    for _ in stream:
+        if ttft is None:
+            ttft = time.perf_counter() - start
+    return ttft
+
+
+def run_ingest(stages):
+    cold_embeddings = embedding_cache.create_embeddings(config.EMBEDDING_MODEL)
+    stages.time("ingest_cold", lambda run: ingest.create_vector_db(rebuild=True, embeddings=cold_embeddings), 1)
+    # A new wrapper over the same cache directory, like the next ingest process
+    warm_embeddings = embedding_cache.create_embeddings(config.EMBEDDING_MODEL)
+    stages.time("ingest_warm_cache", lambda run: ingest.create_vector_db(rebuild=True, embeddings=warm_embeddings), 1)
+
+
+def run_vector_store(stages, runs):
+    embeddings = embedding_cache.create_embeddings(config.EMBEDDING_MODEL)
+
+    def load(run):
+        vector_store = vectorstore.load(config.FAISS_INDEX_DIR, embeddings, mmap_index=config.FAISS_MMAP)
+        retrieval.load_keyword_index(config.FAISS_INDEX_DIR, vector_store)
+
+    stages.time("vector_store_load", load, runs)
+    agent.get_vector_store()  # Warm the shared store for the chat stages
+
+
+def run_chats(stages, runs, history_lengths):
+    for length in history_lengths:
+        messages = make_conversation(length)
+        stages.time(f"history_build[h={length}]",
+                    lambda run: history.build_history(messages, {}, agent.summarize_history), runs)
+        gemini_history = history.build_history(messages, {}, agent.summarize_history)
+
+        # Every run asks something new, so neither the semantic cache nor the embedding cache answers
+        stages.time(f"coach[h={length}]", lambda run: agent.get_coach_response(
+            f"{COACH_QUESTION} (run {run})", gemini_history, PROFILE), runs)
+        stages.measure(f"coach_ttft[h={length}]", lambda run: first_chunk_seconds(agent.stream_coach_response(
+            f"{COACH_QUESTION} (stream {run})", gemini_history, PROFILE)), runs)
+        stages.time(f"general[h={length}]", lambda run: agent.get_general_response(
+            f"{GENERAL_QUESTION} (h={length}, run {run})", gemini_history), runs)
+        stages.measure(f"general_ttft[h={length}]", lambda run: first_chunk_seconds(agent.stream_general_response(
+            f"{GENERAL_QUESTION} (h={length}, stream {run})", gemini_history)), runs)
+
+
+def run_vision(stages, runs, plan_pdf):
+    photo = make_photo()
+
+    def analyze_photo(run):
+        file_data = {"mime_type": "image/jpeg", "data": utils.preprocess_image(photo)}
+        agent.analyze_document(file_data, f"{VISION_QUESTION} (run {run})")
+
+    stages.time("vision_photo", analyze_photo, runs)
+    stages.time("vision_pdf", lambda run: agent.analyze_document(
+        {"mime_type": "application/pdf", "data": plan_pdf}, f"{VISION_QUESTION} (run {run})", is_pdf=True), runs)
+
+
+def run_persistence(stages, runs):
+    store = storage.get_store()
+
+    def append(run):
+        for i in range(PERSIST_MESSAGES):
+            role = "user" if i % 2 == 0 else "assistant"
+            utils.append_chat_message("coach_messages", {"role": role, "content": f"Message {run}-{i}"})
+        store.flush()
+
+    stages.time(f"persist_append[n={PERSIST_MESSAGES}]", append, runs)
+    stages.time("persist_load", lambda run: utils.load_chat_history(), runs)
+
+
+def check(report, thresholds_path=None, baseline_path=None, tolerance=0.25):
+    """Returns the list of regressions: p95 over its threshold, or over the baseline's p95 by `tolerance`."""
+    failures = []
+    stages = report["stages"]
+    if thresholds_path:
+        with open(thresholds_path, "r") as f:
+            limits = json.load(f)["p95_ms"]
+        for name, limit in limits.items():
+            if name in stages and stages[name]["p95_ms"] > limit:
+                failures.append(f"{name}: p95 {stages[name]['p95_ms']:.1f} ms > threshold {limit:.1f} ms")
+    if baseline_path:
+        with open(baseline_path, "r") as f:
+            baseline_report = json.load(f)
+        if baseline_report.get("settings") != report["settings"]:
+            print("⚠️ The baseline was run with different settings; its numbers may not be comparable.")
+        baseline = baseline_report["stages"]
+        for name, result in stages.items():
+            if name not in baseline:
+                continue
+            before, after = baseline[name]["p95_ms"], result["p95_ms"]
+            if after > before * (1 + tolerance) and after - before > MIN_REGRESSION_MS:
+                failures.append(f"{name}: p95 {after:.1f} ms vs. baseline {before:.1f} ms (+{after / before - 1:.0%})")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="Timed runs per stage.")
+    parser.add_argument("--history", type=int, nargs="+", default=[0, 20, 100],
+                        help="Stored conversation lengths (messages) for the chat stages.")
+    parser.add_argument("--kb-dir", default=config.KNOWLEDGE_BASE_DIR, help="PDF corpus to ingest.")
+    parser.add_argument("--skip-ingest", action="store_true", help="Use a copy of the local index instead.")
+    parser.add_argument("--ttft", type=float, default=0.0, help="Simulated model time-to-first-token (s).")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="Simulated generation speed.")
+    parser.add_argument("--reply-words", type=int, default=0, help="Pad model replies to this many words.")
+    parser.add_argument("--embed-seconds", type=float, default=0.0, help="Simulated embedding request time (s).")
+    parser.add_argument("--output", help="Report path (default: benchmarks/reports/e2e-<timestamp>.json).")
+    parser.add_argument("--check", metavar="THRESHOLDS", help="Fail when a stage's p95 exceeds these limits.")
+    parser.add_argument("--baseline", help="Earlier report; fail when a stage's p95 regressed past --tolerance.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed p95 regression vs. the baseline.")
+    args = parser.parse_args()
+
+    config.STUB_TTFT_SECONDS = args.ttft
+    config.STUB_TOKENS_PER_SECOND = args.tokens_per_second
+    config.STUB_REPLY_WORDS = args.reply_words
+    config.STUB_EMBED_SECONDS = args.embed_seconds
+
+    output = os.path.abspath(args.output or os.path.join(
+        REPORTS_DIR, f"e2e-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"))
+    check_paths = [os.path.abspath(path) if path else None for path in (args.check, args.baseline)]
+    plan = make_plan(12)
+
+    project_dir = os.getcwd()
+    workspace = make_workspace(args.kb_dir, with_index=args.skip_ingest)
+    os.chdir(workspace)
+    metrics.reset()
+    stages = Stages()
+    print(f"{'stage':<24} | {'p50 ms':>9} | {'p95 ms':>9} | {'mean ms':>9}")
+    try:
+        if not args.skip_ingest:
+            run_ingest(stages)
+        run_vector_store(stages, args.runs)
+        run_chats(stages, args.runs, args.history)
+        run_vision(stages, args.runs, utils.create_pdf(plan))
+        stages.time("pdf_render", lambda run: utils.create_pdf(plan), args.runs)
+        run_persistence(stages, args.runs)
+    finally:
+        os.chdir(project_dir)
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "settings": {
+            "runs": args.runs, "history": args.history, "ttft": args.ttft,
+            "tokens_per_second": args.tokens_per_second, "reply_words": args.reply_words,
+            "embed_seconds": args.embed_seconds, "skip_ingest": args.skip_ingest,
+        },
+        "stages": stages.results,
+        "metrics": metrics.snapshot(),
+    }
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"💾 Report written to {output}")
+
+    failures = check(report, *check_paths, tolerance=args.tolerance)
+    if failures:
+        raise SystemExit("❌ Performance regressions:\n  " + "\n  ".join(failures))
+    if any(check_paths):
+        print("✅ No performance regressions.")
+
+
+if __name__ == "__main__":
+    main()
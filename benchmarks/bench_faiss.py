@@ -0,0 +1,122 @@
+"""
+Benchmark: FAISS index types (recall@k vs. the flat index, query latency, resident memory).
+
+    python -m benchmarks.bench_faiss --k 3 --queries 200
+    python -m benchmarks.bench_faiss --synthetic 100000
+
+Uses the vectors of the local faiss_index (or a synthetic clustered set). Queries are the
+stored vectors plus noise. Each index is loaded memory-mapped in a fresh process, so the
+memory columns show what one more worker costs: anonymous (private) vs. file-backed (shared) pages.
+"""
+import argparse
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+import time
+import faiss
+import numpy as np
+import config
+import vectorstore
+
+
+def load_vectors(index_dir):
+    index = faiss.read_index(os.path.join(index_dir, vectorstore.INDEX_FILE))
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def synthetic_vectors(count, dimensions=768, clusters=64, seed=0):
+    """Unit vectors drawn around random centers, roughly like topic clusters of text embeddings."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimensions)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, count)] + 0.6 * rng.standard_normal((count, dimensions)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def make_queries(vectors, count, noise=0.05, seed=1):
+    rng = np.random.default_rng(seed)
+    picked = vectors[rng.integers(0, len(vectors), count)]
+    scale = noise * float(np.linalg.norm(vectors, axis=1).mean()) / np.sqrt(vectors.shape[1])
+    return (picked + scale * rng.standard_normal(picked.shape)).astype(np.float32)
+
+
+def _rss_mb():
+    status = open("/proc/self/status").read()
+    return {key: int(re.search(key + r":\s+(\d+)", status).group(1)) / 1024 for key in ("RssAnon", "RssFile")}
+
+
+def _measure(path, queries, k, mmap_index, results):
+    """Runs in a fresh process: load the index, search one query at a time, report memory and latency."""
+    before = _rss_mb()
+    index = vectorstore.tune_index(vectorstore.read_index(path, mmap_index))
+    latencies, found = [], []
+    for query in queries:
+        start = time.perf_counter()
+        _, ids = index.search(query[None, :], k)
+        latencies.append(time.perf_counter() - start)
+        found.append(ids[0])
+    after = _rss_mb()
+    results.put({
+        "found": np.array(found),
+        "p50_ms": float(np.percentile(latencies, 50)) * 1000,
+        "p95_ms": float(np.percentile(latencies, 95)) * 1000,
+        "anon_mb": after["RssAnon"] - before["RssAnon"],
+        "file_mb": after["RssFile"] - before["RssFile"],
+    })
+
+
+def measure(path, queries, k, mmap_index):
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=_measure, args=(path, queries, k, mmap_index, results))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+
+def recall_at_k(found, truth):
+    return float(np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--index-dir", default=config.FAISS_INDEX_DIR)
+    parser.add_argument("--synthetic", type=int, default=0, help="Use N synthetic vectors instead of the index.")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=config.RETRIEVAL_K)
+    parser.add_argument("--types", nargs="+", default=list(vectorstore.INDEX_TYPES), choices=vectorstore.INDEX_TYPES)
+    parser.add_argument("--no-mmap", action="store_true", help="Read indexes into memory instead.")
+    args = parser.parse_args()
+
+    vectors = synthetic_vectors(args.synthetic) if args.synthetic else load_vectors(args.index_dir)
+    queries = make_queries(vectors, args.queries)
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(queries, args.k)
+
+    print(f"{len(vectors):,} vectors x {vectors.shape[1]} dims, {args.queries} queries, k={args.k}, "
+          f"{'in-memory' if args.no_mmap else 'memory-mapped'}")
+    print(f"{'type':>5} | {'build s':>7} | {'file MB':>7} | {'recall@k':>8} | {'p50 ms':>7} | {'p95 ms':>7} | "
+          f"{'anon MB':>7} | {'mapped MB':>9}")
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        for index_type in args.types:
+            start = time.perf_counter()
+            index = vectorstore.build_index(vectors, index_type)
+            build_seconds = time.perf_counter() - start
+            path = os.path.join(tmp_dir, f"{index_type}.faiss")
+            faiss.write_index(index, path)
+            del index
+
+            result = measure(path, queries, args.k, not args.no_mmap)
+            print(f"{index_type:>5} | {build_seconds:7.2f} | {os.path.getsize(path) / 2 ** 20:7.1f} | "
+                  f"{recall_at_k(result['found'], truth):8.3f} | {result['p50_ms']:7.3f} | {result['p95_ms']:7.3f} | "
+                  f"{result['anon_mb']:7.1f} | {result['file_mb']:9.1f}")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Benchmark: plan PDF rendering throughput (pages/sec) on long generated plans.
+
+    python -m benchmarks.bench_pdf --weeks 12 --runs 5
+"""
+import argparse
+import time
+import utils
+
+
+def make_plan(weeks):
+    """A long Coach-style plan in the same Markdown shape Gemini produces."""
+    lines = ["### 1. The Math", "* **BMR:** 1780 kcal", "* **TDEE:** 2759 kcal",
+             "* **Macros:** Protein 160g, Fats 64g, Carbs 240g", "", "### THE 3-MONTH ROADMAP"]
+    for week in range(1, weeks + 1):
+        lines.append(f"### Week {week}")
+        for day, focus in enumerate(["Push", "Pull", "Legs", "Upper", "Lower"], start=1):
+            lines.append(f"**Day {day}: {focus}**")
+            for exercise in range(1, 6):
+                lines.append(f"* Exercise {exercise}: 4 sets x 8-10 reps, rest 90s, RPE 8")
+            lines.append("Focus on controlled eccentrics and full range of motion. " * 3)
+            lines.append("")
+    return "\n".join(lines)
+
+
+def render(plan, runs):
+    """Returns (pages per PDF, seconds per PDF)."""
+    pages = utils.create_pdf(plan).count(b"/Type /Page\n")  # Warm-up (and page count)
+    start = time.perf_counter()
+    for _ in range(runs):
+        utils.create_pdf(plan)
+    return pages, (time.perf_counter() - start) / runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--weeks", type=int, default=12, help="Weeks in the generated plan.")
+    parser.add_argument("--runs", type=int, default=5, help="Timed renders per variant.")
+    args = parser.parse_args()
+
+    plan = make_plan(args.weeks)
+
+    # Baseline: embed the full-size logo the way the header used to
+    cached_logo = utils.header_logo_path
+    utils.header_logo_path = lambda: utils.LOGO_FILE
+    pages, full_seconds = render(plan, args.runs)
+    utils.header_logo_path = cached_logo
+
+    _, cached_seconds = render(plan, args.runs)
+
+    print(f"Plan: {args.weeks} weeks, {len(plan):,} chars, {pages} pages")
+    print(f"Full-size logo  : {full_seconds * 1000:8.1f} ms/PDF ({pages / full_seconds:7.1f} pages/sec)")
+    print(f"Downscaled logo : {cached_seconds * 1000:8.1f} ms/PDF ({pages / cached_seconds:7.1f} pages/sec)")
+
+    # Cached path: a repeat request for the same reply costs nothing
+    utils.get_pdf(plan)
+    start = time.perf_counter()
+    utils.get_pdf(plan)
+    print(f"Cached repeat   : {(time.perf_counter() - start) * 1000:8.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
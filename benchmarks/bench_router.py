@@ -0,0 +1,84 @@
+"""
+Benchmark: model router (complexity routes + hedged requests) vs. sending every turn to the Coach model.
+
+    python -m benchmarks.bench_router --runs 10
+    python -m benchmarks.bench_router --pro-ttft 2.0 --flash-ttft 0.4 --slow-fraction 0.2
+
+Offline, with the stub models: the Coach model and the fast model get their own simulated
+time-to-first-token, and a hash-chosen share of requests takes --slow-factor times longer (tail
+latency). Streams a mix of greetings, short questions and plan requests through the Coach with
+the router off and on, and prints time-to-first-token per route, the SLO hit rate and how often
+a hedged request was sent and won.
+"""
+import argparse
+import os
+import statistics
+import time
+
+os.environ["MODEL_BACKEND"] = "stub"
+
+import agent
+import config
+import router
+
+PROFILE = {"age": 30, "weight": 80, "height": 180, "gender": "Male", "goal": "Build Muscle"}
+MESSAGES = {
+    "greeting": ["hi", "hello coach", "thanks so much", "ok cool", "good morning"],
+    "short": ["How much protein per day?", "Is creatine safe?", "Should I stretch before lifting?",
+              "How long should I rest between sets?", "Are eggs healthy?"],
+    "full": ["Build me a muscle building plan.", "Write a 4 week workout plan.", "Give me a weekly meal plan.",
+             "Make a cutting diet with macros.", "Plan my training split for the month."],
+}
+
+
+def run(runs, enabled):
+    """Streams every message `runs` times; returns {route: [ttft seconds]} and the decision log."""
+    config.ROUTER_ENABLED = enabled
+    start = len(router.recent_decisions())
+    ttfts = {route: [] for route in MESSAGES}
+    for i in range(runs):
+        for route, messages in MESSAGES.items():
+            message = f"{messages[i % len(messages)]} ({'on' if enabled else 'off'} {i})"
+            begin = time.perf_counter()
+            stream = agent.stream_coach_response(message, [], PROFILE)
+            next(stream)
+            ttfts[route].append(time.perf_counter() - begin)
+            stream.close()
+    return ttfts, router.recent_decisions()[start:]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10, help="Requests per route and router setting.")
+    parser.add_argument("--pro-ttft", type=float, default=1.0, help=f"Simulated TTFT of {config.MODEL_NAME} (s).")
+    parser.add_argument("--flash-ttft", type=float, default=0.3,
+                        help=f"Simulated TTFT of {config.ROUTER_FAST_MODEL} (s).")
+    parser.add_argument("--slow-fraction", type=float, default=0.1, help="Share of requests with tail latency.")
+    parser.add_argument("--slow-factor", type=float, default=5.0, help="TTFT multiplier of those requests.")
+    args = parser.parse_args()
+
+    config.STUB_MODEL_TTFT_SECONDS = {config.MODEL_NAME: args.pro_ttft, config.ROUTER_FAST_MODEL: args.flash_ttft,
+                                      config.ROUTER_FALLBACK_MODEL: args.flash_ttft}
+    config.STUB_SLOW_FRACTION = args.slow_fraction
+    config.STUB_SLOW_FACTOR = args.slow_factor
+    config.ROUTER_LOG_FILE = None
+    agent.get_coach_response("hi", [], PROFILE)  # Start the agent loop and load the stubs
+
+    print(f"{'router':<6} | {'route':<8} | {'p50 ms':>8} | {'p95 ms':>8} | {'SLO met':>7} | {'hedged':>6} | {'hedge won':>9}")
+    for enabled in (False, True):
+        ttfts, decisions = run(args.runs, enabled)
+        for route, seconds in ttfts.items():
+            ordered = sorted(seconds)
+            slo = config.ROUTE_TTFT_SLO_SECONDS[route]
+            met = sum(value <= slo for value in seconds) / len(seconds)
+            # With the router off every turn is logged as "full" and never hedged
+            routed = [d for d in decisions if d["route"] == route] if enabled else []
+            hedged = sum(d["hedged"] for d in routed)
+            won = sum(d["hedge_won"] for d in routed)
+            p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+            print(f"{'on' if enabled else 'off':<6} | {route:<8} | {statistics.median(seconds) * 1000:8.0f} | "
+                  f"{p95 * 1000:8.0f} | {met:7.0%} | {hedged:6d} | {won:9d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Benchmark: cold start (import time of the entry points and the app's first run in a fresh process).
+
+    python -m benchmarks.bench_startup --runs 5
+    python -m benchmarks.bench_startup --targets agent server --top 15
+
+Every measurement is a new Python process. Import times come from `python -X importtime`
+(cumulative microseconds per module); "first run" executes app.py once headlessly
+(streamlit.testing AppTest) in a scratch directory, which is what a new pod pays before the
+first page renders. The heaviest imports of the first target are listed to show what to defer.
+"""
+import argparse
+import glob
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import config
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+FIRST_RUN_SCRIPT = """
+import time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file({app!r}, default_timeout=120)
+at.run()
+if at.exception:
+    raise SystemExit(at.exception[0].message)
+print(time.perf_counter() - start)
+"""
+
+
+def import_times(target):
+    """Runs `import target` in a fresh interpreter; returns {module: cumulative seconds}, in import order."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {target}"],
+                            capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            times[match.group(4)] = int(match.group(2)) / 1e6
+    return times
+
+
+def heaviest_packages(times, target, top):
+    """Top-level packages (no dotted submodules) pulled in by the target, by cumulative import time."""
+    packages = [(name, seconds) for name, seconds in times.items() if "." not in name and name != target]
+    return sorted(packages, key=lambda item: item[1], reverse=True)[:top]
+
+
+def make_workspace(project_dir):
+    """Scratch directory with the app's images and index linked in (the chat database is created here)."""
+    workspace = tempfile.mkdtemp(prefix="omny-startup-")
+    for path in glob.glob(os.path.join(project_dir, "*.png")) + [os.path.join(project_dir, config.FAISS_INDEX_DIR)]:
+        if os.path.exists(path):
+            os.symlink(path, os.path.join(workspace, os.path.basename(path)))
+    return workspace
+
+
+def first_run_seconds(project_dir):
+    workspace = make_workspace(project_dir)
+    try:
+        env = dict(os.environ, PYTHONPATH=project_dir)
+        script = FIRST_RUN_SCRIPT.format(app=os.path.join(project_dir, "app.py"))
+        result = subprocess.run([sys.executable, "-c", script], cwd=workspace, env=env,
+                                capture_output=True, text=True, check=True)
+        return float(result.stdout.strip().splitlines()[-1])
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--targets", nargs="+", default=["agent", "server", "streamlit"],
+                        help="Modules whose import time is measured (streamlit is the floor for app.py).")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh processes per measurement (median shown).")
+    parser.add_argument("--top", type=int, default=10, help="Heaviest imports listed for the first target.")
+    parser.add_argument("--skip-app", action="store_true", help="Skip the app.py first-run measurement.")
+    args = parser.parse_args()
+
+    project_dir = os.getcwd()
+    profiles = {}
+    print(f"{'entry point':<16} | {'median ms':>9} | {'min ms':>7}")
+    for target in args.targets:
+        runs = [import_times(target) for _ in range(args.runs)]
+        profiles[target] = runs[-1]
+        seconds = [times[target] for times in runs]
+        print(f"{'import ' + target:<16} | {statistics.median(seconds) * 1000:9.0f} | {min(seconds) * 1000:7.0f}")
+
+    if not args.skip_app:
+        seconds = [first_run_seconds(project_dir) for _ in range(args.runs)]
+        print(f"{'app first run':<16} | {statistics.median(seconds) * 1000:9.0f} | {min(seconds) * 1000:7.0f}")
+
+    target = args.targets[0]
+    print(f"\nHeaviest imports under '{target}' (cumulative ms):")
+    for name, seconds in heaviest_packages(profiles[target], target, args.top):
+        print(f"  {name:<32} {seconds * 1000:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
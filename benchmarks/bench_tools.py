@@ -0,0 +1,71 @@
+"""
+Benchmark: vectorized tools.calculate_profiles_batch vs. a loop over the scalar Coach tools.
+
+    python -m benchmarks.bench_tools --rows 1000000 --scalar-rows 100000
+"""
+import argparse
+import time
+import numpy as np
+import tools
+
+GOALS = np.array(["Lose Fat", "Build Muscle", "Maintain"])
+GENDERS = np.array(["Male", "Female"])
+
+
+def make_profiles(rows, seed=0):
+    """Random but realistic cohort table (columnar)."""
+    rng = np.random.default_rng(seed)
+    return {
+        "weight_kg": rng.uniform(40, 200, rows).round(1),
+        "height_cm": rng.integers(120, 221, rows),
+        "age": rng.integers(16, 91, rows),
+        "gender": GENDERS[rng.integers(0, 2, rows)],
+        "goal": GOALS[rng.integers(0, 3, rows)],
+    }
+
+
+def scalar_loop(table, activity_level="moderate"):
+    out = {"bmr": [], "tdee": [], "protein": [], "fats": [], "carbs": []}
+    for w, h, a, g, goal in zip(table["weight_kg"].tolist(), table["height_cm"].tolist(), table["age"].tolist(),
+                                table["gender"].tolist(), table["goal"].tolist()):
+        bmr = tools.calculate_bmr(w, h, a, g)
+        macros = tools.calculate_macros(w, goal)
+        out["bmr"].append(bmr)
+        out["tdee"].append(tools.calculate_tdee(bmr, activity_level))
+        for name, value in macros.items():
+            out[name].append(value)
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Rows for the batch version.")
+    parser.add_argument("--scalar-rows", type=int, default=100_000, help="Rows for the scalar loop.")
+    args = parser.parse_args()
+
+    table = make_profiles(args.rows)
+
+    start = time.perf_counter()
+    batch = tools.calculate_profiles_batch(table)
+    batch_seconds = time.perf_counter() - start
+
+    scalar_rows = min(args.scalar_rows, args.rows)
+    subset = {name: column[:scalar_rows] for name, column in table.items()}
+    start = time.perf_counter()
+    scalar = scalar_loop(subset)
+    scalar_seconds = time.perf_counter() - start
+
+    # The batch API must match the scalar tools exactly
+    for name, values in scalar.items():
+        if not np.array_equal(np.asarray(values), batch[name][:scalar_rows]):
+            raise SystemExit(f"❌ Mismatch in '{name}' between batch and scalar results.")
+
+    batch_rate = args.rows / batch_seconds
+    scalar_rate = scalar_rows / scalar_seconds
+    print(f"Batch : {args.rows:>10,} rows in {batch_seconds:8.3f}s ({batch_rate:,.0f} rows/sec)")
+    print(f"Scalar: {scalar_rows:>10,} rows in {scalar_seconds:8.3f}s ({scalar_rate:,.0f} rows/sec)")
+    print(f"Speedup: {batch_rate / scalar_rate:,.1f}x (results identical)")
+
+
+if __name__ == "__main__":
+    main()
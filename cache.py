@@ -0,0 +1,142 @@
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+import config
+import metrics
+
+# ==========================================
+# SEMANTIC RESPONSE CACHE (General Fitness Chat)
+# ==========================================
+class SemanticCache:
+    """
+    Reuses answers for near-duplicate questions ("how much protein per day?" asked many ways).
+    A lookup hits when a cached question's embedding is within `threshold` cosine similarity
+    AND the same scientific context was retrieved for it. Entries expire after `ttl_seconds`,
+    the least recently used entry is evicted beyond `max_entries`, and everything is dropped
+    when the FAISS index version changes.
+    """
+    def __init__(self, threshold=config.SEMANTIC_CACHE_THRESHOLD,
+                 ttl_seconds=config.SEMANTIC_CACHE_TTL_SECONDS,
+                 max_entries=config.SEMANTIC_CACHE_MAX_ENTRIES, name="semantic_cache"):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.name = name
+        self.index_version = None
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (unit vector, context key, answer, created_at)
+        self._next_key = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _check_version(self, index_version):
+        if index_version != self.index_version:
+            self._entries.clear()
+            self.index_version = index_version
+
+    def get(self, query_vector, context_key, index_version):
+        """Returns the cached answer for a similar question with the same context, or None."""
+        query = self._normalize(query_vector)
+        now = time.time()
+        with self._lock:
+            self._check_version(index_version)
+
+            best_key, best_score = None, self.threshold
+            for key, (vector, entry_context, _, created_at) in list(self._entries.items()):
+                if now - created_at > self.ttl_seconds:
+                    del self._entries[key]
+                    continue
+                if entry_context != context_key:
+                    continue
+                score = float(np.dot(query, vector))
+                if score >= best_score:
+                    best_key, best_score = key, score
+
+            if best_key is None:
+                self.misses += 1
+                metrics.increment(f"{self.name}_misses")
+                return None
+
+            self._entries.move_to_end(best_key)
+            self.hits += 1
+            metrics.increment(f"{self.name}_hits")
+            return self._entries[best_key][2]
+
+    def put(self, query_vector, context_key, answer, index_version):
+        """Stores an answer, evicting the least recently used entry when full."""
+        with self._lock:
+            self._check_version(index_version)
+            self._entries[self._next_key] = (self._normalize(query_vector), context_key, answer, time.time())
+            self._next_key += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+# ==========================================
+# EXACT-MATCH LRU CACHE (e.g. vision analyses by image hash)
+# ==========================================
+class LRUCache:
+    """Thread-safe LRU map with optional TTL and hit/miss metrics."""
+    def __init__(self, max_entries, ttl_seconds=None, name="lru_cache"):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (value, created_at)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl_seconds is not None and time.time() - entry[1] > self.ttl_seconds:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                metrics.increment(f"{self.name}_misses")
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            metrics.increment(f"{self.name}_hits")
+            return entry[0]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
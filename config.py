@@ -15,4 +15,143 @@ LANGFUSE_SECRET_KEY = os.getenv("LANGFUSE_SECRET_KEY")
 LANGFUSE_HOST = os.getenv("LANGFUSE_HOST", "https://cloud.langfuse.com")
 
 # Model Settings
-MODEL_NAME = "gemini-2.5-pro"
\ No newline at end of file
+MODEL_NAME = "gemini-2.5-pro"
+RAG_MODEL_NAME = "gemini-2.5-pro"  # General Fitness Chat
+VISION_MODEL_NAME = "gemini-2.5-flash"  # Calorie Vision
+SUMMARY_MODEL_NAME = "gemini-2.5-flash"  # Cheap model for rolling chat summaries
+# "gemini" (real API) or "stub" (deterministic offline models from stubs.py, for local runs and tests)
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "gemini")
+
+# Offline Backend Latency (stubs.py; simulated API timings, all 0 = instant)
+STUB_TTFT_SECONDS = float(os.getenv("STUB_TTFT_SECONDS", "0"))  # Delay before the first token of a reply
+STUB_TOKENS_PER_SECOND = float(os.getenv("STUB_TOKENS_PER_SECOND", "0"))  # Generation speed (0 = unlimited)
+STUB_REPLY_WORDS = int(os.getenv("STUB_REPLY_WORDS", "0"))  # Pad replies to this length (plans run ~1500)
+STUB_EMBED_SECONDS = float(os.getenv("STUB_EMBED_SECONDS", "0"))  # Delay per embedding request (one batch)
+# Per-model overrides of STUB_TTFT_SECONDS, e.g. {"gemini-2.5-pro": 3.0} to make the router hedge
+STUB_MODEL_TTFT_SECONDS = {}
+STUB_SLOW_FRACTION = float(os.getenv("STUB_SLOW_FRACTION", "0"))  # Share of requests hit by tail latency (by hash)
+STUB_SLOW_FACTOR = 5.0  # Their time to first token is this many times longer
+
+# Agent Concurrency Settings (async API, see agent.py)
+AGENT_MAX_CONCURRENCY = int(os.getenv("AGENT_MAX_CONCURRENCY", "16"))  # Model calls in flight per process
+AGENT_TIMEOUT_SECONDS = float(os.getenv("AGENT_TIMEOUT_SECONDS", "120"))  # Deadline per call, queueing included
+
+# Model Router Settings (router.py; greetings and short questions go to the fast model)
+ROUTER_ENABLED = os.getenv("ROUTER_ENABLED", "1") != "0"  # Off: every turn uses MODEL_NAME / RAG_MODEL_NAME
+ROUTER_FAST_MODEL = "gemini-2.5-flash"  # Greetings and short questions
+ROUTER_FALLBACK_MODEL = "gemini-2.5-flash"  # Hedged request when the routed model is slow
+ROUTER_SHORT_MAX_WORDS = 25  # Longer messages (and Coach messages about plans) are full requests
+# Latency SLOs per route: time to first token for streamed replies, whole reply for blocking calls
+ROUTE_TTFT_SLO_SECONDS = {"greeting": 1.5, "short": 3.0, "full": 8.0}
+ROUTE_REPLY_SLO_SECONDS = {"greeting": 3.0, "short": 10.0, "full": 60.0}
+ROUTER_HEDGE_PERCENTILE = 95  # Hedge when the routed model is slower than this percentile of recent calls
+ROUTER_MIN_SAMPLES = 20  # Until a route has this many calls, hedge at ROUTER_HEDGE_FRACTION of its SLO
+ROUTER_HEDGE_FRACTION = 0.5
+ROUTER_DOWNGRADE_HEDGE_FRACTION = 0.9  # Full requests fall back to the weaker model only this close to the SLO
+ROUTER_LOG_FILE = os.getenv("ROUTER_LOG_FILE")  # JSON lines, one per routed request (unset = off)
+
+# Coach Settings
+# Compute BMR/TDEE/macros locally and inject them, instead of letting the model call the tools
+COACH_PRECOMPUTE_TOOLS = True
+DEFAULT_ACTIVITY_LEVEL = "moderate"  # The profile has no activity field yet (see tools.ACTIVITY_MULTIPLIERS)
+
+# Chat History Settings
+HISTORY_TOKEN_BUDGET = 6000  # Max (estimated) tokens of verbatim history sent per request
+HISTORY_KEEP_TURNS = 3  # Most recent user/assistant turns always kept verbatim (budget permitting)
+HISTORY_SUMMARY_STEP = 4  # Older messages are folded into the summary this many at a time
+
+# HTTP API Server Settings (server.py)
+SERVER_HOST = os.getenv("SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8000"))
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", str(os.cpu_count() or 1)))  # Processes, each with its own vector store and caches
+SERVER_MAX_UPLOAD_BYTES = 20 * 1024 * 1024  # Largest accepted (decoded) Calorie Vision file
+
+# Metrics Export Settings (Prometheus text format, see metrics.py; server.py also serves GET /metrics)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # Exporter port for the Streamlit app (0 = off)
+
+# Storage Settings (profiles + chat history, keyed by user/session ID)
+DB_FILE = "chat_history.db"  # SQLite store (WAL mode); name kept from the chat-only version
+DB_POOL_SIZE = 8  # Pooled SQLite connections shared by all sessions of a process
+DEFAULT_USER_ID = "default"  # Owner of rows from the single-user database table
+LEGACY_IMPORT = os.getenv("LEGACY_IMPORT", "0") == "1"  # Import the old single-user JSON files (left in place)
+LEGACY_USER_ID = os.getenv("LEGACY_USER_ID", "legacy")  # Their data is served under ?user=<this ID>
+LEGACY_PROFILE_FILE = "user_profile.json"  # Old single-user files
+LEGACY_CHAT_FILE = "chat_history.json"
+CHAT_WRITE_BATCH_SIZE = 100  # Max messages written per transaction by the background writer
+CHAT_LOAD_LIMIT = 200  # Most recent messages loaded per conversation when a session starts
+
+# Chat Rendering Settings (app.py)
+CHAT_PAGE_SIZE = 20  # Messages rendered per page; older pages load on demand
+CHAT_FULL_RENDER_MESSAGES = 4  # The most recent messages always render in full
+CHAT_PREVIEW_CHARS = 600  # Older messages longer than this show a preview until expanded
+UI_IMAGE_MAX_PX = 300  # Logos and avatars are downscaled once to fit this box (2x the largest display size)
+
+# Calorie Vision Settings
+VISION_MAX_DIMENSION = 1536  # Photos are downscaled so the longest side fits this (pixels)
+VISION_JPEG_QUALITY = 85  # Re-encode quality for uploaded photos
+VISION_CACHE_MAX_ENTRIES = 256  # Analyses cached by (image hash, prompt, user text)
+VISION_PDF_MIN_TEXT_CHARS = 40  # Pages with less extractable text are treated as scanned
+VISION_PDF_MAX_CHARS = 60000  # Cap on extracted menu text sent to the model
+VISION_PDF_PARALLEL_MIN_PAGES = 16  # Longer PDFs are extracted in a process pool
+
+# PDF Plan Settings
+PDF_WORKERS = 2  # Background threads rendering plan PDFs
+PDF_CACHE_MAX_ENTRIES = 32  # Rendered PDFs kept in memory (by reply hash)
+PDF_LOGO_MAX_PX = 300  # The header logo is downscaled once to fit this box
+
+# Vector Store Settings
+KNOWLEDGE_BASE_DIR = "knowledge_base"
+EMBEDDING_MODEL = "models/embedding-001"
+FAISS_INDEX_DIR = "faiss_index"
+# Written by ingest.py after every save; the app reloads the index when it changes
+INDEX_VERSION_FILE = "VERSION"
+# Per-file content hashes and chunk IDs, used by ingest.py to re-embed only changed PDFs
+MANIFEST_FILE = "manifest.json"
+# Serving index built by ingest.py: "flat" (exact), "ivf", "hnsw", "pq" (IVF + product quantization) or "fp16"
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat")
+FAISS_IVF_NLIST = 256  # IVF clusters (clamped to ~1 per 39 vectors for small knowledge bases)
+FAISS_IVF_NPROBE = 16  # Clusters searched per query (recall vs. latency)
+FAISS_HNSW_M = 32  # Graph neighbours per vector
+FAISS_HNSW_EF_SEARCH = 64  # Candidate list size per query (recall vs. latency)
+FAISS_PQ_M = 96  # PQ sub-vectors (must divide the embedding size, 768)
+FAISS_MMAP = True  # Memory-map the index and chunk store so worker processes share the pages
+
+# Retrieval Settings (General Fitness Chat, see retrieval.py)
+RETRIEVAL_K = 3  # Chunks put into the prompt
+RETRIEVAL_FETCH_K = 20  # Candidates taken from each of BM25 and FAISS before fusion
+RETRIEVAL_EMBED_TIMEOUT_SECONDS = 1.5  # Latency budget for the query embedding; keyword-only results after that
+RETRIEVAL_EMBED_WORKERS = 4  # Threads running query embeddings
+RRF_K = 60  # Reciprocal Rank Fusion constant (higher = flatter weighting of ranks)
+BM25_INDEX_FILE = "bm25.npz"  # Keyword index written by ingest.py inside FAISS_INDEX_DIR
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Context Packing Settings (General Chat prompt, see retrieval.pack_context)
+CONTEXT_PACKING = os.getenv("CONTEXT_PACKING", "1") != "0"  # Off: the top RETRIEVAL_K chunks, verbatim
+CONTEXT_CANDIDATES = 12  # Fused hits considered; the top RETRIEVAL_K are always kept
+# The labelled top RETRIEVAL_K alone is about 600-780 tokens on the bundled PDFs
+CONTEXT_TOKEN_BUDGET = 900  # Further hits are added while the context (labels included) stays under this
+CONTEXT_MMR_LAMBDA = 0.7  # Relevance vs. diversity (1 = rank by relevance only)
+
+# Semantic Cache Settings (General Fitness Chat)
+SEMANTIC_CACHE_THRESHOLD = 0.95  # Min cosine similarity between questions to reuse an answer
+SEMANTIC_CACHE_TTL_SECONDS = 24 * 60 * 60
+SEMANTIC_CACHE_MAX_ENTRIES = 1000  # Least recently used answers are evicted beyond this
+
+# Ingestion Parsing Settings
+PARSE_MAX_WORKERS = os.cpu_count() or 1  # Processes parsing PDF pages in parallel
+PARSE_PAGES_PER_TASK = 8  # Pages handed to a worker at a time (bounds memory per task)
+
+# Ingestion Embedding Settings
+EMBED_BATCH_SIZE = 64  # Chunks per embedding request
+EMBED_MAX_WORKERS = 4  # Concurrent embedding requests
+EMBED_MAX_RETRIES = 5  # Retries per batch when the API throttles us
+EMBED_BACKOFF_SECONDS = 1.0  # First retry delay, doubled on every attempt
+# Finished batches are checkpointed here so a crashed ingest resumes where it stopped
+EMBED_CHECKPOINT_DIR = ".ingest_checkpoints"
+
+# Embedding Cache Settings (ingest + queries, see embedding_cache.py)
+EMBED_CACHE_ENABLED = os.getenv("EMBED_CACHE_ENABLED", "1") != "0"
+EMBED_CACHE_DIR = ".embedding_cache"  # float16 vector files + SQLite key index
+EMBED_CACHE_MEMORY_ENTRIES = 2000  # Vectors kept in the in-memory LRU (~3 KB each)
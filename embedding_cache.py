@@ -0,0 +1,194 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import numpy as np
+from langchain_core.embeddings import Embeddings
+import cache
+import config
+import metrics
+
+try:
+    import fcntl  # Cross-process append lock (POSIX); on Windows only the thread lock applies
+except ImportError:
+    fcntl = None
+
+# ==========================================
+# PERSISTENT EMBEDDING CACHE ((provider, model, kind, text hash) -> vector)
+# ==========================================
+# Vectors live in an append-only float16 file per dimension that readers memory-map; a small
+# SQLite table maps each key to its row. An in-memory LRU sits in front, so repeat ingests and
+# repeat questions never reach the embedding API.
+
+INDEX_DB_FILE = "index.db"
+SQL_SCHEMA = "CREATE TABLE IF NOT EXISTS vectors (key TEXT PRIMARY KEY, dims INTEGER NOT NULL, row INTEGER NOT NULL)"
+SQL_INSERT = "INSERT OR IGNORE INTO vectors (key, dims, row) VALUES (?, ?, ?)"
+SQL_LOOKUP_BATCH = 500  # Keys per SELECT ... IN (...) (SQLite caps bound parameters)
+
+
+def cache_key(provider, model, kind, text):
+    """
+    provider: the Embeddings class name, so offline stub vectors never pass for real ones of the
+    same model. kind is "query" or "document": the API embeds the same text differently for each.
+    """
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return f"{provider}:{model}|{kind}|{digest}"
+
+
+class EmbeddingStore:
+    """Append-only memory-mapped float16 vector files with a SQLite key index; safe to share between processes."""
+    def __init__(self, directory=config.EMBED_CACHE_DIR):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self._db = sqlite3.connect(os.path.join(directory, INDEX_DB_FILE), timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(SQL_SCHEMA)
+        self._db.commit()
+        self._lock = threading.Lock()
+        self._maps = {}  # dims -> np.memmap of that dimension's vector file
+
+    def _path(self, dims):
+        return os.path.join(self.directory, f"vectors_{dims}.f16")
+
+    def _vectors(self, dims, row):
+        """The memory map for `dims`, re-mapped when the file has grown past the mapped rows."""
+        mapped = self._maps.get(dims)
+        if mapped is None or row >= len(mapped):
+            rows = os.path.getsize(self._path(dims)) // (dims * 2)
+            mapped = np.memmap(self._path(dims), dtype=np.float16, mode="r", shape=(rows, dims))
+            self._maps[dims] = mapped
+        return mapped
+
+    def get_many(self, keys):
+        """Returns {key: vector (list of floats)} for the keys that are stored."""
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), SQL_LOOKUP_BATCH):
+                batch = keys[start:start + SQL_LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._db.execute(
+                    f"SELECT key, dims, row FROM vectors WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, dims, row in rows:
+                    found[key] = self._vectors(dims, row)[row].astype(np.float32).tolist()
+        return found
+
+    def put_many(self, items):
+        """Stores (key, vector) pairs; vectors of one call must share a dimension."""
+        if not items:
+            return
+        vectors = np.asarray([vector for _, vector in items], dtype=np.float16)
+        dims = vectors.shape[1]
+        with self._lock, open(self._path(dims), "ab") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                # An interrupted write can leave a partial row at the end (never indexed):
+                # cut it off so new rows start on a row boundary
+                size = f.seek(0, os.SEEK_END)
+                first_row = size // (dims * 2)
+                if size != first_row * dims * 2:
+                    f.truncate(first_row * dims * 2)
+                f.write(vectors.tobytes())
+                f.flush()
+                with self._db:
+                    self._db.executemany(SQL_INSERT, [(key, dims, first_row + i) for i, (key, _) in enumerate(items)])
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps any LangChain Embeddings provider with the LRU + on-disk cache.
+    Only texts missing from both tiers are sent to the provider (in one batch per call).
+    """
+    def __init__(self, provider, model_name, store=None, memory_entries=config.EMBED_CACHE_MEMORY_ENTRIES):
+        self.provider = provider
+        self.model = model_name
+        self.provider_name = type(provider).__name__
+        self.store = store if store is not None else EmbeddingStore()
+        self.memory = cache.LRUCache(memory_entries, name="embedding_cache")
+        self.disk_hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def _lookup(self, keys):
+        vectors = {}
+        for key in keys:
+            vector = self.memory.get(key)
+            if vector is not None:
+                vectors[key] = vector.tolist()
+        missing = list(dict.fromkeys(key for key in keys if key not in vectors))
+        if missing:
+            on_disk = self.store.get_many(missing)
+            for key, vector in on_disk.items():
+                self.memory.put(key, np.asarray(vector, dtype=np.float32))
+            vectors.update(on_disk)
+            with self._stats_lock:
+                self.disk_hits += len(on_disk)
+                self.misses += len(missing) - len(on_disk)
+            metrics.increment("embedding_cache_disk_hits", len(on_disk))
+            metrics.increment("embedding_cache_api_texts", len(missing) - len(on_disk))
+        return vectors
+
+    def _remember(self, keys, vectors):
+        for key, vector in zip(keys, vectors):
+            # Kept as float32 arrays: a list of 768 Python floats costs ~8x the memory
+            self.memory.put(key, np.asarray(vector, dtype=np.float32))
+        self.store.put_many(list(zip(keys, vectors)))
+
+    def embed_documents(self, texts):
+        keys = [cache_key(self.provider_name, self.model, "document", text) for text in texts]
+        vectors = self._lookup(keys)
+
+        # Embed each missing text once, even if it repeats within the batch
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                missing.setdefault(key, text)
+        if missing:
+            new_vectors = self.provider.embed_documents(list(missing.values()))
+            self._remember(list(missing), new_vectors)
+            vectors.update(zip(missing, new_vectors))
+        return [vectors[key] for key in keys]
+
+    def embed_query(self, text):
+        key = cache_key(self.provider_name, self.model, "query", text)
+        vector = self._lookup([key]).get(key)
+        if vector is None:
+            vector = self.provider.embed_query(text)
+            self._remember([key], [vector])
+        return vector
+
+    def stats(self):
+        memory = self.memory.stats()
+        lookups = memory["hits"] + memory["misses"]
+        return {
+            "memory_hits": memory["hits"],
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (lookups - self.misses) / lookups if lookups else 0.0,
+            "memory_entries": memory["entries"],
+        }
+
+
+def create_embeddings(model=config.EMBEDDING_MODEL, provider=None):
+    """
+    The embedding provider used by ingest.py and the app: Gemini (or the offline stub, see
+    config.MODEL_BACKEND), behind the persistent cache unless EMBED_CACHE_ENABLED is off.
+    """
+    if provider is None:
+        if config.MODEL_BACKEND == "stub":
+            import stubs
+            provider = stubs.StubEmbeddings(model=model)
+        else:
+            from langchain_google_genai import GoogleGenerativeAIEmbeddings
+            provider = GoogleGenerativeAIEmbeddings(model=model)
+    if not config.EMBED_CACHE_ENABLED:
+        return provider
+    return CachedEmbeddings(provider, model)
@@ -0,0 +1,93 @@
+import hashlib
+import config
+import metrics
+
+# ==========================================
+# CHAT HISTORY WINDOWING (Token budget + rolling summary)
+# ==========================================
+# Rough English average; good enough to keep prompts inside a budget without a tokenizer call
+CHARS_PER_TOKEN = 4
+
+SUMMARY_PREFIX = "Summary of our earlier conversation:\n"
+SUMMARY_ACK = "Understood. I'll keep that context in mind."
+
+
+def estimate_tokens(text):
+    """Cheap token estimate for budgeting (about 4 characters per token)."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def to_gemini(message):
+    """Converts one Streamlit message ({"role", "content"}) into Gemini format."""
+    role = "model" if message["role"] == "assistant" else "user"
+    return {"role": role, "parts": [message["content"]]}
+
+
+def _anchor(messages, upto):
+    """Fingerprint of the last summarized message, to notice when the conversation was replaced."""
+    if upto == 0:
+        return ""
+    return hashlib.sha1(messages[upto - 1]["content"].encode("utf-8")).hexdigest()
+
+
+def _window_start(messages, token_budget, keep_turns, step):
+    """Index of the first message sent verbatim; everything before it is summarized."""
+    cut = max(0, len(messages) - keep_turns * 2)
+    # Move the window in steps so the summary is not recomputed on every single turn
+    cut -= cut % step
+
+    # Even the recent turns can be huge (full plans): shrink a step at a time until they fit the budget
+    tail_tokens = sum(estimate_tokens(m["content"]) for m in messages[cut:])
+    while cut < len(messages) - 1 and tail_tokens > token_budget:
+        next_cut = min(cut + step, len(messages) - 1)
+        tail_tokens -= sum(estimate_tokens(m["content"]) for m in messages[cut:next_cut])
+        cut = next_cut
+
+    # Start the verbatim part on a user turn, so the summary's model acknowledgment is not
+    # followed by another model message
+    while 0 < cut < len(messages) - 1 and messages[cut]["role"] != "user":
+        cut += 1
+    return cut
+
+
+def build_history(messages, summary_state, summarize,
+                  token_budget=config.HISTORY_TOKEN_BUDGET,
+                  keep_turns=config.HISTORY_KEEP_TURNS,
+                  step=config.HISTORY_SUMMARY_STEP):
+    """
+    Builds the Gemini history for a conversation: a rolling summary of older turns,
+    followed by the most recent turns verbatim, so prompt size stays flat as the chat grows.
+    Args:
+        messages (list): Streamlit-style messages [{"role": ..., "content": ...}].
+        summary_state (dict): Per-conversation cache, updated in place ({"upto", "anchor", "summary"}).
+        summarize (callable): summarize(previous_summary, new_messages) -> str.
+            Only called when the window moves past messages that are not summarized yet.
+    """
+    cut = _window_start(messages, token_budget, keep_turns, step)
+
+    # The conversation was reset or replaced: drop the cached summary
+    upto = summary_state.get("upto", 0)
+    if upto > len(messages) or summary_state.get("anchor", "") != _anchor(messages, upto):
+        summary_state.clear()
+        upto = 0
+
+    if cut > upto:
+        try:
+            summary_state["summary"] = summarize(summary_state.get("summary", ""), messages[upto:cut])
+            summary_state["upto"] = cut
+            summary_state["anchor"] = _anchor(messages, cut)
+            upto = cut
+            metrics.increment("history_summaries")
+        except Exception as e:
+            # Keep the old summary and send the unsummarized messages verbatim instead
+            print(f"⚠️ History summary skipped: {e}")
+
+    history = []
+    summary = summary_state.get("summary", "")
+    if summary and upto:
+        history.append({"role": "user", "parts": [SUMMARY_PREFIX + summary]})
+        history.append({"role": "model", "parts": [SUMMARY_ACK]})
+    history.extend(to_gemini(m) for m in messages[upto:])
+
+    metrics.record("history_tokens", sum(estimate_tokens(part) for msg in history for part in msg["parts"]))
+    return history
@@ -1,44 +1,408 @@
+import argparse
+import hashlib
+import json
 import os
-from langchain_community.document_loaders import PyPDFDirectoryLoader
+import random
+import shutil
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from langchain_core.documents import Document
+from pypdf import PdfReader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain_community.vectorstores import FAISS
 from dotenv import load_dotenv
+import config
+import embedding_cache
+import retrieval
+import vectorstore
 
 # Load API Key
 load_dotenv()
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
-def create_vector_db():
-    print("🔄 Loading PDFs from 'knowledge_base' folder...")
-    
-    # 1. Load PDFs
-    loader = PyPDFDirectoryLoader("knowledge_base")
-    documents = loader.load()
-    
-    if not documents:
-        print("❌ No PDFs found! Please add files to 'knowledge_base/'.")
+# ==========================================
+# 1. MANIFEST (What is already in the index?)
+# ==========================================
+def file_hash(path):
+    """Returns the SHA-256 of a file's contents (read in blocks, so big PDFs stay cheap)."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def scan_knowledge_base(kb_dir=config.KNOWLEDGE_BASE_DIR):
+    """Maps every PDF in the knowledge base (relative name) to its content hash."""
+    files = {}
+    if not os.path.isdir(kb_dir):
+        return files
+    for root, _, names in os.walk(kb_dir):
+        for name in sorted(names):
+            if name.lower().endswith(".pdf"):
+                path = os.path.join(root, name)
+                rel_name = os.path.relpath(path, kb_dir).replace(os.sep, "/")
+                files[rel_name] = file_hash(path)
+    return files
+
+def load_manifest(index_dir=config.FAISS_INDEX_DIR):
+    """
+    Reads the manifest written next to the index.
+    Format: {"files": {"<name>.pdf": {"sha256": "...", "chunk_ids": ["..."]}}}
+    """
+    manifest_path = os.path.join(index_dir, config.MANIFEST_FILE)
+    if os.path.exists(manifest_path):
+        try:
+            with open(manifest_path, "r") as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"⚠️ Could not read manifest, rebuilding: {e}")
+    return None
+
+# ==========================================
+# 2. LOAD & SPLIT (Streamed, parsed in a process pool)
+# ==========================================
+def _parse_page_range(path, start, end):
+    """Worker: extracts the text of pages [start, end) of one PDF."""
+    reader = PdfReader(path)
+    total_pages = len(reader.pages)
+    # pypdf builds the whole label list on every access: read it once per range
+    try:
+        labels = reader.page_labels
+    except Exception:
+        labels = []
+    pages = []
+    for page_no in range(start, min(end, total_pages)):
+        label = labels[page_no] if page_no < len(labels) else str(page_no + 1)
+        pages.append(Document(
+            page_content=reader.pages[page_no].extract_text() or "",
+            metadata={"source": path, "page": page_no, "page_label": label, "total_pages": total_pages},
+        ))
+    return pages
+
+def iter_pdf_pages(paths, max_workers=config.PARSE_MAX_WORKERS,
+                   pages_per_task=config.PARSE_PAGES_PER_TASK):
+    """
+    Yields (path, page Document) for every page of every PDF, in file and page order.
+    Page ranges are parsed in a process pool; only a bounded number of ranges is in flight,
+    so peak memory does not grow with the size of the knowledge base.
+    """
+    def tasks():
+        for path in paths:
+            page_count = len(PdfReader(path).pages)
+            for start in range(0, page_count, pages_per_task):
+                yield path, start, start + pages_per_task
+
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        for path, start, end in tasks():
+            pending.append((path, pool.submit(_parse_page_range, path, start, end)))
+            if len(pending) >= max_workers * 2:
+                done_path, future = pending.popleft()
+                for page in future.result():
+                    yield done_path, page
+        while pending:
+            done_path, future = pending.popleft()
+            for page in future.result():
+                yield done_path, page
+
+def chunk_id_prefix(name, digest):
+    """
+    16 hex characters from the PDF's name and content hash: identical copies under different
+    names get their own chunk IDs, so removing one copy never deletes the other's chunks.
+    """
+    return hashlib.sha256(f"{name}\0{digest}".encode("utf-8")).hexdigest()[:16]
+
+def iter_chunks(files, text_splitter, on_file_done=None):
+    """
+    Streams pages into the splitter and yields (chunk_id, chunk) pairs as they are produced.
+    Chunk IDs are "<file key>-<n>" (see chunk_id_prefix), so the manifest can delete them later.
+    Args:
+        files (dict): Relative PDF name -> content hash, for the PDFs to (re-)ingest.
+        on_file_done (callable): Called with (name, chunk_ids) once a PDF is fully split.
+    """
+    names = {os.path.join(config.KNOWLEDGE_BASE_DIR, name): name for name in files}
+    current_path, chunk_ids = None, []
+
+    def finish():
+        if current_path is not None:
+            name = names[current_path]
+            if chunk_ids:
+                print(f"🧩 Split '{name}' into {len(chunk_ids)} chunks.")
+            else:
+                print(f"⚠️ No text found in '{name}', skipping.")
+            if on_file_done:
+                on_file_done(name, chunk_ids)
+
+    for path, page in iter_pdf_pages(list(names)):
+        if path != current_path:
+            finish()
+            current_path, chunk_ids = path, []
+        prefix = chunk_id_prefix(names[path], files[names[path]])
+        for chunk in text_splitter.split_documents([page]):
+            chunk_id = f"{prefix}-{len(chunk_ids)}"
+            chunk_ids.append(chunk_id)
+            yield chunk_id, chunk
+    finish()
+
+# ==========================================
+# 3. EMBED (Batched, concurrent & resumable)
+# ==========================================
+THROTTLE_MARKERS = ("429", "resourceexhausted", "resource exhausted", "quota", "rate limit",
+                    "503", "unavailable", "deadline")
+
+def is_throttling_error(error):
+    """True for errors worth retrying (rate limits, quota, transient unavailability)."""
+    text = f"{type(error).__name__} {error}".lower()
+    return any(marker in text for marker in THROTTLE_MARKERS)
+
+def embed_batch(embeddings, texts, max_retries=config.EMBED_MAX_RETRIES,
+                backoff_seconds=config.EMBED_BACKOFF_SECONDS):
+    """Embeds one batch, retrying with exponential backoff (plus jitter) when throttled."""
+    for attempt in range(max_retries + 1):
+        try:
+            return embeddings.embed_documents(texts)
+        except Exception as e:
+            if attempt == max_retries or not is_throttling_error(e):
+                raise
+            delay = backoff_seconds * (2 ** attempt) * (1 + random.random())
+            print(f"⏳ Throttled ({e}); retrying batch in {delay:.1f}s...")
+            time.sleep(delay)
+
+class EmbeddingCheckpoint:
+    """
+    Stores the vectors of finished batches on disk, keyed by a hash of the model and batch texts.
+    Re-running after a crash reloads those batches instead of calling the API again.
+    """
+    def __init__(self, directory=config.EMBED_CHECKPOINT_DIR, model_name=""):
+        self.directory = directory
+        self.model_name = model_name
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, texts):
+        digest = hashlib.sha256(self.model_name.encode("utf-8"))
+        for text in texts:
+            digest.update(b"\x00")
+            digest.update(text.encode("utf-8"))
+        return digest.hexdigest()
+
+    def load(self, key):
+        path = os.path.join(self.directory, key + ".json")
+        if os.path.exists(path):
+            try:
+                with open(path, "r") as f:
+                    return json.load(f)
+            except Exception:
+                return None  # Half-written file from a crash: embed it again
+        return None
+
+    def save(self, key, vectors):
+        path = os.path.join(self.directory, key + ".json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(vectors, f)
+        os.replace(path + ".tmp", path)
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+def _batched(items, batch_size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def embed_in_batches(items, embeddings, batch_size=config.EMBED_BATCH_SIZE,
+                     max_workers=config.EMBED_MAX_WORKERS, checkpoint=None, stats=None):
+    """
+    Embeds (chunk_id, Document) pairs in batches on a bounded worker pool.
+    Args:
+        items (iterable): (chunk_id, Document) pairs; consumed lazily, so it can be a stream.
+        embeddings: Any object with embed_documents(texts) (the Google client or a local fake).
+        checkpoint (EmbeddingCheckpoint): Optional on-disk store of finished batches.
+        stats (dict): Optional dict that receives chunk counts and chunks-per-second.
+    Yields:
+        (ids, documents, vectors) per batch, in input order.
+    """
+    stats = stats if stats is not None else {}
+    stats.update({"chunks": 0, "from_checkpoint": 0, "seconds": 0.0, "chunks_per_sec": 0.0})
+    start = time.perf_counter()
+
+    def run(batch):
+        ids = [chunk_id for chunk_id, _ in batch]
+        docs = [doc for _, doc in batch]
+        texts = [doc.page_content for doc in docs]
+        key = checkpoint.key(texts) if checkpoint else None
+        vectors = checkpoint.load(key) if checkpoint else None
+        cached = vectors is not None
+        if not cached:
+            vectors = embed_batch(embeddings, texts)
+            if checkpoint:
+                checkpoint.save(key, vectors)
+        return ids, docs, vectors, cached
+
+    def collect(future):
+        ids, docs, vectors, cached = future.result()
+        stats["chunks"] += len(ids)
+        if cached:
+            stats["from_checkpoint"] += len(ids)
+        return ids, docs, vectors
+
+    # Keep at most 2 batches per worker in flight so a huge stream never piles up in memory
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for batch in _batched(items, batch_size):
+            pending.append(pool.submit(run, batch))
+            if len(pending) >= max_workers * 2:
+                yield collect(pending.popleft())
+        while pending:
+            yield collect(pending.popleft())
+
+    stats["seconds"] = time.perf_counter() - start
+    if stats["seconds"] > 0:
+        stats["chunks_per_sec"] = stats["chunks"] / stats["seconds"]
+
+def add_embedded_batch(vector_store, ids, docs, vectors, embeddings):
+    """Adds pre-computed vectors to the store (creating it on the first batch)."""
+    text_embeddings = list(zip([doc.page_content for doc in docs], vectors))
+    metadatas = [doc.metadata for doc in docs]
+    if vector_store is None:
+        return FAISS.from_embeddings(text_embeddings, embeddings, metadatas=metadatas, ids=ids)
+    vector_store.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+    return vector_store
+
+# ==========================================
+# 4. SAVE (Swap files in, then bump VERSION)
+# ==========================================
+def save_vector_store(vector_store, manifest=None, index_dir=config.FAISS_INDEX_DIR,
+                      index_type=config.FAISS_INDEX_TYPE):
+    """
+    Saves the index, its BM25 keyword index (and manifest) next to the live one, swaps the files in, then bumps the VERSION file.
+    Running app processes compare VERSION on each query and reload only when it changes.
+    Files are replaced (not rewritten in place), so processes that memory-mapped the old ones keep a consistent view.
+    """
+    tmp_dir = index_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    vectorstore.save(vector_store, tmp_dir, index_type)
+    # Keyword index over the same chunks, for hybrid retrieval (see retrieval.py)
+    retrieval.build_keyword_index(vector_store).save(retrieval.keyword_index_path(tmp_dir))
+    if manifest is not None:
+        manifest["index_type"] = index_type
+        with open(os.path.join(tmp_dir, config.MANIFEST_FILE), "w") as f:
+            json.dump(manifest, f, indent=4)
+
+    os.makedirs(index_dir, exist_ok=True)
+    for name in os.listdir(tmp_dir):
+        os.replace(os.path.join(tmp_dir, name), os.path.join(index_dir, name))
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    # Drop what this save did not write (the old pickle docstore, an approximate index no longer wanted)
+    for name in vectorstore.stale_files(index_type):
+        try:
+            os.remove(os.path.join(index_dir, name))
+        except FileNotFoundError:
+            pass
+
+    # Write the version last (atomically) so readers never see a new version with old files
+    version_path = os.path.join(index_dir, config.INDEX_VERSION_FILE)
+    with open(version_path + ".tmp", "w") as f:
+        f.write(str(time.time_ns()))
+    os.replace(version_path + ".tmp", version_path)
+
+# ==========================================
+# 5. INCREMENTAL BUILD
+# ==========================================
+def create_vector_db(rebuild=False, embeddings=None, index_type=config.FAISS_INDEX_TYPE):
+    """
+    Brings the FAISS index in line with the 'knowledge_base' folder.
+    Only new or modified PDFs are parsed and embedded; vectors of removed PDFs are deleted.
+    Args:
+        rebuild (bool): Ignore the manifest and re-embed everything from scratch.
+        embeddings: Embedding backend; defaults to embedding_cache.create_embeddings() (pass a fake for tests).
+        index_type (str): Serving index to build (see vectorstore.INDEX_TYPES).
+    """
+    print(f"🔄 Scanning PDFs in '{config.KNOWLEDGE_BASE_DIR}' folder...")
+    current_files = scan_knowledge_base()
+
+    manifest = None if rebuild else load_manifest()
+    index_exists = os.path.exists(os.path.join(config.FAISS_INDEX_DIR, vectorstore.INDEX_FILE))
+    if manifest is None or not index_exists:
+        # No manifest (or an index built before manifests existed): start from scratch
+        manifest = {"files": {}}
+    known_files = manifest["files"]
+
+    added = [name for name in current_files if name not in known_files]
+    changed = [name for name in current_files
+               if name in known_files and known_files[name]["sha256"] != current_files[name]]
+    removed = [name for name in known_files if name not in current_files]
+
+    if not current_files and not known_files:
+        print(f"❌ No PDFs found! Please add files to '{config.KNOWLEDGE_BASE_DIR}/'.")
         return
+    if not (added or changed or removed):
+        if manifest.get("index_type", "flat") != index_type:
+            # Same chunks, different index type: rebuild the serving index without re-embedding
+            vector_store = vectorstore.load_for_update(config.FAISS_INDEX_DIR, embeddings)
+            save_vector_store(vector_store, manifest, index_type=index_type)
+            print(f"💾 Rebuilt the '{index_type}' index over {vector_store.index.ntotal} chunks.")
+            return
+        print("✅ Vector Database is already up to date.")
+        return
+
+    print(f"📄 {len(added)} new, {len(changed)} modified, {len(removed)} removed PDF(s).")
 
-    print(f"✅ Loaded {len(documents)} document pages.")
+    if embeddings is None:
+        # Cached by content hash: chunks embedded by any earlier run never reach the API again
+        embeddings = embedding_cache.create_embeddings(config.EMBEDDING_MODEL)
+    vector_store = None
+    if known_files:
+        vector_store = vectorstore.load_for_update(config.FAISS_INDEX_DIR, embeddings)
+
+    # 1. Drop vectors that belong to modified or removed PDFs
+    stale_ids = []
+    for name in changed + removed:
+        stale_ids.extend(known_files.pop(name)["chunk_ids"])
+    if stale_ids:
+        vector_store.delete(stale_ids)
+        print(f"🗑️ Removed {len(stale_ids)} stale chunks.")
 
     # 2. Split Text into Chunks (bite-sized pieces for the AI)
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=1000,
         chunk_overlap=200
     )
-    chunks = text_splitter.split_documents(documents)
-    print(f"🧩 Split into {len(chunks)} text chunks.")
 
-    # 3. Create Embeddings & Vector Store
+    def record_file(name, chunk_ids):
+        # PDFs without text (scanned, empty) are recorded too, so they are not re-parsed every run
+        known_files[name] = {"sha256": current_files[name], "chunk_ids": chunk_ids}
+
+    # 3. Create Embeddings for new/modified PDFs only & merge into the Vector Store
     print("🔮 Generating Embeddings (this may take a moment)...")
-    embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-    
-    vector_store = FAISS.from_documents(chunks, embeddings)
+    checkpoint = EmbeddingCheckpoint(model_name=str(getattr(embeddings, "model", "")))
+    stats = {}
+    to_ingest = {name: current_files[name] for name in added + changed}
+    chunk_stream = iter_chunks(to_ingest, text_splitter, on_file_done=record_file)
+    for ids, docs, vectors in embed_in_batches(chunk_stream, embeddings, checkpoint=checkpoint, stats=stats):
+        vector_store = add_embedded_batch(vector_store, ids, docs, vectors, embeddings)
+    print(f"⚡ Embedded {stats['chunks']} chunks in {stats['seconds']:.1f}s "
+          f"({stats['chunks_per_sec']:.1f} chunks/sec, {stats['from_checkpoint']} resumed from checkpoint).")
+
+    if vector_store is None:
+        print("❌ No text could be extracted from the PDFs in the knowledge base.")
+        return
 
     # 4. Save to Disk
-    vector_store.save_local("faiss_index")
-    print("💾 Success! Vector Database saved to 'faiss_index' folder.")
+    save_vector_store(vector_store, manifest, index_type=index_type)
+    checkpoint.clear()
+    print(f"💾 Success! Vector Database saved to '{config.FAISS_INDEX_DIR}' folder "
+          f"({vector_store.index.ntotal} chunks).")
 
 if __name__ == "__main__":
-    create_vector_db()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Build or update the RAG vector database.")
+    parser.add_argument("--rebuild", action="store_true", help="Re-embed every PDF from scratch.")
+    parser.add_argument("--index-type", choices=vectorstore.INDEX_TYPES, default=config.FAISS_INDEX_TYPE,
+                        help="Serving index to build (default: FAISS_INDEX_TYPE).")
+    args = parser.parse_args()
+    create_vector_db(rebuild=args.rebuild, index_type=args.index_type)
@@ -0,0 +1,227 @@
+import contextlib
+import functools
+import inspect
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import config
+
+# ==========================================
+# IN-PROCESS METRICS (Latency samples & counters)
+# ==========================================
+# Keep only the most recent samples per metric so memory stays flat in long-running processes
+MAX_SAMPLES = 1000
+QUANTILES = (50, 95, 99)
+
+_lock = threading.Lock()
+_samples = defaultdict(lambda: deque(maxlen=MAX_SAMPLES))
+_totals = defaultdict(lambda: [0, 0.0])  # name -> [count, sum] over the whole process lifetime
+_counters = defaultdict(float)
+
+
+def record(name, value):
+    """Records one sample (e.g. a latency in seconds) for the metric `name`."""
+    with _lock:
+        _samples[name].append(float(value))
+        totals = _totals[name]
+        totals[0] += 1
+        totals[1] += float(value)
+
+
+def increment(name, amount=1):
+    """Adds `amount` to the counter `name`."""
+    with _lock:
+        _counters[name] += amount
+
+
+def _percentile(sorted_values, pct):
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def snapshot():
+    """
+    Returns a summary of everything recorded so far.
+    Format: {"counters": {name: value}, "samples": {name: {"count", "last", "p50", "p95", "p99"}}}
+    """
+    with _lock:
+        counters = dict(_counters)
+        samples = {name: list(values) for name, values in _samples.items()}
+
+    summary = {}
+    for name, values in samples.items():
+        if not values:
+            continue
+        ordered = sorted(values)
+        summary[name] = {"count": len(values), "last": values[-1]}
+        summary[name].update({f"p{pct}": _percentile(ordered, pct) for pct in QUANTILES})
+    return {"counters": counters, "samples": summary}
+
+
+def reset():
+    """Clears all metrics (used by benchmarks between runs)."""
+    with _lock:
+        _samples.clear()
+        _totals.clear()
+        _counters.clear()
+
+
+# ==========================================
+# SPANS (Local registry, plus nested Langfuse observations when configured)
+# ==========================================
+_langfuse = None
+
+
+def _langfuse_client():
+    """The Langfuse client if keys are configured, else None."""
+    global _langfuse
+    if not (config.LANGFUSE_PUBLIC_KEY and config.LANGFUSE_SECRET_KEY):
+        return None
+    if _langfuse is None:
+        from langfuse import get_client
+        _langfuse = get_client()
+    return _langfuse
+
+
+def _in_trace():
+    # Spans outside a trace (e.g. on a worker thread) stay local instead of starting stray traces
+    from opentelemetry import trace
+    return trace.get_current_span().get_span_context().is_valid
+
+
+@contextlib.contextmanager
+def span(name, as_type="span", **attributes):
+    """
+    Times a stage: records `<name>_seconds` locally and, when Langfuse is configured and a
+    trace is active (an @observe call), opens a nested observation of type `as_type`.
+    Yields the observation (None when local only) so callers can attach output or usage.
+    """
+    start = time.perf_counter()
+    try:
+        client = _langfuse_client()
+        if client is None or not _in_trace():
+            yield None
+        else:
+            with client.start_as_current_observation(name=name, as_type=as_type, **attributes) as observation:
+                yield observation
+    finally:
+        record(f"{name}_seconds", time.perf_counter() - start)
+
+
+def observe(**kwargs):
+    """
+    langfuse.observe(**kwargs), resolved on the first call of the decorated function instead of
+    at import time (importing Langfuse costs about half a second of startup).
+    """
+    def decorator(fn):
+        traced = None
+
+        def resolve():
+            nonlocal traced
+            if traced is None:
+                from langfuse import observe as langfuse_observe
+                traced = langfuse_observe(**kwargs)(fn)
+            return traced
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **call_kwargs):
+                return await resolve()(*args, **call_kwargs)
+            return async_wrapper
+
+        if inspect.isgeneratorfunction(fn):
+            # Stays a generator function, so callers can tell a stream from a reply
+            @functools.wraps(fn)
+            def generator_wrapper(*args, **call_kwargs):
+                yield from resolve()(*args, **call_kwargs)
+            return generator_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **call_kwargs):
+            return resolve()(*args, **call_kwargs)
+        return wrapper
+    return decorator
+
+
+def record_usage(prefix, usage_metadata, observation=None):
+    """Counts a Gemini response's prompt and completion tokens (as `<prefix>_prompt_tokens` etc.)."""
+    if usage_metadata is None:
+        return
+    usage = {
+        "input": int(getattr(usage_metadata, "prompt_token_count", 0) or 0),
+        "output": int(getattr(usage_metadata, "candidates_token_count", 0) or 0),
+    }
+    increment(f"{prefix}_prompt_tokens", usage["input"])
+    increment(f"{prefix}_completion_tokens", usage["output"])
+    if observation is not None:
+        observation.update(usage_details=usage)
+
+
+# ==========================================
+# PROMETHEUS EXPORT (Text exposition format)
+# ==========================================
+PROMETHEUS_PREFIX = "omny_"
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _prometheus_name(name):
+    return PROMETHEUS_PREFIX + re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+def prometheus_text():
+    """
+    All metrics in the Prometheus text format: counters as `<name>_total`, samples as summaries
+    (p50/p95/p99 over the recent window, plus lifetime _sum and _count).
+    """
+    with _lock:
+        counters = dict(_counters)
+        samples = {name: sorted(values) for name, values in _samples.items() if values}
+        totals = {name: tuple(values) for name, values in _totals.items()}
+
+    lines = []
+    for name, value in sorted(counters.items()):
+        metric = _prometheus_name(name)
+        lines += [f"# TYPE {metric}_total counter", f"{metric}_total {value:g}"]
+    for name, ordered in sorted(samples.items()):
+        metric = _prometheus_name(name)
+        lines.append(f"# TYPE {metric} summary")
+        lines += [f'{metric}{{quantile="{pct / 100:g}"}} {_percentile(ordered, pct):.6g}' for pct in QUANTILES]
+        count, total = totals[name]
+        lines += [f"{metric}_sum {total:.6g}", f"{metric}_count {count}"]
+    return "\n".join(lines) + "\n"
+
+
+class _PrometheusHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes every few seconds would flood the console
+
+
+_exporter = None
+_exporter_lock = threading.Lock()
+
+
+def start_exporter(port=config.METRICS_PORT, host=config.METRICS_HOST):
+    """
+    Serves prometheus_text() on http://host:port/ from a daemon thread (once per process).
+    For the Streamlit app, which has no HTTP endpoint of its own; server.py serves /metrics itself.
+    """
+    global _exporter
+    with _exporter_lock:
+        if _exporter is None and port:
+            try:
+                _exporter = ThreadingHTTPServer((host, port), _PrometheusHandler)
+            except OSError as e:
+                print(f"⚠️ Metrics exporter not started on port {port}: {e}")
+                return None
+            threading.Thread(target=_exporter.serve_forever, name="metrics-exporter", daemon=True).start()
+    return _exporter
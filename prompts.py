@@ -20,6 +20,14 @@ You are Omny AI, an elite Biomechanics Coach and Nutritionist.
 **IMPORTANT:** Always output text explanations. Never return just a function result.
 """
 
+# 1b. COACH PRECOMPUTED NUMBERS (appended to the profile when config.COACH_PRECOMPUTE_TOOLS is on)
+PRECOMPUTED_NUMBERS_PROMPT = """
+    PRECOMPUTED NUMBERS (already calculated with calculate_bmr / calculate_macros; use them as-is, no tool calls needed):
+    - BMR: {bmr} kcal/day
+    - TDEE ({activity_level} activity, x{multiplier}): {tdee} kcal/day
+    - Macros: Protein {protein}g, Fats {fats}g, Carbs {carbs}g
+"""
+
 # 2. GENERAL CHAT PROMPT
 GENERAL_SYSTEM_PROMPT = """
 You are Omny AI, an elite Biomechanics Coach and PhD Nutritionist.
@@ -77,4 +85,22 @@ You are Omny AI, an elite Biomechanics Coach and PhD Nutritionist.
 
 **TONE:**
 Professional, grounded in science, and encouraging.
-"""
\ No newline at end of file
+"""
+
+# 6. CHAT HISTORY SUMMARY PROMPT
+HISTORY_SUMMARY_PROMPT = """
+You maintain the running memory of a conversation between a user and Omny AI (a fitness coach).
+Update the summary below with the new messages.
+
+**KEEP:** The user's stats, goals, injuries and preferences, every number you were given or calculated
+(BMR, calories, macros), the structure of any plan that was delivered (phases, split, key exercises),
+and open questions or requests.
+**DROP:** Greetings, filler and repeated explanations.
+Write at most 250 words of plain bullet points.
+
+CURRENT SUMMARY:
+{previous_summary}
+
+NEW MESSAGES:
+{transcript}
+"""
@@ -0,0 +1,414 @@
+import copy
+import math
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+import numpy as np
+from langchain_core.documents import Document
+import config
+import history
+import metrics
+
+# ==========================================
+# KEYWORD INDEX (BM25, built by ingest.py next to the FAISS files)
+# ==========================================
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+MAX_TOKEN_CHARS = 32  # Longer "words" (URLs, hashes) are dropped so the term array stays compact
+STOPWORDS = frozenset("""
+a an and are as at be but by can do does for from has have how i if in into is it its me my
+no not of on or our should so than that the their them then there these they this to was
+we were what when where which who why will with would you your
+""".split())
+
+
+def tokenize(text):
+    """Lowercased alphanumeric terms without stopwords (the same rules for chunks and queries)."""
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if 1 < len(t) <= MAX_TOKEN_CHARS and t not in STOPWORDS]
+
+
+def _pack_strings(values):
+    return np.frombuffer("\n".join(values.tolist()).encode("utf-8"), dtype=np.uint8)
+
+
+def _unpack_strings(blob):
+    text = blob.tobytes().decode("utf-8")
+    return np.array(text.split("\n") if text else [], dtype=str)
+
+
+class BM25Index:
+    """
+    Okapi BM25 over the FAISS docstore chunks, stored as a compact inverted index:
+    a sorted term array with posting offsets, and flat posting arrays (chunk number, term frequency).
+    """
+    def __init__(self, doc_ids, terms, offsets, postings_doc, postings_tf, doc_lengths,
+                 k1=config.BM25_K1, b=config.BM25_B):
+        self.doc_ids = doc_ids  # chunk number -> docstore ID
+        self.terms = terms
+        self.offsets = offsets
+        self.postings_doc = postings_doc
+        self.postings_tf = postings_tf
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+        self._term_index = {term: i for i, term in enumerate(terms.tolist())}
+        self._avg_length = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+
+    @classmethod
+    def build(cls, items):
+        """items: iterable of (docstore ID, text)."""
+        doc_ids, doc_lengths, postings = [], [], {}
+        for number, (doc_id, text) in enumerate(items):
+            tokens = tokenize(text)
+            doc_ids.append(doc_id)
+            doc_lengths.append(len(tokens))
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, count in counts.items():
+                postings.setdefault(token, []).append((number, count))
+
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        postings_doc, postings_tf = [], []
+        for i, term in enumerate(terms):
+            for number, count in postings[term]:
+                postings_doc.append(number)
+                postings_tf.append(min(count, np.iinfo(np.uint16).max))
+            offsets[i + 1] = len(postings_doc)
+
+        return cls(
+            np.array(doc_ids, dtype=str), np.array(terms, dtype=str), offsets,
+            np.array(postings_doc, dtype=np.int32), np.array(postings_tf, dtype=np.uint16),
+            np.array(doc_lengths, dtype=np.int32),
+        )
+
+    def save(self, path):
+        # Strings are stored as one newline-joined UTF-8 blob (fixed-width arrays would pad every term)
+        np.savez_compressed(
+            path, doc_ids=_pack_strings(self.doc_ids), terms=_pack_strings(self.terms), offsets=self.offsets,
+            postings_doc=self.postings_doc, postings_tf=self.postings_tf, doc_lengths=self.doc_lengths,
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(_unpack_strings(data["doc_ids"]), _unpack_strings(data["terms"]), data["offsets"],
+                       data["postings_doc"], data["postings_tf"], data["doc_lengths"])
+
+    def search(self, query, k):
+        """Returns up to k (docstore ID, score) pairs, best first."""
+        if not len(self.doc_ids):
+            return []
+        scores = np.zeros(len(self.doc_ids), dtype=np.float32)
+        n_docs = len(self.doc_ids)
+        for term in set(tokenize(query)):
+            i = self._term_index.get(term)
+            if i is None:
+                continue
+            start, end = self.offsets[i], self.offsets[i + 1]
+            docs = self.postings_doc[start:end]
+            tf = self.postings_tf[start:end].astype(np.float32)
+            idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[docs] / self._avg_length)
+            scores[docs] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+        top = np.argsort(-scores)[:k]
+        return [(str(self.doc_ids[i]), float(scores[i])) for i in top if scores[i] > 0]
+
+
+def keyword_index_path(index_dir):
+    return os.path.join(index_dir, config.BM25_INDEX_FILE)
+
+
+def build_keyword_index(vector_store):
+    """Builds the BM25 index over every chunk in a LangChain FAISS store's docstore."""
+    return BM25Index.build(
+        (doc_id, vector_store.docstore.search(doc_id).page_content)
+        for doc_id in vector_store.index_to_docstore_id.values()
+    )
+
+
+def load_keyword_index(index_dir, vector_store):
+    """Loads the BM25 index saved by ingest.py; indexes built before it existed get one built in memory."""
+    path = keyword_index_path(index_dir)
+    if os.path.exists(path):
+        return BM25Index.load(path)
+    print("⚠️ No keyword index on disk (re-run ingest.py); building it in memory.")
+    return build_keyword_index(vector_store)
+
+
+# ==========================================
+# HYBRID RETRIEVAL (BM25 + FAISS, Reciprocal Rank Fusion)
+# ==========================================
+# Query embeddings run here so a slow embedding call can be abandoned after the latency budget
+_embed_executor = ThreadPoolExecutor(max_workers=config.RETRIEVAL_EMBED_WORKERS, thread_name_prefix="embed-query")
+
+
+def fused_scores(rankings, k=config.RRF_K):
+    """Reciprocal Rank Fusion scores of ranked ID lists: score(id) = sum of 1 / (k + rank)."""
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return scores
+
+
+def reciprocal_rank_fusion(rankings, k=config.RRF_K):
+    """Fuses ranked ID lists (see fused_scores). Returns IDs, best first."""
+    scores = fused_scores(rankings, k)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class HybridRetriever:
+    """
+    Fuses BM25 keyword hits with FAISS vector hits. The keyword side is local and always
+    available; when the query embedding misses `embed_timeout` (or fails), the keyword
+    results are served alone.
+    """
+    def __init__(self, vector_store, keyword_index):
+        self.vector_store = vector_store
+        self.keyword_index = keyword_index
+
+    def _vector_ranking(self, query_vector, fetch_k):
+        vector = np.asarray([query_vector], dtype=np.float32)
+        with metrics.span("retrieval_faiss"):
+            _, indices = self.vector_store.index.search(vector, fetch_k)
+        mapping = self.vector_store.index_to_docstore_id
+        return [mapping[i] for i in indices[0] if i != -1 and i in mapping]
+
+    def search(self, query, k=config.RETRIEVAL_K, fetch_k=config.RETRIEVAL_FETCH_K,
+               embed_timeout=config.RETRIEVAL_EMBED_TIMEOUT_SECONDS, pack=config.CONTEXT_PACKING):
+        """
+        Returns (documents, query_vector); query_vector is None for keyword-only results.
+        pack: return the top `k` chunks packed with further hits (see pack_context) instead of
+        the top `k` chunks verbatim.
+        """
+        with metrics.span("retrieval", as_type="retriever", input=query) as observation:
+            start = time.perf_counter()
+            future = _embed_executor.submit(self.vector_store.embeddings.embed_query, query)
+            with metrics.span("retrieval_bm25"):
+                keyword_ranking = [doc_id for doc_id, _ in self.keyword_index.search(query, fetch_k)]
+
+            try:
+                # The request started before the keyword search: wait out only the rest of the budget
+                with metrics.span("retrieval_embed", as_type="embedding"):
+                    query_vector = future.result(timeout=max(0.0, embed_timeout - (time.perf_counter() - start)))
+            except FutureTimeoutError:
+                print("⚠️ Query embedding too slow; serving keyword results.")
+                metrics.increment("retrieval_keyword_only")
+                query_vector = None
+            except Exception as e:
+                print(f"⚠️ Query embedding failed ({e}); serving keyword results.")
+                metrics.increment("retrieval_keyword_only")
+                query_vector = None
+
+            rankings = [keyword_ranking]
+            if query_vector is not None:
+                rankings.insert(0, self._vector_ranking(query_vector, fetch_k))
+            scores = fused_scores(rankings)
+            ranking = sorted(scores, key=scores.get, reverse=True)
+
+            if pack:
+                # Over-fetch, then merge, diversify and trim to the token budget (see pack_context)
+                with metrics.span("retrieval_pack"):
+                    candidates = [(doc_id, self.vector_store.docstore.search(doc_id), scores[doc_id])
+                                  for doc_id in ranking[:config.CONTEXT_CANDIDATES]]
+                    documents = pack_context(candidates, k)
+            else:
+                documents = [self.vector_store.docstore.search(doc_id) for doc_id in ranking[:k]]
+            metrics.record("retrieval_chunks", len(documents))
+            if observation is not None:
+                observation.update(output=[doc.metadata for doc in documents])
+        return documents, query_vector
+
+
+# ==========================================
+# CONTEXT PACKING (Merge overlapping chunks, MMR, token budget)
+# ==========================================
+# ingest.py splits pages into 1000-character chunks with 200 characters of overlap, so the best
+# hits for a question are often neighbours repeating each other's text. Packing keeps the top
+# hits, stitches such chunks back together, and adds further over-fetched hits in Maximal
+# Marginal Relevance order (relevant but not redundant) while they fit config.CONTEXT_TOKEN_BUDGET.
+CHUNK_ID_PATTERN = re.compile(r"^([0-9a-f]{16})-(\d+)$")  # "<file key>-<n>" IDs written by ingest.py
+MIN_OVERLAP_CHARS = 20  # Shorter shared text between two chunks is not treated as overlap
+SPACES = re.compile(r"[ \t]+")
+WHITESPACE_BEFORE_NEWLINE = re.compile(r"[ \t]*\n\s*")
+
+
+class Passage:
+    """One or more neighbouring chunks of the same source page, stitched together."""
+    def __init__(self, doc_id, document, score):
+        self.doc_ids = [doc_id]
+        self.text = document.page_content
+        self.metadata = dict(document.metadata)
+        self.score = score
+        match = CHUNK_ID_PATTERN.match(str(doc_id))
+        self.file = match.group(1) if match else None
+        self.first = self.last = int(match.group(2)) if match else None
+
+    @property
+    def page_key(self):
+        return self.metadata.get("source"), self.metadata.get("page")
+
+    def source_title(self):
+        # Sources are paths as ingested (possibly Windows-style): keep the file name, minus ".pdf"
+        name = re.split(r"[\\/]", str(self.metadata.get("source", "unknown source")))[-1]
+        return os.path.splitext(name)[0]
+
+    def page_number(self):
+        """The printed page label when the PDF has one, else the 1-based page number."""
+        page = self.metadata.get("page")
+        return self.metadata.get("page_label") or (page + 1 if isinstance(page, int) else None)
+
+
+def _overlap(left, right):
+    """Length of the longest suffix of `left` that is also a prefix of `right` (0 below MIN_OVERLAP_CHARS)."""
+    probe = right[:MIN_OVERLAP_CHARS]
+    if len(probe) < MIN_OVERLAP_CHARS:
+        return 0
+    start = left.find(probe)
+    while start != -1:
+        if right.startswith(left[start:]):
+            return len(left) - start
+        start = left.find(probe, start + 1)
+    return 0
+
+
+def _stitch(a, b):
+    """The text of `a` followed by `b` when b continues a (adjacent chunk IDs or shared text), else None."""
+    overlap = _overlap(a.text, b.text)
+    if overlap:
+        return a.text + b.text[overlap:]
+    if a.file is not None and a.file == b.file and b.first == a.last + 1:
+        return a.text + " " + b.text
+    return None
+
+
+def merge_passages(passages):
+    """
+    Merges passages of the same source page that overlap, continue each other or repeat each
+    other. Returns new passages (the inputs are left as they are).
+    """
+    merged = []
+    for passage in passages:
+        pending = copy.copy(passage)
+        pending.doc_ids = list(passage.doc_ids)
+        while pending is not None:
+            for i, other in enumerate(merged):
+                if other.page_key != pending.page_key:
+                    continue
+                if pending.text in other.text or other.text in pending.text:
+                    text = other.text if len(other.text) >= len(pending.text) else pending.text
+                elif (text := _stitch(other, pending)) is None:
+                    if (text := _stitch(pending, other)) is None:
+                        continue
+                    other.first = pending.first
+                else:
+                    other.last = pending.last
+                other.text = text
+                other.doc_ids += pending.doc_ids
+                other.score = max(other.score, pending.score)
+                # The grown passage may now bridge to another one: try it again
+                pending = merged.pop(i)
+                break
+            else:
+                merged.append(pending)
+                pending = None
+    return merged
+
+
+def mmr_order(passages, chosen=(), lambda_mult=config.CONTEXT_MMR_LAMBDA):
+    """
+    Orders passages by Maximal Marginal Relevance: fused relevance (min-max scaled to 0..1, as
+    RRF scores are close together) minus the highest term overlap (Jaccard) with the passages
+    already chosen, starting from `chosen`.
+    """
+    if not passages:
+        return []
+    low = min(passage.score for passage in passages)
+    spread = max(passage.score for passage in passages) - low or 1.0
+    chosen_terms = [set(tokenize(passage.text)) for passage in chosen]
+    terms = [set(tokenize(passage.text)) for passage in passages]
+    remaining = list(range(len(passages)))
+    order = []
+    while remaining:
+        def marginal(i):
+            redundancy = max((len(terms[i] & other) / (len(terms[i] | other) or 1) for other in chosen_terms),
+                             default=0.0)
+            return lambda_mult * (passages[i].score - low) / spread - (1 - lambda_mult) * redundancy
+        best = max(remaining, key=marginal)
+        remaining.remove(best)
+        order.append(passages[best])
+        chosen_terms.append(terms[best])
+    return order
+
+
+def _clean(text):
+    # PDF extraction leaves runs of spaces and whitespace-only lines; both cost tokens
+    return WHITESPACE_BEFORE_NEWLINE.sub("\n", SPACES.sub(" ", text)).strip()
+
+
+def _render(items):
+    """
+    items: (source title, page, text). Each passage is tagged with a short source key and page
+    ([S1, p. 44]); the keys are spelled out once on top, which is cheaper than a full label each.
+    A single source needs no key list: its passages are tagged with the title itself.
+    """
+    keys = {}
+    for title, _, _ in items:
+        keys.setdefault(title, f"S{len(keys) + 1}")
+    if len(keys) == 1:
+        keys, blocks = {title: title for title in keys}, []
+    else:
+        blocks = ["Sources: " + "; ".join(f"[{key}] {title}" for title, key in keys.items())]
+    for title, page, text in items:
+        blocks.append(f"[{keys[title]}, p. {page}]\n{text}" if page is not None else f"[{keys[title]}]\n{text}")
+    return "\n\n".join(blocks)
+
+
+def _packed_tokens(passages):
+    return history.estimate_tokens(_render([(p.source_title(), p.page_number(), _clean(p.text)) for p in passages]))
+
+
+def pack_context(candidates, k=config.RETRIEVAL_K, token_budget=config.CONTEXT_TOKEN_BUDGET):
+    """
+    candidates: (docstore ID, Document, fused score) for the over-fetched hits, best first.
+    The top `k` chunks are always kept, with overlapping neighbours merged. Further hits follow
+    in MMR order while the merged result fits `token_budget` (text a hit shares with a chosen
+    neighbour costs nothing). Returns the passages as Documents, most relevant first, with their
+    source in metadata["source_title"] and ["page_number"] (rendered by format_context).
+    When no further hit fits and merging the top `k` saves no tokens, the top `k` chunks are
+    returned one passage each (still labelled with their source).
+    """
+    chunks = [Passage(*candidate) for candidate in candidates]
+    top = chunks[:k]
+    selected = list(top)
+    passages = merge_passages(selected)
+    for chunk in mmr_order(chunks[k:], selected):
+        merged = merge_passages(selected + [chunk])
+        if _packed_tokens(merged) <= token_budget:
+            selected.append(chunk)
+            passages = merged
+    if len(selected) == len(top) and _packed_tokens(passages) >= _packed_tokens(top):
+        metrics.increment("retrieval_packing_skipped")
+        passages = top
+
+    passages.sort(key=lambda passage: passage.score, reverse=True)
+    metrics.record("retrieval_context_tokens", _packed_tokens(passages))
+    metrics.increment("retrieval_chunks_merged", len(selected) - len(passages))
+    return [
+        Document(page_content=_clean(passage.text), metadata=dict(
+            passage.metadata, source_title=passage.source_title(), page_number=passage.page_number(),
+            chunk_ids=passage.doc_ids))
+        for passage in passages
+    ]
+
+
+def format_context(documents):
+    """The prompt's context block: packed passages with their source keys, other chunks verbatim."""
+    if documents and all("source_title" in doc.metadata for doc in documents):
+        return _render([(doc.metadata["source_title"], doc.metadata["page_number"], doc.page_content)
+                        for doc in documents])
+    return "\n\n".join(doc.page_content for doc in documents)
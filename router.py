@@ -0,0 +1,292 @@
+import asyncio
+import contextvars
+import functools
+import json
+import queue
+import re
+import threading
+import time
+from collections import defaultdict, deque
+import config
+import metrics
+
+# ==========================================
+# MODEL ROUTER (Complexity routes, latency SLOs, hedged requests)
+# ==========================================
+# Every Coach and General Chat turn is classified as a greeting, a short question or a full
+# request (plans, long questions). Greetings and short questions go to the fast model; full
+# requests keep the mode's model. When the chosen model is slow, the same request is also sent
+# to the fallback model and whichever answers first wins (a hedged request). Decisions and their
+# latencies are counted in metrics.py and kept in a small log (see recent_decisions()).
+
+GREETING_WORDS = frozenset(
+    "hi hii hello hey heya hiya yo howdy sup hola morning afternoon evening good gm there "
+    "thanks thank you thx ty cheers ok okay k cool great nice awesome perfect got it bye "
+    "goodbye see ya later cya coach omny all so much very lol".split()
+)
+PLAN_WORDS = frozenset(
+    "plan plans program programme routine routines schedule split workout workouts week weeks "
+    "weekly month months meal meals diet menu macros cut bulk".split()
+)
+GREETING_MAX_WORDS = 6
+RECENT_DECISIONS = 200  # Entries kept for recent_decisions()
+
+_lock = threading.Lock()
+# (route, kind) -> recent latencies of the routed model itself (never the hedge's), so a hedge
+# that keeps winning cannot pull the hedge delay down after it
+_latencies = defaultdict(lambda: deque(maxlen=metrics.MAX_SAMPLES))
+_decisions = deque(maxlen=RECENT_DECISIONS)
+
+
+def classify(text, mode="coach"):
+    """
+    Returns (route, reason) for a message: "greeting", "short" or "full".
+    mode: "coach" (plan keywords make a request full) or "general" (only length counts).
+    """
+    words = re.findall(r"[a-z0-9']+", text.lower())
+    if len(words) <= GREETING_MAX_WORDS and all(word in GREETING_WORDS for word in words):
+        return "greeting", f"{len(words)} small-talk words"
+    if len(words) > config.ROUTER_SHORT_MAX_WORDS:
+        return "full", f"{len(words)} words"
+    if mode == "coach":
+        keywords = sorted(PLAN_WORDS.intersection(words))
+        if keywords:
+            return "full", "plan keywords: " + ", ".join(keywords)
+    return "short", f"{len(words)} words"
+
+
+class Decision:
+    """Where one request goes: model, latency SLO and when to hedge (None = never)."""
+    def __init__(self, mode, kind, route, reason, model, fallback_model, slo_seconds, hedge_after):
+        self.mode = mode
+        self.kind = kind  # "reply" (blocking call, SLO on the whole reply) or "stream" (SLO on the first token)
+        self.route = route
+        self.reason = reason
+        self.model = model
+        self.fallback_model = fallback_model
+        self.slo_seconds = slo_seconds
+        self.hedge_after = hedge_after
+
+
+def _hedge_after(route, kind, slo_seconds, downgrade):
+    """
+    Hedge once the routed model is slower than ROUTER_HEDGE_PERCENTILE of its own recent
+    latencies on this route; until enough calls were seen, at a fixed fraction of the SLO.
+    A hedge to a weaker model (downgrade) waits until the SLO is at risk:
+    ROUTER_DOWNGRADE_HEDGE_FRACTION of it at the earliest. Never later than the SLO.
+    """
+    with _lock:
+        recent = sorted(_latencies[(route, kind)])
+    if len(recent) < config.ROUTER_MIN_SAMPLES:
+        hedge_after = slo_seconds * config.ROUTER_HEDGE_FRACTION
+    else:
+        hedge_after = recent[min(len(recent) - 1, int(len(recent) * config.ROUTER_HEDGE_PERCENTILE / 100))]
+    if downgrade:
+        hedge_after = max(hedge_after, slo_seconds * config.ROUTER_DOWNGRADE_HEDGE_FRACTION)
+    return min(slo_seconds, hedge_after)
+
+
+def _observe_primary(decision, seconds):
+    """Records the routed model's own latency (reply time or time to first chunk)."""
+    if decision.hedge_after is not None:
+        with _lock:
+            _latencies[(decision.route, decision.kind)].append(seconds)
+
+
+def route(text, mode="coach", kind="reply"):
+    """
+    Picks the model for a message. mode: "coach" or "general"; kind: "reply" or "stream".
+    With config.ROUTER_ENABLED off, every request goes to the mode's model and is never hedged.
+    """
+    default_model = config.MODEL_NAME if mode == "coach" else config.RAG_MODEL_NAME
+    if not config.ROUTER_ENABLED:
+        return Decision(mode, kind, "full", "router disabled", default_model, None, None, None)
+
+    route_name, reason = classify(text, mode)
+    model = default_model if route_name == "full" else config.ROUTER_FAST_MODEL
+    slos = config.ROUTE_TTFT_SLO_SECONDS if kind == "stream" else config.ROUTE_REPLY_SLO_SECONDS
+    slo_seconds = slos[route_name]
+    downgrade = config.ROUTER_FALLBACK_MODEL != model
+    return Decision(mode, kind, route_name, reason, model, config.ROUTER_FALLBACK_MODEL,
+                    slo_seconds, _hedge_after(route_name, kind, slo_seconds, downgrade))
+
+
+def _record(decision, seconds, winner, hedged=False, hedge_won=False, error=None):
+    """Counts the outcome (`router_<route>_*` metrics) and appends it to the decision log."""
+    prefix = f"router_{decision.route}"
+    metrics.increment(f"{prefix}_requests")
+    metrics.increment(f"router_model_{winner}_requests")
+    if hedged:
+        metrics.increment(f"{prefix}_hedged")
+        if hedge_won:
+            metrics.increment(f"{prefix}_hedge_wins")
+    entry = {
+        "time": time.time(), "mode": decision.mode, "kind": decision.kind, "route": decision.route,
+        "reason": decision.reason, "model": decision.model, "winner": winner, "hedged": hedged,
+        "hedge_won": hedge_won, "hedge_after": decision.hedge_after, "slo_seconds": decision.slo_seconds,
+        "seconds": round(seconds, 4), "slo_met": None, "error": error,
+    }
+    if error is None:
+        metrics.record(f"{prefix}_{decision.kind}_seconds", seconds)
+        if decision.slo_seconds is not None:
+            entry["slo_met"] = seconds <= decision.slo_seconds
+            if not entry["slo_met"]:
+                metrics.increment(f"{prefix}_slo_misses")
+    else:
+        metrics.increment(f"{prefix}_errors")
+
+    with _lock:
+        _decisions.append(entry)
+        if config.ROUTER_LOG_FILE:
+            with open(config.ROUTER_LOG_FILE, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+
+
+def recent_decisions():
+    """The most recent routing decisions with their outcomes, oldest first."""
+    with _lock:
+        return list(_decisions)
+
+
+# ==========================================
+# HEDGED CALLS (async replies and sync streams)
+# ==========================================
+async def ahedged(decision, attempt):
+    """
+    Awaits attempt(model_name) for the decision's model. If it has not finished after
+    decision.hedge_after seconds (or failed), attempt(fallback_model) runs too and the first
+    successful result is returned; the other call is cancelled.
+    """
+    start = time.perf_counter()
+
+    async def primary_attempt():
+        try:
+            result = await attempt(decision.model)
+        except asyncio.CancelledError:
+            # Lost to the hedge or abandoned: the model would have taken at least this long
+            _observe_primary(decision, time.perf_counter() - start)
+            raise
+        _observe_primary(decision, time.perf_counter() - start)
+        return result
+
+    primary = asyncio.ensure_future(primary_attempt())
+    tasks = {primary: decision.model}
+    hedged = False
+    try:
+        if decision.hedge_after is not None:
+            done, _ = await asyncio.wait(tasks, timeout=decision.hedge_after)
+            if not done or next(iter(done)).exception() is not None:
+                hedged = True
+                tasks[asyncio.ensure_future(attempt(decision.fallback_model))] = decision.fallback_model
+
+        pending, error = set(tasks), None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    _record(decision, time.perf_counter() - start, tasks[task], hedged, task is not primary)
+                    return task.result()
+                error = task.exception()
+        _record(decision, time.perf_counter() - start, decision.model, hedged, error=repr(error))
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def _pump(label, open_stream, events, stop, on_first_chunk=None):
+    """
+    Worker thread: forwards one stream's chunks to the shared queue until it ends or is stopped.
+    on_first_chunk is called when the first chunk arrives, even on a stream that was stopped.
+    """
+    try:
+        stream = open_stream()
+        try:
+            for chunk in stream:
+                if on_first_chunk is not None:
+                    on_first_chunk()
+                    on_first_chunk = None
+                if stop.is_set():
+                    break
+                events.put((label, "chunk", chunk))
+        finally:
+            getattr(stream, "close", lambda: None)()
+        events.put((label, "done", None))
+    except Exception as e:
+        events.put((label, "error", e))
+
+
+def hedged_stream(decision, start_stream):
+    """
+    Yields the text chunks of start_stream(model_name) for the decision's model. If no chunk
+    arrived after decision.hedge_after seconds (or the stream failed first), a stream from the
+    fallback model is started as well; the first one to produce text wins and the other is dropped.
+    The recorded latency is the time to the first chunk.
+    """
+    start = time.perf_counter()
+    if decision.hedge_after is None:
+        recorded = False
+        try:
+            for chunk in start_stream(decision.model):
+                if not recorded:
+                    _record(decision, time.perf_counter() - start, decision.model)
+                    recorded = True
+                yield chunk
+        except Exception as e:
+            if not recorded:
+                _record(decision, time.perf_counter() - start, decision.model, error=repr(e))
+            raise
+        if not recorded:
+            _record(decision, time.perf_counter() - start, decision.model)
+        return
+
+    # Each stream runs on its own thread and feeds one queue, tagged with a label ("primary"/"hedge")
+    events = queue.Queue()
+    stops = {}
+    models = {"primary": decision.model, "hedge": decision.fallback_model}
+
+    def primary_first_chunk():
+        _observe_primary(decision, time.perf_counter() - start)
+
+    def launch(label):
+        stops[label] = threading.Event()
+        open_stream = functools.partial(start_stream, models[label])
+        on_first_chunk = primary_first_chunk if label == "primary" else None
+        # The copied context keeps the hedge's spans inside the caller's trace
+        threading.Thread(target=contextvars.copy_context().run, daemon=True,
+                         args=(_pump, label, open_stream, events, stops[label], on_first_chunk)).start()
+
+    launch("primary")
+    winner, failed = None, set()
+    try:
+        while True:
+            try:
+                label, event, payload = events.get(timeout=None if "hedge" in stops else decision.hedge_after)
+            except queue.Empty:
+                launch("hedge")
+                continue
+            if winner is not None and label != winner:
+                continue  # The losing stream, still winding down
+            if event == "error":
+                failed.add(label)
+                if winner is None and "hedge" not in stops:
+                    launch("hedge")
+                    continue
+                if winner is None and len(failed) < len(stops):
+                    continue  # The other stream may still answer
+                if winner is None:
+                    _record(decision, time.perf_counter() - start, decision.model, True, error=repr(payload))
+                raise payload
+            if winner is None:
+                winner = label
+                for other, stop in stops.items():
+                    if other != winner:
+                        stop.set()
+                _record(decision, time.perf_counter() - start, models[winner], "hedge" in stops, winner == "hedge")
+            if event == "done":
+                return
+            yield payload
+    finally:
+        # The winner finished or the consumer stopped early: stop every stream still running
+        for stop in stops.values():
+            stop.set()
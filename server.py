@@ -0,0 +1,249 @@
+import argparse
+import asyncio
+import base64
+import binascii
+import contextlib
+import json
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+import agent
+import config
+import history
+import metrics
+import utils
+
+# ==========================================
+# HEADLESS HTTP API (Coach, RAG chat, Calorie Vision)
+# ==========================================
+# Stateless: clients send the conversation (and the rolling summary state returned by the
+# previous call) with every request, so any replica / worker can serve any request.
+# Each worker process loads its own vector store and caches once and shares them
+# between all requests it serves.
+
+PROFILE_FIELDS = ("age", "weight", "height", "gender", "goal")
+# How often a pending JSON request checks whether the client is still connected
+DISCONNECT_POLL_SECONDS = 0.5
+
+
+class BadRequest(Exception):
+    """Invalid request body; answered with HTTP 400."""
+
+
+async def _read_json(request):
+    try:
+        body = await request.json()
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        raise BadRequest("Body must be a JSON object.")
+    if not isinstance(body, dict):
+        raise BadRequest("Body must be a JSON object.")
+    return body
+
+
+def _message(body):
+    message = body.get("message")
+    if not isinstance(message, str) or not message.strip():
+        raise BadRequest("'message' must be a non-empty string.")
+    return message
+
+
+def _messages(body):
+    """The earlier conversation, Streamlit-style: [{"role": "user" | "assistant", "content": str}]."""
+    messages = body.get("history") or []
+    if not isinstance(messages, list) or not all(
+        isinstance(m, dict) and m.get("role") in ("user", "assistant") and isinstance(m.get("content"), str)
+        for m in messages
+    ):
+        raise BadRequest("'history' must be a list of {role: user|assistant, content: str}.")
+    return messages
+
+
+def _profile(body):
+    profile = body.get("profile")
+    if not isinstance(profile, dict) or any(field not in profile for field in PROFILE_FIELDS):
+        raise BadRequest(f"'profile' must contain {', '.join(PROFILE_FIELDS)}.")
+    try:
+        float(profile["weight"]), float(profile["height"]), int(profile["age"])
+    except (TypeError, ValueError):
+        raise BadRequest("'profile' age, weight and height must be numbers.")
+    return profile
+
+
+async def _gemini_history(body):
+    """Builds the Gemini history; may call the summary model, so it runs off the event loop."""
+    messages = _messages(body)
+    summary_state = body.get("summary_state") or {}
+    if not isinstance(summary_state, dict):
+        raise BadRequest("'summary_state' must be an object.")
+    chat_history = await run_in_threadpool(history.build_history, messages, summary_state, agent.summarize_history)
+    return chat_history, summary_state
+
+
+async def _cancel_on_disconnect(request, coro):
+    """Awaits `coro`, cancelling it (and the model call behind it) if the client disconnects."""
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                metrics.increment("server_client_disconnects")
+                raise asyncio.CancelledError()
+    finally:
+        # Also when this handler itself is cancelled (e.g. at shutdown)
+        task.cancel()
+
+
+def _error(status, message):
+    return JSONResponse({"error": message}, status_code=status)
+
+
+def endpoint(handler):
+    """Maps request errors and agent deadlines to JSON error responses."""
+    async def wrapper(request):
+        try:
+            return await handler(request)
+        except BadRequest as e:
+            return _error(400, str(e))
+        except asyncio.TimeoutError:
+            return _error(504, "The model did not answer in time.")
+    return wrapper
+
+
+async def _limited_chunks(chunks):
+    """
+    Runs a sync chunk generator under the agent's concurrency limit and deadline. A client
+    disconnect cancels this iterator, which stops the generator (and its model stream).
+    """
+    try:
+        async for chunk in agent.astream(chunks):
+            yield chunk
+    except asyncio.CancelledError:
+        metrics.increment("server_client_disconnects")
+        raise
+    except asyncio.TimeoutError:
+        # The status line is already sent: end the body here (counted as agent_timeouts)
+        return
+
+
+def _stream(chunks, summary_state):
+    """Streams plain-text chunks; the updated summary state travels in a response header."""
+    return StreamingResponse(
+        _limited_chunks(chunks),
+        media_type="text/plain; charset=utf-8",
+        headers={"X-Summary-State": json.dumps(summary_state)},
+    )
+
+
+# --- Coach ---
+@endpoint
+async def coach(request):
+    body = await _read_json(request)
+    message, profile = _message(body), _profile(body)
+    chat_history, summary_state = await _gemini_history(body)
+    reply = await _cancel_on_disconnect(request, agent.aget_coach_response(message, chat_history, profile))
+    return JSONResponse({"reply": reply, "summary_state": summary_state})
+
+
+@endpoint
+async def coach_stream(request):
+    body = await _read_json(request)
+    message, profile = _message(body), _profile(body)
+    chat_history, summary_state = await _gemini_history(body)
+    return _stream(agent.stream_coach_response(message, chat_history, profile), summary_state)
+
+
+# --- General Fitness Chat (RAG) ---
+@endpoint
+async def chat(request):
+    body = await _read_json(request)
+    message = _message(body)
+    chat_history, summary_state = await _gemini_history(body)
+    reply = await _cancel_on_disconnect(request, agent.aget_general_response(message, chat_history))
+    return JSONResponse({"reply": reply, "summary_state": summary_state})
+
+
+@endpoint
+async def chat_stream(request):
+    body = await _read_json(request)
+    message = _message(body)
+    chat_history, summary_state = await _gemini_history(body)
+    return _stream(agent.stream_general_response(message, chat_history), summary_state)
+
+
+# --- Calorie Vision ---
+@endpoint
+async def vision(request):
+    """Body: {"mime_type": str, "data": base64 str, "question": str (optional)}."""
+    body = await _read_json(request)
+    mime_type = body.get("mime_type")
+    if mime_type != "application/pdf" and not (isinstance(mime_type, str) and mime_type.startswith("image/")):
+        raise BadRequest("'mime_type' must be an image type or application/pdf.")
+    question = body.get("question", "")
+    if not isinstance(question, str):
+        raise BadRequest("'question' must be a string.")
+    try:
+        data = base64.b64decode(body.get("data") or "", validate=True)
+    except (binascii.Error, TypeError):
+        raise BadRequest("'data' must be base64-encoded file contents.")
+    if not data or len(data) > config.SERVER_MAX_UPLOAD_BYTES:
+        raise BadRequest(f"'data' must be between 1 byte and {config.SERVER_MAX_UPLOAD_BYTES} bytes.")
+
+    is_pdf = mime_type == "application/pdf"
+    if not is_pdf:
+        try:
+            data = await run_in_threadpool(utils.preprocess_image, data)
+            mime_type = "image/jpeg"
+        except Exception as e:
+            print(f"Image preprocessing skipped: {e}")
+    file_data = {"mime_type": mime_type, "data": data}
+
+    reply = await _cancel_on_disconnect(request, agent.aanalyze_document(file_data, question, is_pdf))
+    return JSONResponse({"reply": reply})
+
+
+# --- Operations ---
+async def health(request):
+    return JSONResponse({"status": "ok", "backend": config.MODEL_BACKEND, "index_version": agent.get_index_version()})
+
+
+async def metrics_endpoint(request):
+    # Prometheus text format (per worker process); ?format=json for the summary used by the benchmarks
+    if request.query_params.get("format") == "json":
+        return JSONResponse(metrics.snapshot())
+    return PlainTextResponse(metrics.prometheus_text(), media_type=metrics.PROMETHEUS_CONTENT_TYPE)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    # Load the vector store and the model SDKs before the first request instead of during it
+    await run_in_threadpool(agent.warm_up_in_background().join)
+    yield
+
+
+app = Starlette(
+    routes=[
+        Route("/v1/coach", coach, methods=["POST"]),
+        Route("/v1/coach/stream", coach_stream, methods=["POST"]),
+        Route("/v1/chat", chat, methods=["POST"]),
+        Route("/v1/chat/stream", chat_stream, methods=["POST"]),
+        Route("/v1/vision", vision, methods=["POST"]),
+        Route("/health", health),
+        Route("/metrics", metrics_endpoint),
+    ],
+    lifespan=lifespan,
+)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run the Omny AI HTTP API.")
+    parser.add_argument("--host", default=config.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=config.SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=config.SERVER_WORKERS,
+                        help="Worker processes (each loads its own vector store and caches).")
+    args = parser.parse_args()
+    uvicorn.run("server:app", host=args.host, port=args.port, workers=args.workers)
@@ -0,0 +1,224 @@
+import atexit
+import contextlib
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import config
+import metrics
+
+# ==========================================
+# MULTI-USER STORE (SQLite WAL + connection pool + write-behind thread)
+# ==========================================
+# Profiles and chat messages are keyed by user/session ID, so concurrent Streamlit
+# sessions never overwrite each other. Messages are append-only: saving costs the same
+# whether a conversation has 2 messages or 2,000.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    conversation TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    user_id TEXT NOT NULL DEFAULT 'default'
+);
+CREATE TABLE IF NOT EXISTS profiles (
+    user_id TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+# Created after the column upgrade below, so databases from before multi-user support work too
+INDEXES = """
+DROP INDEX IF EXISTS idx_messages_conversation;
+CREATE INDEX IF NOT EXISTS idx_messages_user ON messages (user_id, conversation, id);
+"""
+
+# Statements are module constants so each pooled connection's statement cache reuses them
+INSERT_MESSAGE = ("INSERT INTO messages (user_id, conversation, role, content, created_at) "
+                  "VALUES (?, ?, ?, ?, ?)")
+SELECT_PAGE = ("SELECT id, role, content FROM messages WHERE user_id = ? AND conversation = ? AND id < ? "
+               "ORDER BY id DESC LIMIT ?")
+DELETE_MESSAGES = "DELETE FROM messages WHERE user_id = ?"
+HAS_MESSAGES = "SELECT 1 FROM messages WHERE user_id = ? LIMIT 1"
+UPSERT_PROFILE = ("INSERT INTO profiles (user_id, data, updated_at) VALUES (?, ?, ?) "
+                  "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at")
+SELECT_PROFILE = "SELECT data FROM profiles WHERE user_id = ?"
+
+# Conversations stored by the app (Streamlit session keys)
+CONVERSATIONS = ("coach_messages", "general_messages")
+
+
+class ConnectionPool:
+    """A fixed-size pool of SQLite connections shared by all sessions of the process."""
+    def __init__(self, path, size):
+        self._connections = queue.Queue()
+        for _ in range(size):
+            conn = sqlite3.connect(path, timeout=30, check_same_thread=False, cached_statements=256)
+            # WAL: readers never block the writer (or each other)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._connections.put(conn)
+
+    @contextlib.contextmanager
+    def connection(self):
+        """Borrows a connection; the `with` block is one transaction."""
+        conn = self._connections.get()
+        try:
+            with conn:
+                yield conn
+        finally:
+            self._connections.put(conn)
+
+
+class Store:
+    """
+    Profile + chat store.
+    append_message() only enqueues; a single background writer thread inserts queued
+    messages in batches (one transaction per batch), so hundreds of sessions never
+    compete for SQLite's write lock on the response path.
+    """
+    def __init__(self, path=config.DB_FILE, pool_size=config.DB_POOL_SIZE,
+                 batch_size=config.CHAT_WRITE_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.pool = ConnectionPool(path, pool_size)
+        self._queue = queue.Queue()
+        # Queued-but-unwritten messages per user, so a read waits only for its own user's writes
+        self._pending = {}
+        self._pending_changed = threading.Condition()
+
+        with self.pool.connection() as conn:
+            conn.executescript(SCHEMA)
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(messages)")]
+            if "user_id" not in columns:
+                # Upgrade the single-user table: existing rows belong to the default user
+                conn.execute(f"ALTER TABLE messages ADD COLUMN user_id TEXT NOT NULL "
+                             f"DEFAULT '{config.DEFAULT_USER_ID}'")
+            conn.executescript(INDEXES)
+
+        self._writer = threading.Thread(target=self._write_loop, name="store-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.flush)
+
+    # --- Chat messages ---
+    def append_message(self, user_id, conversation, message):
+        """Queues one message ({"role", "content"}) for writing; returns immediately."""
+        with self._pending_changed:
+            self._pending[user_id] = self._pending.get(user_id, 0) + 1
+        self._queue.put((user_id, conversation, message["role"], message["content"], time.time()))
+
+    def _write_loop(self):
+        while True:
+            rows = [self._queue.get()]
+            # Drain whatever else is waiting so bursts share one transaction
+            while len(rows) < self.batch_size:
+                try:
+                    rows.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with metrics.span("history_save"), self.pool.connection() as conn:
+                    conn.executemany(INSERT_MESSAGE, rows)
+                metrics.increment("history_saved_messages", len(rows))
+            except Exception as e:
+                print(f"Error saving chat history: {e}")
+                metrics.increment("history_save_errors")
+            finally:
+                with self._pending_changed:
+                    for row in rows:
+                        self._pending[row[0]] -= 1
+                        if not self._pending[row[0]]:
+                            del self._pending[row[0]]
+                    self._pending_changed.notify_all()
+                for _ in rows:
+                    self._queue.task_done()
+
+    def flush(self, user_id=None):
+        """Blocks until the queued messages of `user_id` (of every user if None) have been written."""
+        if user_id is None:
+            self._queue.join()
+            return
+        with self._pending_changed:
+            self._pending_changed.wait_for(lambda: user_id not in self._pending)
+
+    def load_messages(self, user_id, conversation, limit=None, before_id=None):
+        """
+        Returns up to `limit` messages older than `before_id` (newest page by default), oldest first.
+        Each message is {"id", "role", "content"}; pass the first id back as `before_id` for the previous page.
+        """
+        self.flush(user_id)  # Read-your-writes
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                SELECT_PAGE,
+                (user_id, conversation, before_id if before_id is not None else 2 ** 63 - 1, limit if limit else -1),
+            ).fetchall()
+        return [{"id": row[0], "role": row[1], "content": row[2]} for row in reversed(rows)]
+
+    def clear_messages(self, user_id):
+        """Deletes every stored message of one user."""
+        self.flush(user_id)
+        with self.pool.connection() as conn:
+            conn.execute(DELETE_MESSAGES, (user_id,))
+
+    # --- Profiles ---
+    def save_profile(self, user_id, profile_data):
+        with self.pool.connection() as conn:
+            conn.execute(UPSERT_PROFILE, (user_id, json.dumps(profile_data), time.time()))
+
+    def load_profile(self, user_id):
+        with self.pool.connection() as conn:
+            row = conn.execute(SELECT_PROFILE, (user_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    # --- Migration ---
+    def import_legacy_files(self, user_id=config.LEGACY_USER_ID,
+                            profile_path=config.LEGACY_PROFILE_FILE, chat_path=config.LEGACY_CHAT_FILE):
+        """
+        Import of the old single-user user_profile.json / chat_history.json into `user_id`.
+        The files are left untouched; data is only imported while `user_id` has none yet,
+        so running it again imports nothing twice.
+        """
+        if os.path.exists(profile_path):
+            try:
+                with open(profile_path, "r") as f:
+                    profile_data = json.load(f)
+                if self.load_profile(user_id) is None:
+                    self.save_profile(user_id, profile_data)
+            except Exception as e:
+                print(f"Error migrating profile: {e}")
+
+        if os.path.exists(chat_path):
+            try:
+                with open(chat_path, "r") as f:
+                    data = json.load(f)
+                with self.pool.connection() as conn:
+                    if conn.execute(HAS_MESSAGES, (user_id,)).fetchone() is None:
+                        now = time.time()
+                        conn.executemany(INSERT_MESSAGE, [
+                            (user_id, conversation, msg["role"], msg["content"], now)
+                            for conversation in CONVERSATIONS
+                            for msg in data.get(conversation, [])
+                        ])
+            except Exception as e:
+                print(f"Error migrating chat history: {e}")
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Returns the process-wide store, creating it (and importing legacy JSON files if enabled) on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                store = Store()
+                if config.LEGACY_IMPORT:
+                    store.import_legacy_files()
+                _store = store
+    return _store
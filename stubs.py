@@ -0,0 +1,167 @@
+import asyncio
+import hashlib
+import time
+import numpy as np
+from google.generativeai import protos
+from langchain_core.embeddings import Embeddings
+import config
+
+# ==========================================
+# OFFLINE MODEL BACKEND (config.MODEL_BACKEND = "stub")
+# ==========================================
+# Deterministic stand-ins for genai.GenerativeModel and GoogleGenerativeAIEmbeddings, so the
+# app, the HTTP server and the benchmarks run locally without an API key or network access.
+# They implement only the parts of the SDK interfaces that agent.py uses. Set the STUB_* latencies
+# in config to make them behave like a (slow) remote API, e.g. in benchmarks/bench_e2e.py.
+
+EMBEDDING_DIMENSIONS = 768  # Same as models/embedding-001, so the committed faiss_index loads
+CHARS_PER_TOKEN = 4  # Token estimate for the simulated usage metadata (as in history.py)
+FILLER_SENTENCE = "Train with progressive overload, eat enough protein and sleep at least seven hours."
+
+
+def _token_seconds():
+    """Simulated time per generated token (one word counts as one token)."""
+    return 1.0 / config.STUB_TOKENS_PER_SECOND if config.STUB_TOKENS_PER_SECOND > 0 else 0.0
+
+
+def _ttft_seconds(model_name, text):
+    """
+    Simulated time to first token: the model's setting, times STUB_SLOW_FACTOR for the
+    (hash-chosen, so repeatable) STUB_SLOW_FRACTION of requests that hit tail latency.
+    """
+    seconds = config.STUB_MODEL_TTFT_SECONDS.get(model_name, config.STUB_TTFT_SECONDS)
+    if config.STUB_SLOW_FRACTION > 0:
+        digest = hashlib.sha256(f"{model_name}:{text}".encode("utf-8")).digest()
+        if int.from_bytes(digest[:4], "little") / 2 ** 32 < config.STUB_SLOW_FRACTION:
+            seconds *= config.STUB_SLOW_FACTOR
+    return seconds
+
+
+def _reply_seconds(ttft, reply):
+    """Simulated wall time of a whole (non-streamed) reply."""
+    return ttft + len(reply.split(" ")) * _token_seconds()
+
+
+def _usage(prompt_chars, reply):
+    prompt_tokens = prompt_chars // CHARS_PER_TOKEN + 1
+    completion_tokens = len(reply.split(" "))
+    return protos.GenerateContentResponse.UsageMetadata(
+        prompt_token_count=prompt_tokens, candidates_token_count=completion_tokens,
+        total_token_count=prompt_tokens + completion_tokens,
+    )
+
+
+class StubResponse:
+    """A response (or streamed chunk) exposing `.parts`, `.text` and `.usage_metadata` like the SDK's."""
+    def __init__(self, parts, usage_metadata=None):
+        self.parts = parts
+        self.usage_metadata = usage_metadata
+
+    @property
+    def text(self):
+        return "".join(part.text for part in self.parts)
+
+
+def _content_text(content):
+    if isinstance(content, str):
+        return content
+    if isinstance(content, dict):
+        return content.get("mime_type", "")
+    if isinstance(content, (list, tuple)):
+        return " ".join(_content_text(item) for item in content)
+    return str(content)
+
+
+def _split_words(text):
+    words = text.split(" ")
+    return [word + " " for word in words[:-1]] + words[-1:]
+
+
+class StubChatSession:
+    """Chat session answering every message with a short canned reply derived from the input."""
+    def __init__(self, model, history=None):
+        self.model = model
+        self.history = [
+            protos.Content(role=message["role"], parts=[protos.Part(text=str(p)) for p in message["parts"]])
+            for message in history or []
+        ]
+
+    def _reply(self, content):
+        """
+        Returns (reply, usage metadata, time to first token); the prompt is the system
+        instruction + history + message.
+        """
+        text = _content_text(content)
+        self.history.append(protos.Content(role="user", parts=[protos.Part(text=text)]))
+        prompt_chars = len(self.model.system_instruction or "") + sum(
+            len(part.text) for message in self.history for part in message.parts
+        )
+        reply = self.model.reply_for(text)
+        self.history.append(protos.Content(role="model", parts=[protos.Part(text=reply)]))
+        return reply, _usage(prompt_chars, reply), _ttft_seconds(self.model.model_name, text)
+
+    def _stream(self, reply, usage, ttft):
+        time.sleep(ttft)
+        words = _split_words(reply)
+        for i, word in enumerate(words):
+            # Like the API, the final chunk carries the usage of the whole reply
+            yield StubResponse([protos.Part(text=word)], usage if i == len(words) - 1 else None)
+            time.sleep(_token_seconds())
+
+    def send_message(self, content, safety_settings=None, stream=False, **kwargs):
+        reply, usage, ttft = self._reply(content)
+        if stream:
+            return self._stream(reply, usage, ttft)
+        time.sleep(_reply_seconds(ttft, reply))
+        return StubResponse([protos.Part(text=reply)], usage)
+
+    async def send_message_async(self, content, safety_settings=None, **kwargs):
+        reply, usage, ttft = self._reply(content)
+        await asyncio.sleep(_reply_seconds(ttft, reply))
+        return StubResponse([protos.Part(text=reply)], usage)
+
+
+class StubGenerativeModel:
+    """Drop-in for genai.GenerativeModel. Tools are accepted but never called."""
+    def __init__(self, model_name="stub", system_instruction=None, tools=None, **kwargs):
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        self.tools = tools
+
+    def reply_for(self, text):
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()[:8]
+        reply = f"[{self.model_name} stub] Reply {digest} to a {len(text)}-character request."
+        missing_words = config.STUB_REPLY_WORDS - len(reply.split(" "))
+        if missing_words > 0:
+            filler = FILLER_SENTENCE.split(" ")
+            reply += " " + " ".join(filler[i % len(filler)] for i in range(missing_words))
+        return reply
+
+    def start_chat(self, history=None, **kwargs):
+        return StubChatSession(self, history)
+
+    def generate_content(self, contents, safety_settings=None, stream=False, **kwargs):
+        return StubChatSession(self).send_message(contents, stream=stream)
+
+    async def generate_content_async(self, contents, safety_settings=None, **kwargs):
+        return await StubChatSession(self).send_message_async(contents)
+
+
+class StubEmbeddings(Embeddings):
+    """Drop-in for GoogleGenerativeAIEmbeddings: unit vectors seeded by the text's hash."""
+    def __init__(self, model=None, dimensions=EMBEDDING_DIMENSIONS, **kwargs):
+        self.model = model
+        self.dimensions = dimensions
+
+    def _embed(self, text):
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.dimensions).astype(np.float32)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts):
+        time.sleep(config.STUB_EMBED_SECONDS)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        time.sleep(config.STUB_EMBED_SECONDS)
+        return self._embed(text)
@@ -0,0 +1,62 @@
+import pytest
+import agent
+import cache
+import config
+import history
+import metrics
+
+PROFILE = {"age": 30, "weight": 80, "height": 180, "gender": "Male", "goal": "Build Muscle"}
+GREETING = {"role": "assistant", "content": "Ask me anything about training, diet, or sleep."}
+
+
+@pytest.fixture
+def stub_agent(monkeypatch):
+    """Offline models and embeddings, a fresh semantic cache and no router hedging."""
+    monkeypatch.setattr(config, "MODEL_BACKEND", "stub")
+    monkeypatch.setattr(config, "ROUTER_ENABLED", False)
+    monkeypatch.setattr(config, "EMBED_CACHE_ENABLED", False)
+    monkeypatch.setattr(config, "STUB_TTFT_SECONDS", 0.0)
+    monkeypatch.setattr(config, "STUB_TOKENS_PER_SECOND", 0.0)
+    monkeypatch.setattr(agent, "semantic_cache", cache.SemanticCache())
+
+
+def app_history(messages):
+    """The history app.py sends: the seeded greeting, earlier turns, then the current prompt."""
+    return history.build_history([GREETING] + messages, {}, agent.summarize_history)
+
+
+def test_first_turn_ignores_the_greeting_and_current_prompt():
+    prompt = {"role": "user", "content": "How much protein?"}
+    assert agent._is_first_turn("How much protein?", [])
+    assert agent._is_first_turn("How much protein?", app_history([prompt]))
+    assert not agent._is_first_turn("And for me?", app_history([
+        prompt, {"role": "assistant", "content": "About 1.6 g/kg."}, {"role": "user", "content": "And for me?"},
+    ]))
+
+
+def test_repeated_first_question_from_the_app_hits_the_cache(stub_agent):
+    question = "How much protein should I eat per day?"
+    chat_history = app_history([{"role": "user", "content": question}])
+    first = "".join(agent.stream_general_response(question, chat_history))
+    again = "".join(agent.stream_general_response(question, app_history([{"role": "user", "content": question}])))
+    assert again == first
+    assert agent.semantic_cache.hits == 1
+
+
+def test_follow_up_skips_the_cache(stub_agent):
+    question = "How much protein should I eat per day?"
+    "".join(agent.stream_general_response(question, app_history([{"role": "user", "content": question}])))
+    follow_up = app_history([
+        {"role": "user", "content": "Hi"}, {"role": "assistant", "content": "Hello!"},
+        {"role": "user", "content": question},
+    ])
+    "".join(agent.stream_general_response(question, follow_up))
+    assert agent.semantic_cache.hits == 0
+
+
+def test_precomputed_tools_count_the_avoided_round_trips(stub_agent, monkeypatch):
+    monkeypatch.setattr(config, "COACH_PRECOMPUTE_TOOLS", True)
+    before = metrics.snapshot()["counters"].get("coach_function_call_round_trips_avoided", 0)
+    chat, my_tools = agent._start_coach_chat([], PROFILE)
+    assert my_tools == []
+    assert metrics.snapshot()["counters"]["coach_function_call_round_trips_avoided"] == before + 2
@@ -0,0 +1,34 @@
+from langchain_core.embeddings import Embeddings
+import embedding_cache
+import stubs
+
+
+class CountingEmbeddings(Embeddings):
+    """A stand-in for the real provider: constant vectors, counting the texts it embeds."""
+    def __init__(self):
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += len(texts)
+        return [[1.0, 0.0, 0.0] for _ in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def test_providers_of_the_same_model_do_not_share_vectors(tmp_path):
+    store = embedding_cache.EmbeddingStore(str(tmp_path))
+    stub = embedding_cache.CachedEmbeddings(stubs.StubEmbeddings(dimensions=3), "models/embedding-001", store)
+    stub.embed_query("How much protein?")
+
+    real = embedding_cache.CachedEmbeddings(CountingEmbeddings(), "models/embedding-001", store)
+    assert real.embed_query("How much protein?") == [1.0, 0.0, 0.0]
+    assert real.provider.calls == 1 and real.disk_hits == 0
+
+
+def test_repeat_texts_are_served_from_disk(tmp_path):
+    store = embedding_cache.EmbeddingStore(str(tmp_path))
+    embedding_cache.CachedEmbeddings(CountingEmbeddings(), "m", store).embed_documents(["a", "b"])
+    again = embedding_cache.CachedEmbeddings(CountingEmbeddings(), "m", store)
+    assert again.embed_documents(["b", "a"]) == [[1.0, 0.0, 0.0]] * 2
+    assert again.provider.calls == 0 and again.disk_hits == 2
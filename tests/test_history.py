@@ -0,0 +1,29 @@
+import history
+
+GREETING = {"role": "assistant", "content": "Ask me anything about training, diet, or sleep."}
+
+
+def chat(turns):
+    """The app's conversations: a seeded greeting, then (question, long answer) turns; yields each prompt's messages."""
+    messages = [GREETING]
+    for _ in range(turns):
+        messages.append({"role": "user", "content": "q" * 400})
+        yield list(messages)
+        messages.append({"role": "assistant", "content": "a" * 2000})
+
+
+def test_budget_shrinks_the_window_in_steps_and_starts_on_a_user_turn():
+    summaries = []
+
+    def summarize(previous, new_messages):
+        summaries.append(len(new_messages))
+        return "summary"
+
+    state = {}
+    for messages in chat(30):
+        built = history.build_history(messages, state, summarize, token_budget=1500, keep_turns=3, step=4)
+        roles = [message["role"] for message in built]
+        assert all(a != b for a, b in zip(roles, roles[1:])), roles
+        assert built[-1]["parts"] == [messages[-1]["content"]]
+    # The window moves by whole steps (two turns), not on every turn
+    assert len(summaries) <= 15
@@ -0,0 +1,69 @@
+from langchain_core.documents import Document
+import retrieval
+
+SHARED = "protein synthesis peaks within hours of training"  # Longer than MIN_OVERLAP_CHARS
+
+
+def passage(doc_id, text, page=0, score=1.0, source="guide.pdf"):
+    return retrieval.Passage(doc_id, Document(page_content=text, metadata={"source": source, "page": page}), score)
+
+
+def test_overlap():
+    assert retrieval._overlap("Eat more. " + SHARED, SHARED + " Sleep well.") == len(SHARED)
+    # Shared text that is not a suffix of the left chunk does not count
+    assert retrieval._overlap(SHARED + " Eat more.", SHARED + " Sleep well.") == 0
+    # Below MIN_OVERLAP_CHARS
+    assert retrieval._overlap("Eat more. rest", "rest days matter") == 0
+
+
+def test_merge_overlapping_chunks():
+    first = passage("0123456789abcdef-1", "Eat more. " + SHARED, score=0.5)
+    second = passage("0123456789abcdef-2", SHARED + " Sleep well.", score=0.9)
+    merged = retrieval.merge_passages([second, first])
+    assert len(merged) == 1
+    assert merged[0].text == "Eat more. " + SHARED + " Sleep well."
+    assert merged[0].doc_ids == ["0123456789abcdef-2", "0123456789abcdef-1"]
+    assert (merged[0].first, merged[0].last, merged[0].score) == (1, 2, 0.9)
+    # The inputs are left as they were
+    assert second.text == SHARED + " Sleep well." and second.doc_ids == ["0123456789abcdef-2"]
+
+
+def test_merge_contained_chunk():
+    whole = passage("0123456789abcdef-1", "Eat more. " + SHARED + " Sleep well.", score=0.2)
+    part = passage("0123456789abcdef-7", SHARED, score=0.8)
+    merged = retrieval.merge_passages([part, whole])
+    assert len(merged) == 1
+    assert merged[0].text == whole.text
+    assert merged[0].score == 0.8
+
+
+def test_merge_keeps_other_pages_apart():
+    first = passage("0123456789abcdef-1", "Eat more. " + SHARED, page=0)
+    second = passage("0123456789abcdef-2", SHARED + " Sleep well.", page=1)
+    assert len(retrieval.merge_passages([first, second])) == 2
+
+
+def candidates(topics):
+    documents = [Document(page_content=f"Chunk {n} about {topic}.", metadata={"source": "guide.pdf", "page": n})
+                 for n, topic in enumerate(topics)]
+    return [(f"0123456789abcdef-{n * 5}", document, 1.0 - n / 10) for n, document in enumerate(documents)]
+
+
+def test_pack_context_adds_further_hits_within_the_budget():
+    packed = retrieval.pack_context(candidates(["sleep", "protein", "cardio", "stretching"]), k=2)
+    assert len(packed) == 4
+    assert all(doc.metadata["source_title"] == "guide" for doc in packed)
+
+
+def test_pack_context_keeps_the_labelled_top_chunks_when_nothing_else_fits():
+    packed = retrieval.pack_context(candidates(["sleep", "protein", "cardio", "stretching"]), k=2, token_budget=20)
+    assert [doc.page_content for doc in packed] == ["Chunk 0 about sleep.", "Chunk 1 about protein."]
+    assert [doc.metadata["page_number"] for doc in packed] == [1, 2]
+
+
+def test_single_source_has_no_key_list():
+    context = retrieval.format_context([
+        Document(page_content="Sleep 8 hours.", metadata={"source_title": "guide", "page_number": 3}),
+        Document(page_content="Eat protein.", metadata={"source_title": "guide", "page_number": 5}),
+    ])
+    assert context == "[guide, p. 3]\nSleep 8 hours.\n\n[guide, p. 5]\nEat protein."
@@ -0,0 +1,63 @@
+import pytest
+import agent
+import config
+import router
+
+PROFILE = {"age": 30, "weight": 80, "height": 180, "gender": "Male", "goal": "Build Muscle"}
+
+
+@pytest.fixture
+def stub_models(monkeypatch):
+    """Offline models with a slower Coach model; SLOs scaled down so the test runs in seconds."""
+    monkeypatch.setattr(config, "MODEL_BACKEND", "stub")
+    monkeypatch.setattr(config, "ROUTER_ENABLED", True)
+    monkeypatch.setattr(config, "ROUTER_LOG_FILE", None)
+    monkeypatch.setattr(config, "ROUTER_MIN_SAMPLES", 5)
+    monkeypatch.setattr(config, "STUB_SLOW_FRACTION", 0.0)
+    monkeypatch.setattr(config, "STUB_TOKENS_PER_SECOND", 0.0)
+    monkeypatch.setattr(config, "STUB_REPLY_WORDS", 0)
+    slos = {"greeting": 0.2, "short": 0.2, "full": 0.4}
+    monkeypatch.setattr(config, "ROUTE_REPLY_SLO_SECONDS", slos)
+    monkeypatch.setattr(config, "ROUTE_TTFT_SLO_SECONDS", slos)
+    router._latencies.clear()
+    yield
+    router._latencies.clear()
+
+
+def set_ttft(monkeypatch, pro, flash):
+    monkeypatch.setattr(config, "STUB_MODEL_TTFT_SECONDS", {config.MODEL_NAME: pro, config.ROUTER_FAST_MODEL: flash})
+
+
+def winners(count):
+    return [entry["winner"] for entry in router.recent_decisions()[-count:]]
+
+
+def test_classify():
+    assert router.classify("hi there!")[0] == "greeting"
+    assert router.classify("Is creatine safe?")[0] == "short"
+    assert router.classify("Build me a 4 week plan")[0] == "full"
+    assert router.classify("What about my weekly split?", "general")[0] == "short"
+
+
+def test_cheap_turns_go_to_the_fast_model(stub_models, monkeypatch):
+    set_ttft(monkeypatch, pro=0.0, flash=0.0)
+    agent.get_coach_response("hello coach", [], PROFILE)
+    agent.get_coach_response("Is creatine safe?", [], PROFILE)
+    assert winners(2) == [config.ROUTER_FAST_MODEL] * 2
+
+
+def test_plans_stay_on_the_coach_model_within_slo(stub_models, monkeypatch):
+    # The Coach model meets the 0.4 s SLO; a hedge to the fast model would always win if it fired
+    set_ttft(monkeypatch, pro=0.3, flash=0.01)
+    for i in range(12):
+        agent.get_coach_response(f"Build me a muscle building plan ({i})", [], PROFILE)
+    for i in range(4):
+        "".join(agent.stream_coach_response(f"Write my weekly workout plan ({i})", [], PROFILE))
+    assert winners(16) == [config.MODEL_NAME] * 16
+    assert router._hedge_after("full", "reply", 0.4, downgrade=True) >= 0.3
+
+
+def test_plans_fall_back_when_the_coach_model_misses_slo(stub_models, monkeypatch):
+    set_ttft(monkeypatch, pro=1.0, flash=0.01)
+    assert agent.get_coach_response("Build me a plan", [], PROFILE).startswith(f"[{config.ROUTER_FAST_MODEL} stub]")
+    assert router.recent_decisions()[-1]["hedge_won"]
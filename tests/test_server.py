@@ -0,0 +1,114 @@
+import base64
+import io
+import json
+import pytest
+from PIL import Image
+from pypdf import PdfWriter
+from starlette.testclient import TestClient
+import config
+import server
+
+PROFILE = {"age": 30, "weight": 80, "height": 180, "gender": "Male", "goal": "Build Muscle"}
+HISTORY = [{"role": "user", "content": "Hi"}, {"role": "assistant", "content": "Hello!"}]
+
+
+@pytest.fixture(scope="module")
+def client():
+    """The API on the stub models (module-scoped: the lifespan loads the vector store once)."""
+    patch = pytest.MonkeyPatch()
+    patch.setattr(config, "MODEL_BACKEND", "stub")
+    patch.setattr(config, "ROUTER_ENABLED", False)
+    patch.setattr(config, "EMBED_CACHE_ENABLED", False)
+    with TestClient(server.app) as test_client:
+        yield test_client
+    patch.undo()
+
+
+def encoded(data):
+    return base64.b64encode(data).decode("ascii")
+
+
+def png_bytes():
+    output = io.BytesIO()
+    Image.new("RGB", (8, 8), "white").save(output, "PNG")
+    return output.getvalue()
+
+
+def pdf_bytes():
+    writer = PdfWriter()
+    writer.add_blank_page(200, 200)
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+def test_coach(client):
+    response = client.post("/v1/coach", json={"message": "Build me a plan", "profile": PROFILE, "history": HISTORY})
+    assert response.status_code == 200
+    assert "stub" in response.json()["reply"]
+    assert isinstance(response.json()["summary_state"], dict)
+
+
+def test_coach_stream(client):
+    response = client.post("/v1/coach/stream", json={"message": "Build me a plan", "profile": PROFILE})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "stub" in response.text
+    assert json.loads(response.headers["x-summary-state"]) == {}
+
+
+def test_chat(client):
+    response = client.post("/v1/chat", json={"message": "How much protein per day?", "history": HISTORY})
+    assert response.status_code == 200
+    assert "stub" in response.json()["reply"]
+
+
+def test_chat_stream(client):
+    response = client.post("/v1/chat/stream", json={"message": "How much protein per day?"})
+    assert response.status_code == 200
+    assert "stub" in response.text
+
+
+@pytest.mark.parametrize("mime_type, data", [("image/png", png_bytes()), ("application/pdf", pdf_bytes())])
+def test_vision(client, mime_type, data):
+    response = client.post("/v1/vision", json={"mime_type": mime_type, "data": encoded(data), "question": "Calories?"})
+    assert response.status_code == 200
+    assert "stub" in response.json()["reply"]
+
+
+def test_health(client):
+    response = client.get("/health")
+    assert response.status_code == 200
+    assert response.json()["status"] == "ok" and response.json()["backend"] == "stub"
+
+
+def test_metrics(client):
+    client.post("/v1/chat", json={"message": "Is creatine safe?"})
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert "omny_" in response.text
+    assert client.get("/metrics", params={"format": "json"}).json()["counters"]
+
+
+@pytest.mark.parametrize("path, body, error", [
+    ("/v1/coach", [], "JSON object"),
+    ("/v1/coach", {"profile": PROFILE}, "'message'"),
+    ("/v1/coach", {"message": "hi", "profile": {"age": 30}}, "'profile'"),
+    ("/v1/coach", {"message": "hi", "profile": dict(PROFILE, weight="heavy")}, "numbers"),
+    ("/v1/coach/stream", {"message": " ", "profile": PROFILE}, "'message'"),
+    ("/v1/chat", {"message": "hi", "history": [{"role": "system", "content": "x"}]}, "'history'"),
+    ("/v1/chat/stream", {"message": "hi", "summary_state": "v1"}, "'summary_state'"),
+    ("/v1/vision", {"mime_type": "text/plain", "data": "aGk="}, "'mime_type'"),
+    ("/v1/vision", {"mime_type": "image/png", "data": "not base64!"}, "'data'"),
+    ("/v1/vision", {"mime_type": "image/png", "data": ""}, "'data'"),
+    ("/v1/vision", {"mime_type": "image/png", "data": "aGk=", "question": 5}, "'question'"),
+])
+def test_bad_requests(client, path, body, error):
+    response = client.post(path, json=body)
+    assert response.status_code == 400
+    assert error in response.json()["error"]
+
+
+def test_invalid_json(client):
+    response = client.post("/v1/chat", content=b"{not json", headers={"content-type": "application/json"})
+    assert response.status_code == 400
@@ -1,14 +1,93 @@
 import math
+from functools import lru_cache
+import numpy as np
 
+# Standard TDEE activity multipliers (applied to BMR)
+ACTIVITY_MULTIPLIERS = {
+    "sedentary": 1.2,
+    "light": 1.375,
+    "moderate": 1.55,
+    "active": 1.725,
+    "very_active": 1.9,
+}
+
+# Carbs (g per kg) by goal; any other goal is treated as 'Maintain'
+CARB_MULTIPLIERS = {"Lose Fat": 2.0, "Build Muscle": 4.0}
+DEFAULT_CARB_MULTIPLIER = 3.0
+
+# ==========================================
+# BATCH (VECTORIZED) VERSIONS
+# ==========================================
+# Used for cohort reports / nightly refreshes over many profiles at once.
+# String columns are mapped through their unique values, so millions of rows cost one pass.
+
+def _map_strings(values, mapping_fn, dtype=np.float64):
+    """Applies mapping_fn to each distinct string once, then broadcasts back to every row."""
+    uniques, inverse = np.unique(np.asarray(values, dtype=str), return_inverse=True)
+    mapped = np.array([mapping_fn(value) for value in uniques], dtype=dtype)
+    return mapped[inverse.reshape(-1)]
+
+def calculate_bmr_batch(weight_kg, height_cm, age, gender):
+    """
+    Vectorized calculate_bmr: takes arrays (one row per person), returns a float64 array of BMR.
+    """
+    weight_kg = np.asarray(weight_kg, dtype=np.float64)
+    height_cm = np.asarray(height_cm, dtype=np.float64)
+    age = np.asarray(age, dtype=np.float64)
+    # Mifflin-St Jeor: +5 for men, -161 for women
+    offset = _map_strings(gender, lambda g: 5.0 if g.lower() == "male" else -161.0)
+    return (10 * weight_kg) + (6.25 * height_cm) - (5 * age) + offset
+
+def calculate_macros_batch(weight_kg, goal):
+    """
+    Vectorized calculate_macros: returns {"protein", "fats", "carbs"} as int64 arrays (grams).
+    """
+    weight_kg = np.asarray(weight_kg, dtype=np.float64)
+    carb_multiplier = _map_strings(goal, lambda g: CARB_MULTIPLIERS.get(g, DEFAULT_CARB_MULTIPLIER))
+    # astype truncates toward zero, exactly like int()
+    return {
+        "protein": (weight_kg * 2.0).astype(np.int64),
+        "fats": (weight_kg * 0.8).astype(np.int64),
+        "carbs": (weight_kg * carb_multiplier).astype(np.int64),
+    }
+
+def calculate_tdee_batch(bmr, activity_level="moderate"):
+    """Vectorized calculate_tdee; activity_level is one string for everyone or an array of them."""
+    bmr = np.asarray(bmr, dtype=np.float64)
+    default = ACTIVITY_MULTIPLIERS["moderate"]
+    if isinstance(activity_level, str):
+        return bmr * ACTIVITY_MULTIPLIERS.get(activity_level, default)
+    return bmr * _map_strings(activity_level, lambda a: ACTIVITY_MULTIPLIERS.get(a, default))
+
+def calculate_profiles_batch(table, activity_level="moderate"):
+    """
+    BMR, TDEE and macro targets for a whole columnar table in one pass.
+    Args:
+        table: Anything indexable by column name (dict of arrays, pandas DataFrame, ...)
+            with weight_kg, height_cm, age, gender, goal and optionally activity_level.
+        activity_level (str): Used when the table has no activity_level column.
+    Returns:
+        dict of arrays: bmr, tdee, protein, fats, carbs.
+    """
+    try:
+        activity_level = table["activity_level"]
+    except (KeyError, IndexError, ValueError):
+        pass
+
+    bmr = calculate_bmr_batch(table["weight_kg"], table["height_cm"], table["age"], table["gender"])
+    result = {"bmr": bmr, "tdee": calculate_tdee_batch(bmr, activity_level)}
+    result.update(calculate_macros_batch(table["weight_kg"], table["goal"]))
+    return result
+
+# ==========================================
+# SCALAR VERSIONS (Coach tools; thin wrappers over the batch versions)
+# ==========================================
 # We add type hints (: float, : str) so the AI doesn't crash
 def calculate_bmr(weight_kg: float, height_cm: float, age: int, gender: str):
     """
     Calculates Basal Metabolic Rate (BMR) using the Mifflin-St Jeor Equation.
     """
-    if gender.lower() == "male":
-        return (10 * weight_kg) + (6.25 * height_cm) - (5 * age) + 5
-    else:
-        return (10 * weight_kg) + (6.25 * height_cm) - (5 * age) - 161
+    return float(calculate_bmr_batch([weight_kg], [height_cm], [age], [gender])[0])
 
 def calculate_macros(weight_kg: float, goal: str):
     """
@@ -17,15 +96,27 @@ def calculate_macros(weight_kg: float, goal: str):
     """
     # Ensure inputs are numbers (safety check)
     weight_kg = float(weight_kg)
-    
-    protein = int(weight_kg * 2.0)
-    fats = int(weight_kg * 0.8)
-    
-    if goal == "Lose Fat":
-        carbs = int(weight_kg * 2.0)
-    elif goal == "Build Muscle":
-        carbs = int(weight_kg * 4.0)
-    else:
-        carbs = int(weight_kg * 3.0)
-        
-    return {"protein": protein, "fats": fats, "carbs": carbs}
\ No newline at end of file
+
+    macros = calculate_macros_batch([weight_kg], [goal])
+    return {name: int(values[0]) for name, values in macros.items()}
+
+def calculate_tdee(bmr: float, activity_level: str = "moderate"):
+    """
+    Total Daily Energy Expenditure: BMR scaled by an activity multiplier.
+    Activity: 'sedentary', 'light', 'moderate', 'active', 'very_active'
+    """
+    return float(calculate_tdee_batch([bmr], activity_level)[0])
+
+@lru_cache(maxsize=1024)
+def precompute_profile_numbers(weight_kg, height_cm, age, gender, goal, activity_level="moderate"):
+    """
+    Runs every Coach tool locally for one profile (memoized, so repeat turns are free).
+    Returns {"bmr", "tdee", "activity_level", "macros"}; treat the result as read-only.
+    """
+    bmr = calculate_bmr(weight_kg, height_cm, age, gender)
+    return {
+        "bmr": round(bmr),
+        "tdee": round(calculate_tdee(bmr, activity_level)),
+        "activity_level": activity_level,
+        "macros": calculate_macros(weight_kg, goal),
+    }
@@ -1,15 +1,63 @@
 import base64
+import functools
+import hashlib
+import io
 import json
+import multiprocessing
 import os
 import re
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from fpdf import FPDF
+from PIL import Image, ImageOps
+import config
+import metrics
+import storage
 
 # ==========================================
 # 1. FILE PROCESSING (Keep this for Vision Mode!)
 # ==========================================
+def preprocess_image(image_bytes, max_dimension=config.VISION_MAX_DIMENSION,
+                     quality=config.VISION_JPEG_QUALITY):
+    """
+    Shrinks a photo before it is sent to the vision model.
+    Applies the EXIF orientation, downscales so the longest side is at most `max_dimension`,
+    and re-encodes as JPEG without any metadata (EXIF, GPS, ...).
+    """
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+        if img.mode in ("RGBA", "LA", "P"):
+            # JPEG has no transparency: flatten onto white
+            img = img.convert("RGBA")
+            background = Image.new("RGB", img.size, (255, 255, 255))
+            background.paste(img, mask=img.getchannel("A"))
+            img = background
+        elif img.mode != "RGB":
+            img = img.convert("RGB")
+
+        output = io.BytesIO()
+        img.save(output, "JPEG", quality=quality, optimize=True)
+    return output.getvalue()
+
+@functools.lru_cache(maxsize=16)
+def ui_image(path, max_px=config.UI_IMAGE_MAX_PX):
+    """
+    Returns PNG bytes of a UI image (logo, avatar) downscaled to fit `max_px`, computed once per process.
+    Given the full-size file, Streamlit would resize and re-encode it on every rerun.
+    """
+    with Image.open(path) as img:
+        img.thumbnail((max_px, max_px))
+        output = io.BytesIO()
+        img.save(output, "PNG")
+    return output.getvalue()
+
 def process_file(uploaded_file):
     """
     Converts a Streamlit file upload (Image OR PDF) into the format Gemini needs.
+    Images are preprocessed (oriented, downscaled, re-encoded) to keep the upload small.
     """
     if uploaded_file is not None:
         # Read the file bytes
@@ -17,6 +65,13 @@ def process_file(uploaded_file):
         
         # Get the correct mime type (image/jpeg, application/pdf, etc.)
         mime_type = uploaded_file.type
+
+        if mime_type and mime_type.startswith("image/"):
+            try:
+                bytes_data = preprocess_image(bytes_data)
+                mime_type = "image/jpeg"
+            except Exception as e:
+                print(f"Image preprocessing skipped: {e}")
         
         # Return the dictionary format required by Google GenAI
         return {"mime_type": mime_type, "data": bytes_data}
@@ -25,74 +80,90 @@ def process_file(uploaded_file):
 # ==========================================
 # 2. DATA MANAGEMENT (Save/Load/Clear)
 # ==========================================
-PROFILE_FILE = "user_profile.json"
-CHAT_FILE = "chat_history.json"
+# Profiles and chats live in a SQLite store keyed by user/session ID (see storage.py)
 
-def save_profile(profile_data):
-    """Saves user settings to a local JSON file."""
+def save_profile(profile_data, user_id=config.DEFAULT_USER_ID):
+    """Saves one user's settings."""
     try:
-        with open(PROFILE_FILE, "w") as f:
-            json.dump(profile_data, f, indent=4)
+        storage.get_store().save_profile(user_id, profile_data)
         return True
     except Exception as e:
         print(f"Error saving profile: {e}")
         return False
 
-def load_profile():
-    """Reads the user profile from disk."""
-    if os.path.exists(PROFILE_FILE):
-        try:
-            with open(PROFILE_FILE, "r") as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"Error loading profile: {e}")
+def load_profile(user_id=config.DEFAULT_USER_ID):
+    """Reads one user's profile (None if they never saved one)."""
+    try:
+        return storage.get_store().load_profile(user_id)
+    except Exception as e:
+        print(f"Error loading profile: {e}")
     return None
 
-def save_chat_history(coach_msgs, general_msgs):
-    """Saves chat history to disk."""
-    data = {
-        "coach_messages": coach_msgs,
-        "general_messages": general_msgs
-    }
+def append_chat_message(session_key, message, user_id=config.DEFAULT_USER_ID):
+    """
+    Persists one new message ('coach_messages' or 'general_messages').
+    Only the new row is written, on a background thread, so this returns immediately.
+    """
     try:
-        with open(CHAT_FILE, "w") as f:
-            json.dump(data, f, indent=4)
+        storage.get_store().append_message(user_id, session_key, message)
     except Exception as e:
         print(f"Error saving chat history: {e}")
 
-def load_chat_history():
-    """Loads chat history from disk."""
-    if os.path.exists(CHAT_FILE):
-        try:
-            with open(CHAT_FILE, "r") as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"Error loading chat history: {e}")
+def load_chat_history(user_id=config.DEFAULT_USER_ID, limit=config.CHAT_LOAD_LIMIT):
+    """Loads the most recent `limit` messages of each of one user's conversations."""
+    try:
+        store = storage.get_store()
+        data = {}
+        for session_key in storage.CONVERSATIONS:
+            page = store.load_messages(user_id, session_key, limit=limit)
+            if page:
+                data[session_key] = [{"role": m["role"], "content": m["content"]} for m in page]
+        return data or None
+    except Exception as e:
+        print(f"Error loading chat history: {e}")
     return None
 
-def clear_chat_history():
-    """Deletes the chat history file."""
-    if os.path.exists(CHAT_FILE):
-        try:
-            os.remove(CHAT_FILE)
-            return True
-        except Exception as e:
-            print(f"Error clearing chat file: {e}")
-            return False
-    return True
+def clear_chat_history(user_id=config.DEFAULT_USER_ID):
+    """Deletes all of one user's stored chat messages."""
+    try:
+        storage.get_store().clear_messages(user_id)
+        return True
+    except Exception as e:
+        print(f"Error clearing chat history: {e}")
+        return False
 
 # ==========================================
 # 3. PDF GENERATION (Clean & Branded)
 # ==========================================
 
+LOGO_FILE = "Omny logo main 2.png"
+
+@functools.lru_cache(maxsize=1)
+def header_logo_path():
+    """
+    Decodes and downscales the 1.7 MB logo once per process.
+    Returns the path of a small PNG copy for fpdf to embed (None if the logo is missing).
+    """
+    try:
+        with Image.open(LOGO_FILE) as img:
+            img.thumbnail((config.PDF_LOGO_MAX_PX, config.PDF_LOGO_MAX_PX))
+            path = os.path.join(tempfile.gettempdir(), f"omny_pdf_logo_{os.getpid()}.png")
+            img.save(path, "PNG")
+        return path
+    except Exception as e:
+        print(f"Error preparing PDF logo: {e}")
+        return None
+
 class BrandedPDF(FPDF):
     def header(self):
         # 1. Add Logo to top left
         # Ensure 'Omny logo main 2.png' is in your project folder
-        try:
-            self.image('Omny logo main 2.png', 10, 8, 25)
-        except:
-            pass # Skip if image not found
+        logo_path = header_logo_path()
+        if logo_path:
+            try:
+                self.image(logo_path, 10, 8, 25)
+            except:
+                pass # Skip if image can't be embedded
 
         # 2. Add Title to the right of the logo
         self.set_font('Arial', 'B', 15)
@@ -127,6 +198,7 @@ def clean_markdown(text):
     
     return text
 
+@metrics.span("pdf_render")
 def create_pdf(raw_text):
     """
     Generates a PDF file from text, cleaning formatting first.
@@ -172,4 +244,130 @@ def create_pdf(raw_text):
             pdf.multi_cell(0, 8, txt=clean_line)
             
     # Return as bytes
-    return pdf.output(dest="S").encode("latin-1")
\ No newline at end of file
+    return pdf.output(dest="S").encode("latin-1")
+
+# ==========================================
+# 4. PDF CACHE (Rendered off the response path)
+# ==========================================
+_pdf_jobs = OrderedDict()  # SHA-256 of the reply -> Future with the PDF bytes
+_pdf_lock = threading.Lock()
+_pdf_executor = ThreadPoolExecutor(max_workers=config.PDF_WORKERS, thread_name_prefix="pdf-render")
+
+def create_pdf_async(raw_text):
+    """
+    Starts rendering a reply's PDF on a background worker and returns the Future.
+    The same reply text always maps to the same job, so each plan is rendered at most once.
+    """
+    key = hashlib.sha256(raw_text.encode("utf-8")).hexdigest()
+    with _pdf_lock:
+        job = _pdf_jobs.get(key)
+        if job is None or (job.done() and job.exception() is not None):
+            job = _pdf_executor.submit(create_pdf, raw_text)
+            _pdf_jobs[key] = job
+        _pdf_jobs.move_to_end(key)
+        while len(_pdf_jobs) > config.PDF_CACHE_MAX_ENTRIES:
+            _pdf_jobs.popitem(last=False)
+    return job
+
+def get_pdf(raw_text):
+    """Returns the PDF bytes for a reply (cached by reply hash; waits if it is still rendering)."""
+    return create_pdf_async(raw_text).result()
+
+# ==========================================
+# 5. PDF MENU PRE-PASS (Local text extraction)
+# ==========================================
+# pypdf (~150 ms to import) is loaded by these functions, on the first PDF upload
+IMAGE_MIME_TYPES = {".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".png": "image/png",
+                    ".webp": "image/webp", ".gif": "image/gif", ".bmp": "image/bmp", ".tif": "image/tiff",
+                    ".tiff": "image/tiff", ".jp2": "image/jp2"}
+
+def _extract_page_range(pdf_bytes, start, end):
+    """Worker: (page number, text) for pages [start, end) of a PDF."""
+    from pypdf import PdfReader
+    reader = PdfReader(io.BytesIO(pdf_bytes))
+    return [(page_no, reader.pages[page_no].extract_text() or "")
+            for page_no in range(start, min(end, len(reader.pages)))]
+
+_extract_pool = None
+_extract_pool_lock = threading.Lock()
+
+def _get_extract_pool():
+    """
+    The process pool for long PDFs, created once. Its workers are spawned, not forked:
+    forking a process with live threads (agent loop, store writer) can deadlock the child.
+    """
+    global _extract_pool
+    with _extract_pool_lock:
+        if _extract_pool is None:
+            _extract_pool = ProcessPoolExecutor(max_workers=config.PARSE_MAX_WORKERS,
+                                                mp_context=multiprocessing.get_context("spawn"))
+    return _extract_pool
+
+def extract_pdf_pages(pdf_bytes, pages_per_task=config.PARSE_PAGES_PER_TASK):
+    """
+    Extracts the text of every page. Long PDFs are split into page ranges and
+    extracted in a shared process pool; short ones are not worth the round trip.
+    Returns [{"page": n, "text": str, "scanned": bool}] in page order.
+    """
+    from pypdf import PdfReader
+    page_count = len(PdfReader(io.BytesIO(pdf_bytes)).pages)
+    if page_count < config.VISION_PDF_PARALLEL_MIN_PAGES:
+        extracted = _extract_page_range(pdf_bytes, 0, page_count)
+    else:
+        pool = _get_extract_pool()
+        futures = [pool.submit(_extract_page_range, pdf_bytes, start, start + pages_per_task)
+                   for start in range(0, page_count, pages_per_task)]
+        extracted = [page for future in futures for page in future.result()]
+
+    return [{"page": page_no, "text": text.strip(),
+             "scanned": len(text.strip()) < config.VISION_PDF_MIN_TEXT_CHARS}
+            for page_no, text in extracted]
+
+@metrics.span("vision_pdf_prepass")
+def prepare_pdf_for_vision(pdf_bytes):
+    """
+    Turns a PDF menu into a compact request for the vision model:
+    the extracted text of text pages, plus images only for scanned pages.
+    Scanned pages contribute their embedded images; if those can't be read, or a page
+    has neither text nor images (e.g. a menu drawn as vector outlines), the pages are
+    sent as a small PDF containing just them.
+    Returns a list of request parts (strings and {"mime_type", "data"} dicts).
+    """
+    from pypdf import PdfReader, PdfWriter
+    pages = extract_pdf_pages(pdf_bytes)
+    reader = PdfReader(io.BytesIO(pdf_bytes))
+
+    text_sections, image_parts, fallback_pages = [], [], []
+    seen_images = set()  # Logos/backgrounds repeated on every page are sent once
+    for page in pages:
+        if not page["scanned"]:
+            text_sections.append(f"--- Page {page['page'] + 1} ---\n{page['text']}")
+            continue
+        try:
+            images = [{"mime_type": IMAGE_MIME_TYPES[os.path.splitext(image.name)[1].lower()], "data": image.data}
+                      for image in reader.pages[page["page"]].images]
+        except Exception:
+            images = None  # Unsupported image encoding: send the page itself
+        if not images:
+            # No text and no images: possibly vector-drawn text only the page itself shows
+            fallback_pages.append(page["page"])
+        else:
+            for image in images:
+                digest = hashlib.sha256(image["data"]).hexdigest()
+                if digest not in seen_images:
+                    seen_images.add(digest)
+                    image_parts.append(image)
+
+    parts = []
+    if text_sections:
+        menu_text = "\n\n".join(text_sections)[:config.VISION_PDF_MAX_CHARS]
+        parts.append(f"MENU TEXT (extracted from the PDF, page by page):\n{menu_text}")
+    parts.extend(image_parts)
+    if fallback_pages:
+        writer = PdfWriter()
+        for page_no in fallback_pages:
+            writer.add_page(reader.pages[page_no])
+        output = io.BytesIO()
+        writer.write(output)
+        parts.append({"mime_type": "application/pdf", "data": output.getvalue()})
+    return parts
@@ -0,0 +1,179 @@
+import json
+import math
+import mmap
+import os
+import faiss
+import numpy as np
+from langchain_community.docstore.base import Docstore
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+import config
+
+# ==========================================
+# ON-DISK VECTOR STORE (FAISS index + memory-mapped chunk store)
+# ==========================================
+# faiss_index/
+#   index.faiss         exact flat index: the source of truth for incremental ingest and recall checks
+#   serving.faiss       approximate index built from it (only when FAISS_INDEX_TYPE is not "flat")
+#   chunks.jsonl        one JSON record per chunk ({"page_content", "metadata"}), in index row order
+#   chunks.offsets.npy  byte offset of every record (+ the end), so row i is one slice of the file
+#   chunks.ids          docstore ID of every row, one per line
+# Apps map the index and the chunk files read-only, so worker processes share the same pages.
+
+INDEX_FILE = "index.faiss"
+SERVING_INDEX_FILE = "serving.faiss"
+CHUNKS_FILE = "chunks.jsonl"
+CHUNK_OFFSETS_FILE = "chunks.offsets.npy"
+CHUNK_IDS_FILE = "chunks.ids"
+LEGACY_DOCSTORE_FILE = "index.pkl"  # LangChain's pickled docstore, written before the chunk store existed
+
+INDEX_TYPES = ("flat", "ivf", "hnsw", "pq", "fp16")
+
+
+def has_chunk_store(directory):
+    return os.path.exists(os.path.join(directory, CHUNK_OFFSETS_FILE))
+
+
+class ChunkStore(Docstore):
+    """Read-only docstore over the memory-mapped chunk files."""
+    def __init__(self, directory):
+        with open(os.path.join(directory, CHUNK_IDS_FILE), "r", encoding="utf-8") as f:
+            self.ids = f.read().split("\n") if os.path.getsize(f.name) else []
+        self._rows = {doc_id: row for row, doc_id in enumerate(self.ids)}
+        self._offsets = np.load(os.path.join(directory, CHUNK_OFFSETS_FILE), mmap_mode="r")
+        with open(os.path.join(directory, CHUNKS_FILE), "rb") as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self._offsets[-1] else b""
+
+    def __len__(self):
+        return len(self.ids)
+
+    def document(self, row):
+        record = json.loads(self._data[int(self._offsets[row]):int(self._offsets[row + 1])])
+        return Document(id=self.ids[row], page_content=record["page_content"], metadata=record["metadata"])
+
+    def search(self, search):
+        row = self._rows.get(search)
+        if row is None:
+            return f"ID {search} not found."
+        return self.document(row)
+
+    def add(self, texts):
+        raise NotImplementedError("ChunkStore is read-only; ingest.py rewrites it.")
+
+    def delete(self, ids):
+        raise NotImplementedError("ChunkStore is read-only; ingest.py rewrites it.")
+
+
+def write_chunk_store(directory, ids, documents):
+    """Writes the chunk files for `documents` (in FAISS row order)."""
+    offsets = [0]
+    with open(os.path.join(directory, CHUNKS_FILE), "wb") as f:
+        for doc in documents:
+            record = json.dumps({"page_content": doc.page_content, "metadata": doc.metadata}, ensure_ascii=False)
+            offsets.append(offsets[-1] + f.write(record.encode("utf-8") + b"\n"))
+    np.save(os.path.join(directory, CHUNK_OFFSETS_FILE), np.array(offsets, dtype=np.uint64))
+    with open(os.path.join(directory, CHUNK_IDS_FILE), "w", encoding="utf-8") as f:
+        f.write("\n".join(ids))
+
+
+# ==========================================
+# INDEX TYPES
+# ==========================================
+def _factory_string(index_type, n_vectors, dimensions):
+    """faiss.index_factory description for `index_type`, with sizes clamped to the number of vectors."""
+    # k-means wants ~39 training points per centroid
+    nlist = max(1, min(config.FAISS_IVF_NLIST, n_vectors // 39))
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "ivf":
+        return f"IVF{nlist},Flat"
+    if index_type == "hnsw":
+        return f"HNSW{config.FAISS_HNSW_M}"
+    if index_type == "pq":
+        m = config.FAISS_PQ_M
+        if dimensions % m:
+            raise ValueError(f"FAISS_PQ_M ({m}) must divide the embedding size ({dimensions}).")
+        nbits = max(4, min(8, int(math.log2(max(1, n_vectors // 39)))))
+        return f"IVF{nlist},PQ{m}x{nbits}"
+    if index_type == "fp16":
+        return "SQfp16"
+    raise ValueError(f"Unknown index type '{index_type}' (choose from {', '.join(INDEX_TYPES)}).")
+
+
+def tune_index(index):
+    """Applies the query-time settings (IVF nprobe, HNSW efSearch) from config."""
+    params = faiss.ParameterSpace()
+    for name, value in (("nprobe", config.FAISS_IVF_NPROBE), ("efSearch", config.FAISS_HNSW_EF_SEARCH)):
+        try:
+            params.set_index_parameter(index, name, value)
+        except RuntimeError:
+            pass  # Not a parameter of this index type
+    return index
+
+
+def build_index(vectors, index_type):
+    """Builds (and trains) an index of `index_type` over a float32 matrix of vectors."""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    index = faiss.index_factory(vectors.shape[1], _factory_string(index_type, len(vectors), vectors.shape[1]))
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    return tune_index(index)
+
+
+def read_index(path, mmap_index=True):
+    """Reads an index file, memory-mapped (read-only, shared between processes) when supported."""
+    if mmap_index:
+        flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+        try:
+            return faiss.read_index(path, flag | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            pass  # This index type cannot be mapped: read it into memory
+    return faiss.read_index(path)
+
+
+# ==========================================
+# SAVE / LOAD
+# ==========================================
+def save(vector_store, directory, index_type=config.FAISS_INDEX_TYPE):
+    """Writes a LangChain FAISS store (flat index + in-memory docstore) in the on-disk format above."""
+    os.makedirs(directory, exist_ok=True)
+    faiss.write_index(vector_store.index, os.path.join(directory, INDEX_FILE))
+    ids = [vector_store.index_to_docstore_id[row] for row in range(vector_store.index.ntotal)]
+    write_chunk_store(directory, ids, (vector_store.docstore.search(doc_id) for doc_id in ids))
+    if index_type != "flat":
+        vectors = vector_store.index.reconstruct_n(0, vector_store.index.ntotal)
+        faiss.write_index(build_index(vectors, index_type), os.path.join(directory, SERVING_INDEX_FILE))
+
+
+def stale_files(index_type):
+    """Files a save with `index_type` does not write, to be removed from the live directory."""
+    return [LEGACY_DOCSTORE_FILE] + ([SERVING_INDEX_FILE] if index_type == "flat" else [])
+
+
+def load(directory, embeddings, mmap_index=True):
+    """
+    Loads the store for serving: the approximate index if one was built (else the flat one)
+    and the chunk store, both memory-mapped. Indexes from before the chunk store load via pickle.
+    """
+    if not has_chunk_store(directory):
+        # Allow dangerous deserialization is required for local files created by us
+        return FAISS.load_local(directory, embeddings, allow_dangerous_deserialization=True)
+
+    serving_path = os.path.join(directory, SERVING_INDEX_FILE)
+    path = serving_path if os.path.exists(serving_path) else os.path.join(directory, INDEX_FILE)
+    index = tune_index(read_index(path, mmap_index))
+    docstore = ChunkStore(directory)
+    return FAISS(embeddings, index, docstore, dict(enumerate(docstore.ids)))
+
+
+def load_for_update(directory, embeddings):
+    """Loads the exact flat index and an in-memory docstore, for ingest.py to add and delete chunks."""
+    if not has_chunk_store(directory):
+        return FAISS.load_local(directory, embeddings, allow_dangerous_deserialization=True)
+
+    index = faiss.read_index(os.path.join(directory, INDEX_FILE))
+    chunks = ChunkStore(directory)
+    docstore = InMemoryDocstore({doc_id: chunks.document(row) for row, doc_id in enumerate(chunks.ids)})
+    return FAISS(embeddings, index, docstore, dict(enumerate(chunks.ids)))